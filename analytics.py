@@ -0,0 +1,247 @@
+"""Streaming activity analytics over the map frames of a session.
+
+Each map frame is folded into running accumulators as it arrives: per-pixel change
+counts, an exponential moving average of the map and per-pixel occupancy counts of the
+team marker colors. Only the accumulators and the previous frame are kept, so a session
+of any length is summarized in constant memory. The results are heatmap PNGs and a
+per-frame statistics CSV in the session folder.
+
+The app updates the analytics live during a session. Existing sessions are analyzed with:
+
+    python analytics.py <session folder> [--output <folder>]
+"""
+
+import os
+import csv
+import sys
+import time
+import logging
+import argparse
+import configparser
+
+import cv2
+import numpy as np
+from PIL import Image
+
+from storage import PACKED_FILENAME, open_frame, open_packed
+from session_index import load_index, legacy_records, interpolate_times, frame_source
+
+
+STATS_FILENAME = 'analytics.csv'
+ACTIVITY_HEATMAP = 'heatmap_activity.png'
+AVERAGE_MAP = 'map_average.png'
+
+# Nominal RGB colors of the team markers on the map
+TEAM_COLORS = {
+    'blue': (40, 90, 230),
+    'red': (220, 50, 40),
+}
+
+
+def parse_team_colors(text):
+    """Parse "blue=40,90,230; red=220,50,40" into {team: (r, g, b)}."""
+    colors = {}
+    for item in text.split(';'):
+        if not item.strip():
+            continue
+        team, rgb = item.split('=')
+        colors[team.strip()] = tuple(int(value) for value in rgb.split(','))
+    return colors
+
+
+def load_analytics_settings(defaults):
+    """Read the analytics options of a config [DEFAULT] section."""
+    team_colors = defaults.get('analytics_team_colors', '').strip()
+    return {
+        'team_colors': parse_team_colors(team_colors) if team_colors else TEAM_COLORS,
+        'color_tolerance': defaults.getint('analytics_color_tolerance', 40),
+        'change_threshold': defaults.getint('analytics_change_threshold', 12),
+        'ema_alpha': defaults.getfloat('analytics_ema_alpha', 0.05),
+    }
+
+
+def render_heatmap(counts, background=None):
+    """Color a count array (log scale) over a dimmed grayscale background, return an RGB array."""
+    peak = counts.max()
+    scaled = np.log1p(counts.astype(np.float32)) / np.log1p(peak) if peak else np.zeros(counts.shape, np.float32)
+    heat = cv2.cvtColor(cv2.applyColorMap((scaled * 255).astype(np.uint8), cv2.COLORMAP_INFERNO), cv2.COLOR_BGR2RGB)
+    if background is None:
+        return heat
+    gray = cv2.cvtColor(background.astype(np.uint8), cv2.COLOR_RGB2GRAY)
+    under = cv2.cvtColor(gray // 2, cv2.COLOR_GRAY2RGB)
+    # Pixels that never changed show the map, the others the heat
+    weight = np.clip(scaled * 2, 0, 1)[:, :, None]
+    return (under * (1 - weight) + heat * weight).astype(np.uint8)
+
+
+class SessionAnalytics:
+    """Fold map frames into activity accumulators, one frame at a time.
+
+    A pixel counts as changed when its gray level moved by more than `change_threshold`
+    since the previous frame, and as occupied by a team when every channel is within
+    `color_tolerance` of the team color. Frames of another size are resized to the first one.
+    With `stats_path`, one CSV row of per-frame statistics is written per frame.
+    """
+
+    def __init__(self, stats_path=None, team_colors=TEAM_COLORS, color_tolerance=40, change_threshold=12, ema_alpha=0.05):
+        self.team_colors = team_colors
+        self.color_tolerance = color_tolerance
+        self.change_threshold = change_threshold
+        self.ema_alpha = ema_alpha
+        self.shape = None
+        self.previous = None  # Gray levels of the previous frame
+        self.change_counts = None
+        self.ema = None
+        self.occupancy = {}
+        self.color_bounds = {
+            team: (np.clip(np.array(rgb) - color_tolerance, 0, 255).astype(np.uint8),
+                   np.clip(np.array(rgb) + color_tolerance, 0, 255).astype(np.uint8))
+            for team, rgb in team_colors.items()
+        }
+        self.frames = 0
+        self.seconds = 0.0
+        self.stats_file = None
+        self.stats_writer = None
+        if stats_path is not None:
+            self.stats_file = open(stats_path, 'w', newline='')
+            fields = ['frame', 'match_time', 'changed_fraction', 'ema_deviation'] + [f"{team}_fraction" for team in team_colors]
+            self.stats_writer = csv.DictWriter(self.stats_file, fields)
+            self.stats_writer.writeheader()
+
+    def _allocate(self, shape):
+        self.shape = shape
+        self.change_counts = np.zeros(shape[:2], dtype=np.uint32)
+        self.ema = np.zeros(shape, dtype=np.float32)
+        self.occupancy = {team: np.zeros(shape[:2], dtype=np.uint32) for team in self.team_colors}
+
+    def add(self, frame, frame_index=None, match_time=None):
+        """Fold an RGB uint8 frame into the accumulators, return its statistics row."""
+        start = time.perf_counter()
+        frame = np.asarray(frame)
+        if self.shape is None:
+            self._allocate(frame.shape)
+        elif frame.shape != self.shape:
+            frame = cv2.resize(frame, (self.shape[1], self.shape[0]), interpolation=cv2.INTER_AREA)
+        pixels = frame.shape[0] * frame.shape[1]
+        row = {'frame': frame_index, 'match_time': match_time}
+
+        gray = cv2.cvtColor(frame, cv2.COLOR_RGB2GRAY)
+        if self.previous is None:
+            row['changed_fraction'] = None
+        else:
+            changed = cv2.absdiff(gray, self.previous) > self.change_threshold
+            self.change_counts += changed
+            row['changed_fraction'] = round(np.count_nonzero(changed) / pixels, 5)
+        self.previous = gray
+
+        if self.frames == 0:
+            self.ema[...] = frame
+            row['ema_deviation'] = None
+        else:
+            # Mean distance to the recent average of the map, before this frame is folded in
+            # (the average rounded to whole levels, which is much cheaper than a float difference)
+            deviation = cv2.mean(cv2.absdiff(frame, cv2.convertScaleAbs(self.ema)))
+            row['ema_deviation'] = round(sum(deviation[:3]) / 3, 3)
+            cv2.accumulateWeighted(frame, self.ema, self.ema_alpha)
+
+        for team, (lower, upper) in self.color_bounds.items():
+            mask = cv2.inRange(frame, lower, upper)
+            self.occupancy[team] += mask > 0
+            row[f"{team}_fraction"] = round(cv2.countNonZero(mask) / pixels, 5)
+
+        self.frames += 1
+        self.seconds += time.perf_counter() - start
+        if self.stats_writer is not None:
+            self.stats_writer.writerow(row)
+        return row
+
+    def write_heatmaps(self, folder):
+        """Write the activity and team occupancy heatmaps and the average map, return their paths."""
+        if self.shape is None:
+            return []
+        background = self.ema
+        outputs = {ACTIVITY_HEATMAP: render_heatmap(self.change_counts, background), AVERAGE_MAP: background.astype(np.uint8)}
+        for team, counts in self.occupancy.items():
+            outputs[f"heatmap_{team}.png"] = render_heatmap(counts, background)
+        paths = []
+        for name, array in outputs.items():
+            path = os.path.join(folder, name)
+            Image.fromarray(array).save(path, compress_level=6)
+            paths.append(path)
+        logging.info(f"Saved analytics heatmaps of {self.frames} frames to {folder}")
+        return paths
+
+    def close(self):
+        if self.stats_file is not None:
+            self.stats_file.close()
+            self.stats_file = None
+            self.stats_writer = None
+
+    def stats(self):
+        return {
+            'frames': self.frames,
+            'seconds': self.seconds,
+            'changed_pixels_max': int(self.change_counts.max()) if self.change_counts is not None else 0,
+        }
+
+
+def _session_frames(session_folder):
+    """Yield (frame index, match time, RGB array) of a session in capture order, one frame at a time."""
+    records = load_index(session_folder)
+    if records is None:
+        records = legacy_records(session_folder)
+    records = [record for record in interpolate_times(records) if record.get('file')]
+    packed = None
+    if any(record['file'] == PACKED_FILENAME for record in records):
+        packed = open_packed(session_folder)
+        # Row of every frame in the container, its pixels are read straight from the memory map
+        rows = {int(frame): row for row, frame in enumerate(packed['frame'])}
+    for record in records:
+        if record['file'] == PACKED_FILENAME:
+            row = rows.get(record['frame'])
+            if row is None:
+                continue
+            pixels = packed[row]['pixels']
+        else:
+            try:
+                pixels = np.asarray(open_frame(frame_source(session_folder, record)))
+            except Exception as e:
+                logging.warning(f"Skipping unreadable frame {record['file']}: {e}")
+                continue
+        yield record['frame'], record.get('match_time'), pixels
+
+
+def analyze_session(session_folder, output_folder=None, **options):
+    """Analyze the frames of an existing session, return the written paths and the summary."""
+    output_folder = output_folder or session_folder
+    os.makedirs(output_folder, exist_ok=True)
+    analytics = SessionAnalytics(os.path.join(output_folder, STATS_FILENAME), **options)
+    try:
+        for frame_index, match_time, pixels in _session_frames(session_folder):
+            analytics.add(pixels, frame_index, match_time)
+    finally:
+        analytics.close()
+    paths = analytics.write_heatmaps(output_folder)
+    return paths + [os.path.join(output_folder, STATS_FILENAME)], analytics.stats()
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Write the activity heatmaps and frame statistics of a session.")
+    parser.add_argument('session_folder')
+    parser.add_argument('--output', help="Folder of the results, the session folder by default")
+    parser.add_argument('--config', default='config.ini', help="Config file with the analytics settings")
+    args = parser.parse_args(argv[1:])
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    config = configparser.ConfigParser()
+    config.read(args.config)
+    start = time.perf_counter()
+    paths, stats = analyze_session(args.session_folder, args.output, **load_analytics_settings(config['DEFAULT']))
+    print(f"{stats['frames']} frames analyzed in {time.perf_counter() - start:.1f} s")
+    for path in paths:
+        print(path)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -0,0 +1,296 @@
+"""Benchmark the capture hot path and GIF generation on synthetic HUD frames.
+
+Every stage is timed separately at each resolution: region capture, preprocess_image,
+chat detection, timer reading, map detection and frame encoding, then generate_gif's
+write_gif on sessions of 100, 500 and 2000 frames. No game, display or Tesseract is
+needed; the OCR fallbacks are replaced by the known values of the synthetic frames.
+
+Results are written as JSON (by default to benchmarks/results/<date>_<commit>.json), and
+`--compare <previous results>` prints the change of every stage against an earlier run:
+
+    python benchmarks/run_benchmarks.py [--resolutions 1080p 1440p 4k] [--gif-frames 100 500 2000]
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import platform
+import argparse
+import tempfile
+import subprocess
+
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from synthetic_hud import RESOLUTIONS, CHAT_STATES, SyntheticHud  # noqa: E402
+from capture import CaptureBackend  # noqa: E402
+from hud import preprocess_image  # noqa: E402
+from detection import ChatStateDetector, MapVisibilityDetector  # noqa: E402
+from timer_reader import TimerReader  # noqa: E402
+from storage import encode_image  # noqa: E402
+from gif_export import annotate_frame, compare_with_pillow, write_gif  # noqa: E402
+
+BENCHMARK_FOLDER = os.path.dirname(os.path.abspath(__file__))
+
+
+class SyntheticCaptureBackend(CaptureBackend):
+    """Capture backend cropping the regions out of synthetic frames."""
+
+    name = 'synthetic'
+
+    def __init__(self, hud):
+        super().__init__()
+        self.hud = hud
+        self.frame = hud.render()
+
+    def screen_size(self):
+        return self.hud.width, self.hud.height
+
+    def _grab_into(self, box, out):
+        left, top, right, bottom = box
+        out[:] = self.frame[top:bottom, left:right]
+
+
+def summarize(samples):
+    """Latency statistics in milliseconds of a list of durations in seconds."""
+    samples = np.array(samples) * 1000
+    return {
+        'n': len(samples),
+        'mean_ms': float(samples.mean()),
+        'p50_ms': float(np.percentile(samples, 50)),
+        'p95_ms': float(np.percentile(samples, 95)),
+        'max_ms': float(samples.max()),
+    }
+
+
+def time_calls(function, inputs):
+    """Call `function` on every input and return the latency statistics."""
+    samples = []
+    for value in inputs:
+        start = time.perf_counter()
+        function(value)
+        samples.append(time.perf_counter() - start)
+    return summarize(samples)
+
+
+def match_time(seconds):
+    return f"{seconds // 60:02d}_{seconds % 60:02d}"
+
+
+def benchmark_resolution(resolution, iterations, work_folder):
+    """Time every per-tick stage at one resolution."""
+    hud = SyntheticHud(resolution)
+    rng = np.random.default_rng(1)
+    # Distinct times, so the timer reader cache does not hide the glyph reader
+    times = rng.choice(100 * 60, iterations, replace=False)
+    chat_states = [CHAT_STATES[i % len(CHAT_STATES)] for i in range(iterations)]
+    frames = [hud.render(int(seconds), chat_state=state, step=i) for i, (seconds, state) in enumerate(zip(times, chat_states))]
+    results = {}
+
+    backend = SyntheticCaptureBackend(hud)
+    hud_regions = {name: hud.regions[name] for name in ('chat', 'time', 'map_border')}
+
+    def capture(frame):
+        backend.frame = frame
+        backend.grab(hud_regions)
+        backend.grab({'map': hud.regions['map']})
+
+    results['capture_crop'] = time_calls(capture, frames)
+
+    time_crops = [hud.crop(frame, 'time').copy() for frame in frames]
+    chat_crops = [hud.crop(frame, 'chat').copy() for frame in frames]
+    map_crops = [hud.crop(frame, 'map').copy() for frame in frames[:min(iterations, 20)]]
+    results['preprocess_image'] = time_calls(preprocess_image, time_crops)
+
+    # The OCR fallbacks answer with the truth, so both detectors learn like they do live
+    truth = {}
+    chat_detector = ChatStateDetector(
+        os.path.join(work_folder, f"chat_{resolution[0]}x{resolution[1]}"), fallback=lambda crop: truth['chat']
+    )
+    chat_results = []
+
+    def detect_chat(i):
+        truth['chat'] = chat_states[i]
+        chat_results.append(chat_detector.detect(chat_crops[i]))
+
+    results['chat_detection'] = time_calls(detect_chat, range(iterations))
+    results['chat_detection']['accuracy'] = sum(r.state == s for r, s in zip(chat_results, chat_states)) / iterations
+    results['chat_detection']['fallback_rate'] = sum(r.source == 'ocr' for r in chat_results) / iterations
+    # The fallback answers with the truth, so only the answers of the detector itself measure its accuracy
+    results['chat_detection']['detector_accuracy'] = sum(
+        r.source != 'ocr' and r.state == s for r, s in zip(chat_results, chat_states)
+    ) / iterations
+
+    timer_reader = TimerReader(
+        os.path.join(work_folder, 'timer'), resolution, fallback=lambda crop: truth['time']
+    )
+    readings = []
+
+    def read_time(i):
+        truth['time'] = match_time(int(times[i]))
+        readings.append(timer_reader.read(time_crops[i]))
+
+    results['time_extraction'] = time_calls(read_time, range(iterations))
+    results['time_extraction']['accuracy'] = sum(r.text == match_time(int(t)) for r, t in zip(readings, times)) / iterations
+    results['time_extraction']['fallback_rate'] = sum(r.source == 'ocr' for r in readings) / iterations
+    results['time_extraction']['detector_accuracy'] = sum(
+        r.source != 'ocr' and r.text == match_time(int(t)) for r, t in zip(readings, times)
+    ) / iterations
+
+    map_detector = MapVisibilityDetector()
+    open_border = hud.crop(frames[0], 'map_border').copy()
+    closed_border = hud.crop(hud.render(map_open=False), 'map_border').copy()
+    for _ in range(map_detector.min_samples):
+        map_detector.learn(open_border, True)
+        map_detector.learn(closed_border, False)
+    borders = [open_border, closed_border] * (iterations // 2)
+    results['map_detection'] = time_calls(map_detector.classify, borders)
+
+    for name, codec, level in (('png_save', 'png', 1), ('png_save_level6', 'png', 6), ('webp_save', 'webp', 1), ('raw_save', 'raw', 1)):
+        sizes = []
+
+        def save(crop):
+            data = encode_image(crop, codec, level)
+            with open(os.path.join(work_folder, 'frame'), 'wb') as f:
+                f.write(data)
+            sizes.append(len(data))
+
+        results[name] = time_calls(save, map_crops)
+        results[name]['mean_bytes'] = int(np.mean(sizes))
+    return results
+
+
+def benchmark_gif(frame_counts, resolution, work_folder, workers):
+    """Time write_gif on sessions of synthetic map frames, serially and with a process pool."""
+    hud = SyntheticHud(resolution)
+    session_folder = os.path.join(work_folder, 'gif_session')
+    os.makedirs(session_folder, exist_ok=True)
+    frames = []
+    results = {}
+    for count in sorted(frame_counts):
+        # Frames of the smaller sessions are reused by the larger ones
+        for i in range(len(frames), count):
+            path = os.path.join(session_folder, f"map_{i}.png")
+            with open(path, 'wb') as f:
+                f.write(encode_image(hud.crop(hud.render(i * 20, step=i), 'map'), 'png', 0))
+            frames.append((path, match_time(i * 20).replace('_', ':')))
+        results[str(count)] = {}
+        for worker_count in sorted({1, workers}):
+            gif_path = os.path.join(work_folder, 'session.gif')
+            start = time.perf_counter()
+            write_gif(frames[:count], gif_path, 500, workers=worker_count)
+            results[str(count)][f"workers_{worker_count}"] = {
+                'seconds': time.perf_counter() - start,
+                'bytes': os.path.getsize(gif_path),
+            }
+    return results
+
+
+def benchmark_pillow(frame_count, resolution):
+    """Compare the streaming delta GIF writer with Pillow's save_all on annotated synthetic map frames."""
+    hud = SyntheticHud(resolution)
+    # Pillow needs every frame in memory, so this runs on a short session only
+    images = [
+        annotate_frame(Image.fromarray(hud.crop(hud.render(i * 20, step=i), 'map')), match_time(i * 20).replace('_', ':'))
+        for i in range(frame_count)
+    ]
+    return compare_with_pillow(images, 500)
+
+
+def current_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=BENCHMARK_FOLDER,
+            stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, check=True
+        ).stdout.decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare_results(previous, current):
+    """Print the mean latency change of every stage between two result files."""
+    for resolution, stages in current['resolutions'].items():
+        for stage, stats in stages.items():
+            before = previous.get('resolutions', {}).get(resolution, {}).get(stage)
+            if before:
+                change = stats['mean_ms'] / before['mean_ms'] - 1 if before['mean_ms'] else 0.0
+                print(f"{resolution:>6} {stage:<18} {before['mean_ms']:9.3f} ms -> {stats['mean_ms']:9.3f} ms ({change:+.0%})")
+    for count, runs in current['gif'].items():
+        for name, stats in runs.items():
+            before = previous.get('gif', {}).get(count, {}).get(name)
+            if before:
+                change = stats['seconds'] / before['seconds'] - 1
+                print(f"gif {count:>5} frames {name:<10} {before['seconds']:8.2f} s -> {stats['seconds']:8.2f} s ({change:+.0%})")
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Benchmark the capture hot path on synthetic HUD frames.")
+    parser.add_argument('--resolutions', nargs='+', default=list(RESOLUTIONS), choices=list(RESOLUTIONS))
+    parser.add_argument('--iterations', type=int, default=100, help="Frames timed per stage and resolution")
+    parser.add_argument('--gif-frames', type=int, nargs='*', default=[100, 500, 2000], help="Session lengths for write_gif")
+    parser.add_argument('--gif-resolution', default='1080p', choices=list(RESOLUTIONS))
+    parser.add_argument('--workers', type=int, default=0, help="Processes of the parallel GIF run, 0 uses every core")
+    parser.add_argument('--pillow-frames', type=int, default=50, help="Frames of the comparison with Pillow's save_all, 0 skips it")
+    parser.add_argument('--output', help="Results file, benchmarks/results/<date>_<commit>.json by default")
+    parser.add_argument('--compare', help="Earlier results file to compare with")
+    args = parser.parse_args(argv[1:])
+
+    commit = current_commit()
+    report = {
+        'commit': commit,
+        'timestamp': time.strftime("%Y-%m-%dT%H:%M:%S"),
+        'platform': platform.platform(),
+        'python': platform.python_version(),
+        'cpu_count': os.cpu_count(),
+        'iterations': args.iterations,
+        'resolutions': {},
+        'gif': {},
+        'gif_vs_pillow': None,
+    }
+    work_folder = tempfile.mkdtemp(prefix='silica_bench_')
+    try:
+        for name in args.resolutions:
+            print(f"Benchmarking {name}...", flush=True)
+            report['resolutions'][name] = benchmark_resolution(RESOLUTIONS[name], args.iterations, work_folder)
+            for stage, stats in report['resolutions'][name].items():
+                print(f"  {stage:<18} mean {stats['mean_ms']:9.3f} ms   p95 {stats['p95_ms']:9.3f} ms")
+                if 'detector_accuracy' in stats:
+                    print(f"  {'':<18} accuracy {stats['accuracy']:.2f}, without the fallback "
+                          f"{stats['detector_accuracy']:.2f}, fallback rate {stats['fallback_rate']:.2f}")
+        if args.gif_frames:
+            print(f"Benchmarking GIF generation ({args.gif_resolution})...", flush=True)
+            workers = args.workers or os.cpu_count() or 1
+            report['gif'] = benchmark_gif(args.gif_frames, RESOLUTIONS[args.gif_resolution], work_folder, workers)
+            for count, runs in report['gif'].items():
+                for run, stats in runs.items():
+                    print(f"  {count:>5} frames {run:<10} {stats['seconds']:8.2f} s   {stats['bytes'] / 1e6:8.2f} MB")
+        if args.pillow_frames:
+            print(f"Comparing with Pillow's save_all ({args.pillow_frames} frames, {args.gif_resolution})...", flush=True)
+            report['gif_vs_pillow'] = comparison = benchmark_pillow(args.pillow_frames, RESOLUTIONS[args.gif_resolution])
+            for run in ('pillow', 'streaming_delta'):
+                stats = comparison[run]
+                print(f"  {run:<16} {stats['seconds']:8.2f} s   {stats['bytes'] / 1e6:8.2f} MB")
+            print(f"  size {comparison['size_ratio']:.0%} and time {comparison['time_ratio']:.0%} of Pillow")
+    finally:
+        shutil.rmtree(work_folder, ignore_errors=True)
+
+    output = args.output or os.path.join(
+        BENCHMARK_FOLDER, 'results', f"{time.strftime('%Y%m%d_%H%M%S')}_{commit or 'unknown'}.json"
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare_results(json.load(f), report)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
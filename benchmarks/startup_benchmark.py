@@ -0,0 +1,107 @@
+"""Benchmark the import time of the app and tool modules, and check that importing has no side effects.
+
+Every module is imported in a fresh interpreter with `python -X importtime`, from an empty
+working folder, so no module is cached and a log file created at import would show up.
+Importing must stay under the time budget and must not start threads, add logging
+handlers or create files; the script exits with 1 otherwise, so it can gate a change:
+
+    python benchmarks/startup_benchmark.py [--budget-ms 1000] [--repeat 5] [--modules silica_session_capture replay]
+"""
+
+import os
+import sys
+import json
+import argparse
+import tempfile
+import statistics
+import subprocess
+
+REPO_FOLDER = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# The GUI and the command line tools, which are imported without a display for reprocessing and tests
+MODULES = ('silica_session_capture', 'replay', 'analytics', 'calibration')
+
+# Run in the child interpreter: import the module, report what the import changed
+PROBE = """
+import os, sys, json, logging, threading
+sys.path.insert(0, {repo!r})
+threads = threading.active_count()
+handlers = len(logging.getLogger().handlers)
+import {module}
+print(json.dumps({{
+    'threads': threading.active_count() - threads,
+    'handlers': len(logging.getLogger().handlers) - handlers,
+    'files': sorted(os.listdir('.')),
+}}))
+"""
+
+
+def import_module(module, work_folder):
+    """Import `module` in a fresh interpreter, return (import time in ms, side effects)."""
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', PROBE.format(repo=REPO_FOLDER, module=module)],
+        cwd=work_folder, stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True
+    )
+    # The cumulative time of the module itself, in microseconds: "import time: self | cumulative | name"
+    cumulative = None
+    for line in result.stderr.decode().splitlines():
+        fields = line.split('|')
+        if len(fields) == 3 and fields[2].strip() == module:
+            cumulative = int(fields[1])
+    return cumulative / 1000, json.loads(result.stdout.decode().splitlines()[-1])
+
+
+def benchmark_module(module, repeat):
+    """Median import time of a module over `repeat` fresh interpreters, and the side effects of one import."""
+    times = []
+    with tempfile.TemporaryDirectory(prefix='silica_startup_') as work_folder:
+        for _ in range(repeat):
+            milliseconds, effects = import_module(module, work_folder)
+            times.append(milliseconds)
+    return {'median_ms': statistics.median(times), 'max_ms': max(times), 'side_effects': effects}
+
+
+def problems(module, stats, budget_ms):
+    found = []
+    if stats['median_ms'] > budget_ms:
+        found.append(f"{module}: import takes {stats['median_ms']:.0f} ms, over the {budget_ms:.0f} ms budget")
+    effects = stats['side_effects']
+    if effects['threads']:
+        found.append(f"{module}: import starts {effects['threads']} thread(s)")
+    if effects['handlers']:
+        found.append(f"{module}: import adds {effects['handlers']} logging handler(s)")
+    if effects['files']:
+        found.append(f"{module}: import creates {', '.join(effects['files'])}")
+    return found
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Check the import time and import side effects of the app modules.")
+    parser.add_argument('--modules', nargs='+', default=list(MODULES))
+    parser.add_argument('--budget-ms', type=float, default=1000, help="Largest median import time of a module")
+    parser.add_argument('--repeat', type=int, default=5, help="Fresh interpreters timed per module")
+    parser.add_argument('--output', help="Also write the results to this JSON file")
+    args = parser.parse_args(argv[1:])
+
+    report = {}
+    failures = []
+    for module in args.modules:
+        try:
+            report[module] = stats = benchmark_module(module, args.repeat)
+        except subprocess.CalledProcessError as e:
+            failures.append(f"{module}: import failed:\n{e.stderr.decode().strip().splitlines()[-1]}")
+            continue
+        print(f"{module:<24} median {stats['median_ms']:7.0f} ms   max {stats['max_ms']:7.0f} ms")
+        failures += problems(module, stats, args.budget_ms)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'budget_ms': args.budget_ms, 'modules': report}, f, indent=2)
+        print(f"Results written to {args.output}")
+    for failure in failures:
+        print(f"FAIL {failure}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
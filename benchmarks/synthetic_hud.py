@@ -0,0 +1,88 @@
+"""Synthetic Silica HUD frames, so the capture path can be measured without the game.
+
+Frames have the "CURRENT MATCH MM:SS" timer (with the map open), the chat prompt in its
+"Team", "All" or empty state, and a map with team markers moving between frames, all
+placed with the HUD geometry of `hud.py` at any resolution.
+"""
+
+import os
+import sys
+
+import cv2
+import numpy as np
+from PIL import Image, ImageDraw, ImageFont
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from hud import REFERENCE_WIDTH, REFERENCE_HEIGHT, scaled_regions  # noqa: E402
+
+
+RESOLUTIONS = {
+    '1080p': (1920, 1080),
+    '1440p': (2560, 1440),
+    '4k': (3840, 2160),
+}
+
+CHAT_STATES = (None, 'team', 'all')
+TEAM_COLORS = ((40, 90, 230), (220, 50, 40))  # Blue and red markers
+
+
+def _texture(width, height, rng, cells, low, high):
+    """Smooth random texture, an upscaled grid of random values."""
+    grid = rng.uniform(low, high, (cells, cells, 3)).astype(np.float32)
+    return cv2.resize(grid, (width, height), interpolation=cv2.INTER_CUBIC).clip(0, 255).astype(np.uint8)
+
+
+class SyntheticHud:
+    """Render HUD frames at a (width, height) resolution. Backgrounds are drawn once, per frame only the
+    timer, chat prompt and markers are drawn."""
+
+    def __init__(self, resolution, markers=24, seed=0):
+        self.width, self.height = resolution
+        self.regions = scaled_regions(self.width / REFERENCE_WIDTH, self.height / REFERENCE_HEIGHT)
+        rng = np.random.default_rng(seed)
+
+        # Game view with the map closed, and the same view with the map open over it
+        self.closed = _texture(self.width, self.height, rng, 12, 30, 160)
+        self.opened = self.closed.copy()
+        left, top, right, bottom = self.regions['map']
+        self.map_background = _texture(right - left, bottom - top, rng, 24, 40, 120)
+        self.opened[top:bottom, left:right] = self.map_background
+        border_left, border_top, border_right, border_bottom = self.regions['map_border']
+        self.opened[border_top:border_bottom, border_left:border_right] = (150, 140, 110)
+
+        scale = self.height / REFERENCE_HEIGHT
+        self.time_font = ImageFont.load_default(max(int(26 * scale), 8))
+        self.chat_font = ImageFont.load_default(max(int(16 * scale), 8))
+        self.marker_radius = max(int(6 * scale), 2)
+        map_size = np.array([right - left, bottom - top], dtype=np.float64)
+        self.marker_start = rng.uniform(0, 1, (markers, 2)) * map_size
+        self.marker_velocity = rng.uniform(-0.01, 0.01, (markers, 2)) * map_size
+        self.map_size = map_size
+
+    def _draw_text(self, frame, box, text, font, fill, background):
+        left, top, right, bottom = box
+        label = Image.new('RGB', (right - left, bottom - top), background)
+        _, text_top, _, text_bottom = font.getbbox(text)
+        # Vertically centered, a few pixels from the left edge
+        ImageDraw.Draw(label).text((2, (label.size[1] - text_bottom - text_top) // 2), text, font=font, fill=fill)
+        frame[top:bottom, left:right] = np.asarray(label)
+
+    def render(self, match_seconds=0, chat_state=None, map_open=True, step=0):
+        """Return an RGB frame as a NumPy array."""
+        frame = (self.opened if map_open else self.closed).copy()
+        if map_open:
+            left, top, right, bottom = self.regions['map']
+            positions = (self.marker_start + self.marker_velocity * step) % self.map_size
+            map_view = frame[top:bottom, left:right]
+            for i, (x, y) in enumerate(positions.astype(int)):
+                cv2.circle(map_view, (int(x), int(y)), self.marker_radius, TEAM_COLORS[i % 2], -1)
+            label = f"CURRENT MATCH {match_seconds // 60:02d}:{match_seconds % 60:02d}"
+            self._draw_text(frame, self.regions['time'], label, self.time_font, (235, 235, 235), (20, 20, 24))
+        if chat_state is not None:
+            self._draw_text(frame, self.regions['chat'], chat_state.capitalize(), self.chat_font, (240, 240, 240), (10, 10, 10))
+        return frame
+
+    def crop(self, frame, name):
+        left, top, right, bottom = self.regions[name]
+        return frame[top:bottom, left:right]
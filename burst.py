@@ -0,0 +1,189 @@
+"""Burst capture: the map region at a few Hz into a preallocated in-memory ring buffer.
+
+Burst frames are only copied into the ring, never encoded or written while recording, so
+RAM stays at `seconds * rate` map frames and nothing reaches the disk by default. The
+last seconds are handed over (and saved to the session by the app) on demand, from a
+hotkey or the GUI, or when the map changes a lot between two burst frames.
+"""
+
+import time
+import logging
+import threading
+from collections import namedtuple
+
+import numpy as np
+
+from pipeline import TickScheduler
+
+
+# Frame indices of burst frames start here, so they never collide with tick indices
+BURST_INDEX_BASE = 1000000
+
+# sequence: running number of the burst frame in the session. image: copy of the map pixels.
+BurstFrame = namedtuple('BurstFrame', 'sequence mono_time wall_time image')
+
+
+class BurstBuffer:
+    """Fixed-size ring of RGB frames and their capture times, allocated once."""
+
+    def __init__(self, capacity, shape):
+        self.capacity = max(int(capacity), 1)
+        self.frames = np.zeros((self.capacity,) + tuple(shape), dtype=np.uint8)
+        self.mono_times = np.zeros(self.capacity)
+        self.wall_times = np.zeros(self.capacity)
+        self.count = 0  # Frames written since the start
+        self.lock = threading.Lock()
+
+    @property
+    def nbytes(self):
+        return self.frames.nbytes
+
+    def slot(self):
+        """Array the next frame is written into, the oldest one. Hold `lock` while writing it."""
+        return self.frames[self.count % self.capacity]
+
+    def commit(self, mono_time, wall_time):
+        """Mark the frame written into slot() as captured at these times. Hold `lock`."""
+        position = self.count % self.capacity
+        self.mono_times[position] = mono_time
+        self.wall_times[position] = wall_time
+        self.count += 1
+
+    def since(self, sequence):
+        """Copies of the frames from `sequence` on that are still in the ring, oldest first."""
+        with self.lock:
+            first = max(sequence, self.count - self.capacity, 0)
+            return [
+                BurstFrame(
+                    n, float(self.mono_times[n % self.capacity]), float(self.wall_times[n % self.capacity]),
+                    self.frames[n % self.capacity].copy()
+                )
+                for n in range(first, self.count)
+            ]
+
+
+class BurstRecorder:
+    """Record the map region at `rate` Hz on a background thread while the map is visible.
+
+    `is_map_open(border crop)` decides whether a tick is recorded; only True counts, so
+    nothing is kept while the map is closed or its state is unknown. The change magnitude
+    of a frame is the mean absolute difference of a subsampled green channel with the
+    previous burst frame (0-255); at or above `trigger_threshold` (0 disables it) a flush
+    is triggered, at most once every `trigger_cooldown` seconds. A flush passes the frames
+    not flushed before to `on_flush(frames, reason)`, on the recorder thread.
+    """
+
+    def __init__(self, backend, map_box, border_box, on_flush, rate=2.0, seconds=15.0, is_map_open=None,
+                 trigger_threshold=0.0, trigger_cooldown=5.0, subsample=8):
+        self.backend = backend
+        self.map_box = map_box
+        self.border_box = border_box
+        self.on_flush = on_flush
+        self.rate = min(max(rate, 0.1), 10.0)
+        self.is_map_open = is_map_open
+        self.trigger_threshold = trigger_threshold
+        self.trigger_cooldown = trigger_cooldown
+        self.subsample = max(int(subsample), 1)
+
+        left, top, right, bottom = map_box
+        self.buffer = BurstBuffer(round(seconds * self.rate), (bottom - top, right - left, 3))
+        left, top, right, bottom = border_box
+        self.border = np.zeros((bottom - top, right - left, 3), dtype=np.uint8)
+        self.previous = None  # Subsampled green channel of the previous frame
+        self.flushed = 0      # Sequence of the first frame not flushed yet
+        self.last_trigger = None
+        self.flush_reasons = []
+        self.flush_lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.thread = None
+        self.scheduler = None
+        self.skipped = 0
+        self.triggers = 0
+        self.flushes = 0
+        self.frames_flushed = 0
+        logging.info(
+            f"Burst buffer: {self.buffer.capacity} frames at {self.rate:g} Hz, {self.buffer.nbytes / 1e6:.0f} MB"
+        )
+
+    def start(self):
+        self.scheduler = TickScheduler(1.0 / self.rate)
+        self.scheduler.start()
+        self.thread = threading.Thread(target=self._run, name='burst', daemon=True)
+        self.thread.start()
+
+    def request_flush(self, reason='manual'):
+        """Flush the buffered frames on the recorder thread. Safe to call from any thread."""
+        with self.flush_lock:
+            self.flush_reasons.append(reason)
+
+    def _run(self):
+        while True:
+            tick_time = self.scheduler.wait(self.stop_event)
+            if tick_time is None:
+                break
+            try:
+                self._record(tick_time, time.time())
+            except Exception as e:
+                logging.error(f"Burst capture failed: {e}")
+            with self.flush_lock:
+                reasons, self.flush_reasons = self.flush_reasons, []
+            if reasons:
+                self._flush(reasons[0])
+
+    def _record(self, tick_time, wall_time):
+        self.backend.grab_into(self.border_box, self.border)
+        if self.is_map_open is not None and self.is_map_open(self.border) is not True:
+            self.skipped += 1
+            self.previous = None
+            return
+        with self.buffer.lock:
+            frame = self.buffer.slot()
+            self.backend.grab_into(self.map_box, frame)
+            self.buffer.commit(tick_time, wall_time)
+            current = frame[::self.subsample, ::self.subsample, 1].astype(np.int16)
+        previous, self.previous = self.previous, current
+        if self.trigger_threshold <= 0 or previous is None:
+            return
+        magnitude = float(np.abs(current - previous).mean())
+        if magnitude >= self.trigger_threshold and (
+            self.last_trigger is None or tick_time - self.last_trigger >= self.trigger_cooldown
+        ):
+            self.last_trigger = tick_time
+            self.triggers += 1
+            logging.info(f"Burst triggered by a map change of {magnitude:.1f}.")
+            self.request_flush('change')
+
+    def _flush(self, reason):
+        frames = self.buffer.since(self.flushed)
+        if not frames:
+            logging.info(f"Burst flush ({reason}): no new frames.")
+            return
+        self.flushed = frames[-1].sequence + 1
+        self.flushes += 1
+        self.frames_flushed += len(frames)
+        logging.info(f"Burst flush ({reason}): {len(frames)} frames.")
+        try:
+            self.on_flush(frames, reason)
+        except Exception as e:
+            logging.error(f"Failed to save the burst frames: {e}")
+
+    def stop(self, flush=False):
+        """Stop recording; with `flush`, hand over the frames not flushed yet first."""
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+        with self.flush_lock:
+            reasons, self.flush_reasons = self.flush_reasons, []
+        if reasons or flush:
+            self._flush(reasons[0] if reasons else 'stop')
+
+    def stats(self):
+        return {
+            'frames': self.buffer.count,
+            'capacity': self.buffer.capacity,
+            'skipped': self.skipped,
+            'triggers': self.triggers,
+            'flushes': self.flushes,
+            'frames_flushed': self.frames_flushed,
+        }
@@ -0,0 +1,321 @@
+"""HUD calibration per screen resolution and UI scale, cached in a profile file.
+
+The reference layout of hud.py is scaled linearly from 1920x1080, which misplaces the
+HUD on ultrawide and other non-16:9 screens, so every tick falls back to OCR and map
+toggles. Calibration measures the layout instead, on a few pairs of full-screen frames
+taken with the map closed and then open:
+
+- the map is the largest near-square block of pixels that change when the map opens,
+  and the map border is its top strip, as in the reference layout;
+- the match timer is the changed block left of the map near its top, or is placed
+  relative to the map like in the reference layout when none is found;
+- the chat prompt is not shown while calibrating, it keeps the reference placement
+  anchored to the left edge and scaled with the screen height (see hud.anchored_region).
+
+When an OCR function is given, the timer preprocessing (upscale factor, blur and
+dilation kernels, threshold) is picked from a small grid by how many frames it reads.
+Profiles are stored in a JSON file keyed by resolution and UI scale, and loaded on startup:
+
+    python calibration.py <closed.png> <open.png> [<closed.png> <open.png> ...] [--ui-scale 1.0]
+"""
+
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import itertools
+
+import cv2
+import numpy as np
+from PIL import Image
+
+from hud import REFERENCE_WIDTH, REFERENCE_HEIGHT, REFERENCE_REGIONS, DEFAULT_PREPROCESS, anchored_region, \
+    scaled_regions, preprocess_image
+from timer_reader import parse_time_text
+
+
+PROFILE_FILENAME = 'hud_profiles.json'
+
+# Candidate timer preprocessing, the defaults first so they win ties
+PREPROCESS_GRID = {
+    'upscale': (3.0, 2.0, 4.0),
+    'blur': (5, 0, 3),
+    'dilate': (2, 1),
+    'threshold': (0, 150),
+}
+
+DIFF_THRESHOLD = 20  # Levels a pixel must change by in any channel when the map opens
+
+
+def profile_key(resolution, ui_scale=1.0):
+    return f"{resolution[0]}x{resolution[1]}@{ui_scale:g}"
+
+
+class HudProfile:
+    """HUD regions in screen pixels and per-region OCR preprocessing of one resolution and UI scale."""
+
+    def __init__(self, resolution, regions, preprocess=None, ui_scale=1.0, source='reference', calibrated_at=None):
+        self.resolution = tuple(resolution)
+        self.regions = {name: tuple(int(value) for value in box) for name, box in regions.items()}
+        self.preprocess = preprocess or {}
+        self.ui_scale = ui_scale
+        self.source = source  # 'reference' when scaled from the reference layout, 'calibrated' when measured
+        self.calibrated_at = calibrated_at
+
+    def preprocess_params(self, kind):
+        """Preprocessing of a region, the hud.py defaults for what was not tuned."""
+        return dict(DEFAULT_PREPROCESS, **self.preprocess.get(kind, {}))
+
+    def to_json(self):
+        return {
+            'resolution': list(self.resolution),
+            'ui_scale': self.ui_scale,
+            'regions': {name: list(box) for name, box in self.regions.items()},
+            'preprocess': self.preprocess,
+            'source': self.source,
+            'calibrated_at': self.calibrated_at,
+        }
+
+    @classmethod
+    def from_json(cls, data):
+        return cls(
+            data['resolution'], data['regions'], data.get('preprocess'), data.get('ui_scale', 1.0),
+            data.get('source', 'calibrated'), data.get('calibrated_at')
+        )
+
+    def __repr__(self):
+        return f"HudProfile({profile_key(self.resolution, self.ui_scale)}, {self.source}, {self.regions})"
+
+
+def reference_profile(resolution):
+    """The reference layout scaled to a resolution, as used before calibration."""
+    width, height = resolution
+    return HudProfile(resolution, scaled_regions(width / REFERENCE_WIDTH, height / REFERENCE_HEIGHT))
+
+
+def _load_profiles(path):
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def load_profile(path, resolution, ui_scale=1.0):
+    """The calibrated profile of a resolution and UI scale, or None."""
+    try:
+        data = _load_profiles(path).get(profile_key(resolution, ui_scale))
+    except (OSError, ValueError) as e:
+        logging.error(f"Failed to read the HUD profiles {path}: {e}")
+        return None
+    return HudProfile.from_json(data) if data else None
+
+
+def save_profile(path, profile):
+    """Add or replace a profile in the profile file."""
+    try:
+        profiles = _load_profiles(path)
+    except (OSError, ValueError):
+        logging.warning(f"Replacing the unreadable HUD profiles {path}")
+        profiles = {}
+    profiles[profile_key(profile.resolution, profile.ui_scale)] = profile.to_json()
+    temp_path = path + '.part'
+    with open(temp_path, 'w') as f:
+        json.dump(profiles, f, indent=1)
+    os.replace(temp_path, path)
+    logging.info(f"Saved HUD profile {profile_key(profile.resolution, profile.ui_scale)} to {path}")
+
+
+def _changed_mask(closed, opened):
+    """Mask of the pixels changed between two full-screen RGB frames, with gaps inside blocks closed."""
+    diff = cv2.absdiff(opened, closed).max(axis=2)
+    mask = (diff > DIFF_THRESHOLD).astype(np.uint8)
+    size = max(opened.shape[0] // 200, 3)
+    return cv2.morphologyEx(mask, cv2.MORPH_CLOSE, np.ones((size, size), np.uint8))
+
+
+def _longest_run(profile, threshold):
+    """(start, end) of the longest run of values above `threshold`, or None."""
+    above = np.concatenate(([False], profile > threshold, [False]))
+    edges = np.flatnonzero(above[1:] != above[:-1])
+    if not edges.size:
+        return None
+    starts, ends = edges[::2], edges[1::2]
+    longest = int(np.argmax(ends - starts))
+    return int(starts[longest]), int(ends[longest])
+
+
+def _smoothed_run(profile, size, share=0.15):
+    """Longest run above `share` of the peak of a smoothed profile, trimmed to the raw profile."""
+    smoothed = np.convolve(profile, np.ones(size) / size, mode='same')
+    if not smoothed.max():
+        return None
+    threshold = share * smoothed.max()
+    run = _longest_run(smoothed, threshold)
+    if run is None:
+        return None
+    start, end = run
+    # Smoothing spreads the edges by half its window
+    while start < end and profile[start] <= threshold:
+        start += 1
+    while end > start and profile[end - 1] <= threshold:
+        end -= 1
+    return start, end
+
+
+def find_map(mask):
+    """(left, top, right, bottom) of the large near-square block where most changes are, or None.
+
+    Changed pixels are patchy where the map happens to look like the game behind it, so the
+    map is found from the share of changed pixels of every column, then of every row within
+    those columns, rather than from connected blocks.
+    """
+    height = mask.shape[0]
+    size = max(height // 100, 1)
+    run = _smoothed_run(mask.mean(axis=0), size)
+    if run is None:
+        return None
+    left, right = run
+    run = _smoothed_run(mask[:, left:right].mean(axis=1), size)
+    if run is None:
+        return None
+    top, bottom = run
+    if bottom - top < 0.4 * height or not 0.8 <= (right - left) / (bottom - top) <= 1.25:
+        return None
+    return (left, top, right, bottom)
+
+
+def find_timer(mask, map_box):
+    """(left, top, right, bottom) of the changed block left of the map near its top, or None."""
+    map_left, map_top, _, map_bottom = map_box
+    band_bottom = map_top + (map_bottom - map_top) // 8
+    count, _, stats, _ = cv2.connectedComponentsWithStats(mask[:band_bottom, :map_left])
+    boxes = [
+        (left, top, left + width, top + height)
+        for left, top, width, height, area in stats[1:count]
+        if area >= 20 and height < band_bottom
+    ]
+    if not boxes:
+        return None
+    # The label is one line of text: keep the blocks overlapping the row of the largest one
+    largest = max(boxes, key=lambda box: (box[2] - box[0]) * (box[3] - box[1]))
+    line = [box for box in boxes if box[1] < largest[3] and box[3] > largest[1]]
+    left, top = min(box[0] for box in line), min(box[1] for box in line)
+    right, bottom = max(box[2] for box in line), max(box[3] for box in line)
+    return (max(left - 2, 0), max(top - 2, 0), min(right + 2, map_left), bottom + 2)
+
+
+def _relative_to_map(name, map_box):
+    """Place a reference region at the same offset and scale from the map as in the reference layout."""
+    ref_left, ref_top, ref_right, ref_bottom = REFERENCE_REGIONS['map']
+    left, top, right, bottom = REFERENCE_REGIONS[name]
+    scale = (map_box[3] - map_box[1]) / (ref_bottom - ref_top)
+    x = map_box[0] + (left - ref_left) * scale
+    y = map_box[1] + (top - ref_top) * scale
+    return (max(int(x), 0), max(int(y), 0), int(x + (right - left) * scale), int(y + (bottom - top) * scale))
+
+
+def _median_box(boxes):
+    return tuple(int(value) for value in np.median(np.array(boxes), axis=0))
+
+
+def tune_preprocess(crops, read_text, grid=PREPROCESS_GRID):
+    """Pick the preprocessing under which `read_text` reads the timer on the most crops.
+
+    Returns (params, number of crops read).
+    """
+    best, best_score = dict(DEFAULT_PREPROCESS), -1
+    names = list(grid)
+    for values in itertools.product(*(grid[name] for name in names)):
+        params = dict(zip(names, values))
+        score = 0
+        for crop in crops:
+            try:
+                if parse_time_text(read_text(preprocess_image(crop, params)).strip()):
+                    score += 1
+            except Exception as e:
+                logging.debug(f"OCR failed while tuning the preprocessing: {e}")
+        if score > best_score:
+            best, best_score = params, score
+        if best_score == len(crops):
+            break
+    return best, best_score
+
+
+def calibrate(pairs, ui_scale=1.0, read_text=None):
+    """Measure the HUD from (map closed, map open) pairs of full-screen RGB frames, return a HudProfile.
+
+    `read_text(image)` is an optional OCR function for tuning the timer preprocessing.
+    Raises RuntimeError when the map is not found on any pair.
+    """
+    height, width = pairs[0][1].shape[:2]
+    map_boxes, timer_boxes = [], []
+    for closed, opened in pairs:
+        mask = _changed_mask(closed, opened)
+        map_box = find_map(mask)
+        if map_box is None:
+            continue
+        map_boxes.append(map_box)
+        timer_box = find_timer(mask, map_box)
+        if timer_box is not None:
+            timer_boxes.append(timer_box)
+    if not map_boxes:
+        raise RuntimeError("The map was not found, keep the game in front and the map closed while calibrating")
+
+    map_box = _median_box(map_boxes)
+    timer_box = _median_box(timer_boxes) if timer_boxes else _relative_to_map('time', map_box)
+    border_height = round((map_box[3] - map_box[1]) * 16 / 974)  # Same share of the map as the reference border
+    regions = {
+        'chat': anchored_region('chat', width, height, ui_scale),
+        'time': timer_box,
+        'map': map_box,
+        'map_border': (map_box[0], map_box[1], map_box[2], map_box[1] + border_height),
+    }
+    logging.info(f"Calibrated HUD on {len(map_boxes)}/{len(pairs)} frame pairs: {regions}")
+
+    preprocess = {}
+    if read_text is not None:
+        left, top, right, bottom = timer_box
+        crops = [opened[top:bottom, left:right] for _, opened in pairs]
+        params, score = tune_preprocess(crops, read_text)
+        logging.info(f"Timer preprocessing {params} read {score}/{len(crops)} frames")
+        if score > 0:
+            preprocess['time'] = params
+    return HudProfile((width, height), regions, preprocess, ui_scale, 'calibrated', time.strftime("%Y-%m-%dT%H:%M:%S"))
+
+
+def _load_rgb(path):
+    with Image.open(path) as image:
+        return np.asarray(image.convert('RGB'))
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Calibrate the HUD regions from screenshots with the map closed and open.")
+    parser.add_argument('frames', nargs='+', help="Screenshots in pairs: map closed, then map open")
+    parser.add_argument('--ui-scale', type=float, default=1.0, help="In-game UI scale the screenshots were taken with")
+    parser.add_argument('--profiles', default=PROFILE_FILENAME, help="Profile file to update")
+    parser.add_argument('--ocr', action='store_true', help="Tune the timer preprocessing with Tesseract")
+    args = parser.parse_args(argv[1:])
+    if len(args.frames) % 2:
+        parser.error("screenshots must come in pairs: map closed, then map open")
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    frames = [_load_rgb(path) for path in args.frames]
+    read_text = None
+    if args.ocr:
+        from ocr import OcrService
+        ocr = OcrService()
+        read_text = ocr.recognize
+    try:
+        profile = calibrate(list(zip(frames[::2], frames[1::2])), args.ui_scale, read_text)
+    finally:
+        if args.ocr:
+            ocr.close()
+    save_profile(args.profiles, profile)
+    print(profile)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
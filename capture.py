@@ -0,0 +1,184 @@
+"""Screen capture backends that grab only the HUD regions needed on each tick."""
+
+import os
+import threading
+import logging
+
+import numpy as np
+from PIL import Image, ImageGrab
+
+
+class CaptureBackend:
+    """Base class for capture backends.
+
+    A backend grabs named (left, top, right, bottom) boxes and returns them as RGB
+    NumPy arrays. The arrays are buffers reused across ticks: copy them if they must
+    outlive the current tick.
+    """
+
+    name = 'base'
+
+    def __init__(self):
+        self._buffers = {}
+
+    def screen_size(self):
+        """Return the (width, height) of the captured screen."""
+        raise NotImplementedError
+
+    def next_frame(self):
+        """Advance to the next frame. Live backends always return True."""
+        return True
+
+    def grab(self, regions):
+        """Grab every box in `regions` and return a {name: RGB array} dict."""
+        frames = {}
+        for name, box in regions.items():
+            buffer = self._buffer_for(name, box)
+            self._grab_into(box, buffer)
+            frames[name] = buffer
+        return frames
+
+    def grab_into(self, box, out):
+        """Grab one box into a caller-owned RGB array of its size, e.g. a ring buffer slot."""
+        self._grab_into(box, out)
+
+    def _buffer_for(self, name, box):
+        """Return the reusable buffer for a region, reallocating only when its size changes."""
+        width = max(box[2] - box[0], 0)
+        height = max(box[3] - box[1], 0)
+        buffer = self._buffers.get(name)
+        if buffer is None or buffer.shape[:2] != (height, width):
+            buffer = np.empty((height, width, 3), dtype=np.uint8)
+            self._buffers[name] = buffer
+        return buffer
+
+    def _grab_into(self, box, out):
+        raise NotImplementedError
+
+    def close(self):
+        self._buffers.clear()
+
+
+class PilCaptureBackend(CaptureBackend):
+    """Capture through Pillow's ImageGrab, limited to the requested bounding box."""
+
+    name = 'pil'
+
+    def screen_size(self):
+        return ImageGrab.grab().size
+
+    def _grab_into(self, box, out):
+        image = ImageGrab.grab(bbox=box)
+        if image.mode != 'RGB':
+            image = image.convert('RGB')
+        out[...] = np.asarray(image)
+
+
+class MssCaptureBackend(CaptureBackend):
+    """Capture through the optional `mss` package, which is much faster than ImageGrab for small regions."""
+
+    name = 'mss'
+
+    def __init__(self):
+        super().__init__()
+        import mss
+        self._mss = mss
+        # mss handles are not thread-safe, keep one per capturing thread
+        self._local = threading.local()
+
+    def _session(self):
+        sct = getattr(self._local, 'sct', None)
+        if sct is None:
+            sct = self._mss.mss()
+            self._local.sct = sct
+        return sct
+
+    def screen_size(self):
+        monitor = self._session().monitors[1]
+        return monitor['width'], monitor['height']
+
+    def _grab_into(self, box, out):
+        left, top, right, bottom = box
+        shot = self._session().grab({'left': left, 'top': top, 'width': right - left, 'height': bottom - top})
+        bgra = np.frombuffer(shot.bgra, dtype=np.uint8).reshape(shot.height, shot.width, 4)
+        out[...] = bgra[:, :, 2::-1]  # BGRA -> RGB
+
+    def close(self):
+        sct = getattr(self._local, 'sct', None)
+        if sct is not None:
+            sct.close()
+            self._local.sct = None
+        super().close()
+
+
+class FileCaptureBackend(CaptureBackend):
+    """Replay recorded full-resolution screenshots, so the pipeline can run without a display."""
+
+    name = 'file'
+    extensions = ('.png', '.jpg', '.jpeg', '.bmp', '.webp')
+
+    def __init__(self, source, loop=False):
+        super().__init__()
+        if isinstance(source, (list, tuple)):
+            self.files = list(source)
+        else:
+            self.files = sorted(
+                os.path.join(source, f) for f in os.listdir(source)
+                if f.lower().endswith(self.extensions)
+            )
+        if not self.files:
+            raise RuntimeError(f"No recorded frames found in {source}")
+        self.loop = loop
+        self.position = -1
+        self.frame = None
+        self.current_file = None
+
+    def screen_size(self):
+        if self.frame is not None:
+            return self.frame.shape[1], self.frame.shape[0]
+        with Image.open(self.files[0]) as image:
+            return image.size
+
+    def next_frame(self):
+        self.position += 1
+        if self.position >= len(self.files):
+            if not self.loop:
+                return False
+            self.position = 0
+        self.current_file = self.files[self.position]
+        with Image.open(self.current_file) as image:
+            self.frame = np.asarray(image.convert('RGB'))
+        logging.debug(f"Replaying recorded frame: {self.current_file}")
+        return True
+
+    def _grab_into(self, box, out):
+        if self.frame is None:
+            self.next_frame()
+        left, top, right, bottom = box
+        out.fill(0)
+        # Clip the box to the recorded frame, regions outside of it stay black
+        height, width = self.frame.shape[:2]
+        src = self.frame[max(top, 0):min(bottom, height), max(left, 0):min(right, width)]
+        out[max(-top, 0):max(-top, 0) + src.shape[0], max(-left, 0):max(-left, 0) + src.shape[1]] = src
+
+
+CAPTURE_BACKENDS = {
+    'pil': PilCaptureBackend,
+    'mss': MssCaptureBackend,
+}
+
+
+def create_capture_backend(name='auto', replay_source=None):
+    """Create a capture backend by name, or a file-backed one when `replay_source` is set."""
+    if replay_source:
+        return FileCaptureBackend(replay_source)
+    if name == 'auto':
+        try:
+            return MssCaptureBackend()
+        except ImportError:
+            logging.info("mss is not installed, falling back to Pillow screen capture.")
+            return PilCaptureBackend()
+    try:
+        return CAPTURE_BACKENDS[name]()
+    except KeyError:
+        raise ValueError(f"Unknown capture backend: {name}")
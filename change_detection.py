@@ -0,0 +1,72 @@
+"""Perceptual-hash and block-diff change detection between consecutive map frames."""
+
+from collections import namedtuple
+
+import cv2
+import numpy as np
+
+
+# redundant: the frame is (nearly) identical to the last kept frame.
+# distance: Hamming distance between the perceptual hashes.
+# bbox: (left, top, right, bottom) of the changed blocks, or None when nothing changed.
+FrameChange = namedtuple('FrameChange', 'redundant distance bbox hash')
+
+
+def dhash(gray, size=8):
+    """Difference hash of a grayscale image as a 64-bit integer."""
+    resized = cv2.resize(gray, (size + 1, size), interpolation=cv2.INTER_AREA)
+    bits = (resized[:, 1:] > resized[:, :-1]).ravel()
+    return int.from_bytes(np.packbits(bits).tobytes(), 'big')
+
+
+def hamming(a, b):
+    return bin(a ^ b).count('1')
+
+
+class FrameChangeDetector:
+    """Compare each map frame with the last kept one.
+
+    A frame is redundant when its perceptual hash is within `hash_threshold` bits of the
+    last kept frame and no `block_size` block changed by more than `block_threshold`
+    gray levels on average. Frames are compared with the last kept frame rather than the
+    previous one, so slow changes still accumulate into a kept frame.
+    """
+
+    def __init__(self, hash_threshold=2, block_size=32, block_threshold=6.0):
+        self.hash_threshold = hash_threshold
+        self.block_size = block_size
+        self.block_threshold = block_threshold
+        self.previous = None
+        self.previous_hash = None
+
+    def changed_bbox(self, gray):
+        """Bounding box of the blocks that changed since the last kept frame, or None."""
+        if self.previous is None or self.previous.shape != gray.shape:
+            return (0, 0, gray.shape[1], gray.shape[0])
+        diff = cv2.absdiff(gray, self.previous)
+        rows = -(-gray.shape[0] // self.block_size)
+        cols = -(-gray.shape[1] // self.block_size)
+        padded = np.zeros((rows * self.block_size, cols * self.block_size), dtype=np.float32)
+        padded[:diff.shape[0], :diff.shape[1]] = diff
+        block_means = padded.reshape(rows, self.block_size, cols, self.block_size).mean(axis=(1, 3))
+        changed_rows, changed_cols = np.nonzero(block_means > self.block_threshold)
+        if not changed_rows.size:
+            return None
+        return (
+            int(changed_cols.min() * self.block_size),
+            int(changed_rows.min() * self.block_size),
+            int(min((changed_cols.max() + 1) * self.block_size, gray.shape[1])),
+            int(min((changed_rows.max() + 1) * self.block_size, gray.shape[0]))
+        )
+
+    def compare(self, frame):
+        """Compare an RGB map frame with the last kept frame; non-redundant frames become the new reference."""
+        gray = cv2.cvtColor(frame, cv2.COLOR_RGB2GRAY)
+        frame_hash = dhash(gray)
+        distance = 64 if self.previous_hash is None else hamming(frame_hash, self.previous_hash)
+        bbox = self.changed_bbox(gray)
+        redundant = distance <= self.hash_threshold and bbox is None
+        if not redundant:
+            self.previous = gray
+            self.previous_hash = frame_hash
+        return FrameChange(redundant, distance, bbox, f"{frame_hash:016x}")
@@ -0,0 +1,108 @@
+"""Failure-triggered debug capture.
+
+The raw HUD crops and readings of the last ticks are kept in a bounded in-memory ring
+buffer, and only written to the session's debug folder when something goes wrong: the
+timer could not be read, a detector was not confident, or a pipeline stage failed.
+"""
+
+import os
+import json
+import logging
+import threading
+from collections import deque, namedtuple
+
+
+DEBUG_FOLDER = 'debug'
+EVENTS_FILENAME = 'events.jsonl'
+
+DebugEntry = namedtuple('DebugEntry', 'index wall_time crops info')
+
+
+def job_info(job):
+    """Readings of a FrameJob worth keeping next to its crops."""
+    info = {'elapsed_time': job.elapsed_time, 'map_toggled': job.map_toggled}
+    if job.time_reading is not None:
+        info['time_reading'] = job.time_reading._asdict()
+    if job.chat is not None:
+        info['chat'] = job.chat._asdict()
+    return info
+
+
+class DebugCapture:
+    """Ring buffer of the last `capacity` sampled ticks, flushed to disk on failures.
+
+    One tick in `sample_every` is kept. At most `max_bytes` of debug files are written per
+    session, after which failures are only logged.
+    """
+
+    def __init__(self, store, capacity=30, sample_every=1, min_confidence=0.6, max_bytes=50 * 1024 * 1024):
+        self.store = store
+        self.sample_every = max(sample_every, 1)
+        self.min_confidence = min_confidence
+        self.max_bytes = max_bytes
+        self.entries = deque(maxlen=capacity)
+        self.lock = threading.Lock()
+        self.bytes_written = 0
+        self.flushes = 0
+
+    def record(self, job):
+        """Keep the debug crops and readings of a job, if it is sampled."""
+        if not job.debug or job.index % self.sample_every:
+            return
+        with self.lock:
+            self.entries.append(DebugEntry(job.index, job.wall_time, dict(job.debug), job_info(job)))
+
+    def failure_reason(self, job):
+        """Why a job's crops should be saved, or None if its readings look fine.
+
+        Only glyph and template readings are judged by their confidence. Readings decided by the
+        OCR fallback carry the score that caused the fallback, usually 0, whatever OCR found; a
+        missing time on an open map still shows up as unknown_time. Cache hits repeat a reading
+        that was checked when it was first made.
+        """
+        if job.elapsed_time == "unknown_time":
+            return 'unknown_time'
+        reading = job.time_reading
+        if reading is not None and reading.source == 'glyph' and reading.confidence < self.min_confidence:
+            return 'low_timer_confidence'
+        if job.chat is not None and job.chat.source == 'template' and job.chat.confidence < self.min_confidence:
+            return 'low_chat_confidence'
+        return None
+
+    def check(self, job):
+        """Record a job, and flush the buffer if its readings failed."""
+        self.record(job)
+        reason = self.failure_reason(job)
+        if reason is not None:
+            self.flush(reason, job.index)
+
+    def flush(self, reason, index=None):
+        """Write the buffered crops and an event line to the debug folder, then empty the buffer."""
+        with self.lock:
+            entries = sorted(self.entries, key=lambda entry: entry.index)
+            self.entries.clear()
+            if self.bytes_written >= self.max_bytes:
+                logging.warning(f"Debug capture limit reached, not saving the crops of '{reason}' (frame {index}).")
+                return
+            folder = os.path.join(self.store.session_folder, DEBUG_FOLDER)
+            os.makedirs(folder, exist_ok=True)
+            files = []
+            for entry in entries:
+                for name, crop in entry.crops.items():
+                    filename, data = self.store.encode(os.path.join(DEBUG_FOLDER, f"{name}_{entry.index}"), crop)
+                    self.store.write(filename, data)
+                    self.bytes_written += len(data)
+                    files.append(filename)
+            event = {
+                'reason': reason,
+                'frame': index,
+                'files': files,
+                'entries': [{'frame': entry.index, 'wall_time': entry.wall_time, **entry.info} for entry in entries],
+            }
+            with open(os.path.join(folder, EVENTS_FILENAME), 'a') as f:
+                f.write(json.dumps(event) + '\n')
+            self.flushes += 1
+        logging.info(f"Saved debug capture of {len(entries)} frames ({reason}, frame {index}).")
+
+    def stats(self):
+        return {'flushes': self.flushes, 'bytes_written': self.bytes_written, 'buffered': len(self.entries)}
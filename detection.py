@@ -0,0 +1,235 @@
+"""Cheap pixel-based HUD detectors that avoid running OCR on every tick."""
+
+import os
+import time
+import logging
+import threading
+from collections import namedtuple
+
+import cv2
+import numpy as np
+from PIL import Image, ImageDraw, ImageFont
+
+
+# state is 'team', 'all' or None when the chat prompt is not shown.
+# source is 'template' when decided by template matching and 'ocr' when the fallback was used.
+ChatDetection = namedtuple('ChatDetection', 'state confidence source')
+
+
+def normalize_signature(gray):
+    """Return the zero-mean, unit-norm float vector of a grayscale crop, or None for a flat crop."""
+    vector = gray.astype(np.float32).ravel()
+    vector -= vector.mean()
+    norm = np.linalg.norm(vector)
+    if norm < 1e-3:
+        return None
+    return vector / norm
+
+
+def coarse_signature(gray, height=5):
+    """normalize_signature of a crop shrunk to a few pixels high, where text is reduced to its layout.
+
+    Text in any font and at any small offset gives a similar coarse signature.
+    """
+    width = max(int(round(gray.shape[1] * height / gray.shape[0])), 1)
+    return normalize_signature(cv2.resize(gray.astype(np.float32), (width, height), interpolation=cv2.INTER_AREA))
+
+
+def render_seed_template(label, shape):
+    """Draw a chat prompt label ("Team", "All") as light text on a dark background, as a gray crop of `shape`."""
+    height, width = shape
+    font = ImageFont.load_default(max(int(height * 0.65), 8))
+    image = Image.new('L', (width, height), 10)
+    text = label.capitalize()
+    _, top, _, bottom = font.getbbox(text)
+    ImageDraw.Draw(image).text((2, (height - bottom - top) // 2), text, font=font, fill=240)
+    return np.asarray(image)
+
+
+class ChatStateDetector:
+    """Detect the "Team"/"All" chat prompt with normalized cross-correlation against a template bank.
+
+    Templates are raw chat-region crops stored as `<label>_*.png` in `template_folder`, captured
+    at any resolution and resized once to the crop size of the current screen. Scores between
+    `reject_threshold` and `match_threshold` are ambiguous and go to the optional OCR `fallback`,
+    whose confident answers are added to the bank so the fallback is needed less and less.
+
+    Until the bank holds templates of both labels, the missing ones are stood in for by rendered
+    seeds, compared at a coarse scale since the game font is unknown. A crop scoring at most
+    `seed_reject_threshold` against every seed (and low against the real templates) has no prompt;
+    only prompt-like crops go to the fallback, instead of every tick.
+    """
+
+    labels = ('team', 'all')
+
+    def __init__(self, template_folder, match_threshold=0.8, reject_threshold=0.5, fallback=None,
+                 learn=True, max_templates=8, seed_reject_threshold=0.3):
+        self.template_folder = template_folder
+        self.match_threshold = match_threshold
+        self.reject_threshold = reject_threshold
+        self.fallback = fallback
+        self.learn = learn
+        self.max_templates = max_templates
+        self.seed_reject_threshold = seed_reject_threshold
+        self.templates = []  # (label, gray crop) as loaded from disk or learned
+        self._bank = None    # (labels, matrix of normalized signatures) for the current crop size
+        self._bank_shape = None
+        self._seeds = None   # (shape, missing labels, matrix of coarse seed signatures)
+        self.load_templates()
+
+    def load_templates(self):
+        """Load the template bank from the template folder."""
+        self.templates = []
+        if not os.path.isdir(self.template_folder):
+            logging.info(f"No chat templates found in {self.template_folder}, using rendered seeds until some are learned.")
+            return
+        for filename in sorted(os.listdir(self.template_folder)):
+            label = filename.split('_', 1)[0].lower()
+            if label in self.labels and filename.lower().endswith('.png'):
+                with Image.open(os.path.join(self.template_folder, filename)) as image:
+                    self.templates.append((label, np.asarray(image.convert('L'))))
+        self._bank = None
+        logging.info(f"Loaded {len(self.templates)} chat templates from {self.template_folder}")
+
+    def missing_labels(self):
+        """Labels the bank holds no template of yet."""
+        known = {label for label, _ in self.templates}
+        return tuple(label for label in self.labels if label not in known)
+
+    def seed_score(self, gray):
+        """Best coarse score of a crop against the seeds of the missing labels, 0.0 when none is missing."""
+        missing = self.missing_labels()
+        if not missing:
+            return 0.0
+        if self._seeds is None or self._seeds[:2] != (gray.shape, missing):
+            signatures = [coarse_signature(render_seed_template(label, gray.shape)) for label in missing]
+            self._seeds = (gray.shape, missing, np.stack(signatures))
+        signature = coarse_signature(gray)
+        if signature is None:
+            return 0.0
+        return float((self._seeds[2] @ signature).max())
+
+    def _build_bank(self, shape):
+        """Resize every template to the crop shape and stack their signatures."""
+        labels, signatures = [], []
+        for label, gray in self.templates:
+            resized = cv2.resize(gray, (shape[1], shape[0]), interpolation=cv2.INTER_AREA)
+            signature = normalize_signature(resized)
+            if signature is not None:
+                labels.append(label)
+                signatures.append(signature)
+        matrix = np.stack(signatures) if signatures else np.empty((0, shape[0] * shape[1]), np.float32)
+        self._bank = (labels, matrix)
+        self._bank_shape = shape
+
+    def match(self, gray):
+        """Return the (label, score) of the best matching template, or (None, 0.0)."""
+        if self._bank is None or self._bank_shape != gray.shape:
+            self._build_bank(gray.shape)
+        labels, matrix = self._bank
+        signature = normalize_signature(gray)
+        if signature is None or not labels:
+            return None, 0.0
+        scores = matrix @ signature
+        best = int(np.argmax(scores))
+        return labels[best], float(scores[best])
+
+    def detect(self, crop):
+        """Classify a raw RGB chat-region crop."""
+        gray = cv2.cvtColor(crop, cv2.COLOR_RGB2GRAY)
+        if normalize_signature(gray) is None:
+            return ChatDetection(None, 1.0, 'template')  # A flat region cannot hold the prompt
+
+        label, score = self.match(gray)
+        if score >= self.match_threshold:
+            return ChatDetection(label, score, 'template')
+        if score <= self.reject_threshold:
+            # Far from the known templates, and from the seeds of the labels without any
+            seed_score = self.seed_score(gray)
+            if seed_score <= self.seed_reject_threshold:
+                return ChatDetection(None, 1.0 - max(score, seed_score), 'template')
+        if self.fallback is None:
+            return ChatDetection(None, 1.0 - score, 'template')
+
+        # Ambiguous score, or a prompt-like crop of a label not in the bank: ask the OCR fallback and learn from its answer
+        state = self.fallback(crop)
+        if state in self.labels and self.learn:
+            self.add_template(state, crop)
+        return ChatDetection(state, score, 'ocr')
+
+    def add_template(self, label, crop):
+        """Add a crop confirmed by OCR to the bank and save it to the template folder."""
+        if sum(1 for known, _ in self.templates if known == label) >= self.max_templates:
+            return
+        gray = cv2.cvtColor(crop, cv2.COLOR_RGB2GRAY)
+        self.templates.append((label, gray))
+        self._bank = None
+        try:
+            os.makedirs(self.template_folder, exist_ok=True)
+            filename = f"{label}_{crop.shape[1]}x{crop.shape[0]}_{int(time.time() * 1000)}.png"
+            Image.fromarray(crop).save(os.path.join(self.template_folder, filename))
+            logging.info(f"Learned chat template '{label}': {filename}")
+        except Exception as e:
+            logging.error(f"Failed to save chat template: {e}")
+
+
+def map_signature(crop, bins=16, blocks=16):
+    """Signature of a map-border crop: gray-level histogram and per-block edge density, both summing to 1."""
+    gray = cv2.cvtColor(crop, cv2.COLOR_RGB2GRAY)
+    histogram = np.bincount(gray.ravel() >> (8 - int(np.log2(bins))), minlength=bins).astype(np.float32)
+    histogram /= max(histogram.sum(), 1.0)
+
+    edges = np.abs(cv2.Sobel(gray, cv2.CV_32F, 1, 0, ksize=3)) + np.abs(cv2.Sobel(gray, cv2.CV_32F, 0, 1, ksize=3))
+    profile = np.array([block.mean() for block in np.array_split(edges, blocks, axis=1)], dtype=np.float32)
+    profile /= max(profile.sum(), 1e-6)
+    return np.concatenate((histogram, profile))
+
+
+def signature_distance(a, b):
+    """Distance between two map signatures, from 0 (identical) to 1."""
+    return float(np.abs(a - b).sum() / 4)
+
+
+class MapVisibilityDetector:
+    """Tell whether the map is open from the pixels of its border, without OCR.
+
+    Reference signatures are learned during the session: crops taken while the timer
+    was readable are open samples, crops taken just before a successful toggle are
+    closed samples. A crop is classified like its nearest reference, when that one
+    is closer than `threshold`.
+    """
+
+    def __init__(self, threshold=0.25, min_samples=3, max_samples=16):
+        self.threshold = threshold
+        self.min_samples = min_samples
+        self.max_samples = max_samples
+        self.samples = {True: [], False: []}
+        self.lock = threading.Lock()
+
+    def is_trained(self):
+        return len(self.samples[True]) >= self.min_samples
+
+    def learn(self, crop, is_open):
+        """Add a crop whose map state is known."""
+        signature = map_signature(crop)
+        with self.lock:
+            samples = self.samples[is_open]
+            samples.append(signature)
+            if len(samples) > self.max_samples:
+                samples.pop(0)
+
+    def classify(self, crop):
+        """Return True if the map is open, False if it is closed, or None while unsure or untrained."""
+        if not self.is_trained():
+            return None
+        signature = map_signature(crop)
+        with self.lock:
+            nearest = {
+                state: min((signature_distance(signature, known) for known in samples), default=1.0)
+                for state, samples in self.samples.items()
+            }
+        state = nearest[True] <= nearest[False]
+        if nearest[state] > self.threshold:
+            # Far from everything seen so far: only trust it when it is clearly not the open map
+            return False if nearest[True] > 2 * self.threshold else None
+        return state
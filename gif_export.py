@@ -0,0 +1,442 @@
+"""Streaming GIF encoding with a shared palette and constant memory use.
+
+Frames are annotated, quantized to one global palette and appended to the file one at
+a time, so a session of any length can be encoded without holding it in memory, and
+frames can be appended while the session is still running.
+"""
+
+import io
+import os
+import time
+import struct
+import logging
+import tempfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+
+import numpy as np
+from PIL import Image, ImageDraw, ImageFont
+
+from storage import open_frame
+
+
+GIF_NAME = 'session.gif'
+
+# The last palette entry is never used by the quantized colors, delta frames use it for unchanged pixels
+TRANSPARENT_INDEX = 255
+
+
+@lru_cache(maxsize=None)
+def load_font(size=40):
+    """Load the timestamp font once."""
+    try:
+        return ImageFont.truetype("arial.ttf", size)
+    except IOError:
+        return ImageFont.load_default()
+
+
+class TimestampRenderer:
+    """Draw the in-game time with glyphs rendered once, instead of rasterizing text for every frame."""
+
+    characters = '0123456789:'
+    fill = (255, 0, 0, 128)
+
+    def __init__(self, font):
+        self.font = font
+        self.glyphs = {}
+        for character in self.characters:
+            left, top, right, bottom = font.getbbox(character)
+            tile = Image.new('RGBA', (max(right, 1), max(bottom, 1)), (255, 255, 255, 0))
+            ImageDraw.Draw(tile).text((0, 0), character, font=font, fill=self.fill)
+            self.glyphs[character] = (tile, font.getlength(character))
+
+    def render(self, image, label):
+        """Composite the label at the bottom left of an RGBA image, in place."""
+        # Calculate position for the text (bottom left)
+        bbox = self.font.getbbox(label)
+        text_height = bbox[3] - bbox[1]
+        x, y = 10, image.size[1] - text_height - 10
+
+        if not all(character in self.glyphs for character in label):
+            overlay = Image.new('RGBA', image.size, (255, 255, 255, 0))
+            ImageDraw.Draw(overlay).text((x, y), label, font=self.font, fill=self.fill)
+            image.alpha_composite(overlay)
+            return
+        for character in label:
+            tile, advance = self.glyphs[character]
+            image.alpha_composite(tile, dest=(int(round(x)), y))
+            x += advance
+
+
+@lru_cache(maxsize=None)
+def get_timestamp_renderer(size=40):
+    return TimestampRenderer(load_font(size))
+
+
+def annotate_frame(image, label, font_size=40):
+    """Draw the in-game time at the bottom left of a map frame, return an RGB image."""
+    image = image.convert('RGBA')
+    get_timestamp_renderer(font_size).render(image, label)
+    return image.convert('RGB')
+
+
+def quantize_to_palette(image, palette_image):
+    """Map an RGB image onto a palette built by build_palette, return the array of indices."""
+    indexed = image.convert('RGB').quantize(palette=palette_image, dither=Image.Dither.NONE)
+    indices = np.array(indexed)
+    indices[indices == TRANSPARENT_INDEX] = 0  # Same color as entry 0, see build_palette
+    return indices
+
+
+def build_palette(images, colors=255, thumbnail_size=192):
+    """Compute one palette shared by every frame from a sample of RGB images.
+
+    At most 255 colors are used, so that TRANSPARENT_INDEX stays free.
+    """
+    colors = min(colors, TRANSPARENT_INDEX)
+    thumbnails = []
+    for image in images:
+        thumbnail = image.convert('RGB')
+        thumbnail.thumbnail((thumbnail_size, thumbnail_size))
+        thumbnails.append(thumbnail)
+    if not thumbnails:
+        raise ValueError("Cannot build a palette without images")
+
+    # Quantize a mosaic of the sampled frames, so the palette covers all of them
+    columns = int(len(thumbnails) ** 0.5 + 0.999)
+    rows = -(-len(thumbnails) // columns)
+    mosaic = Image.new('RGB', (columns * thumbnail_size, rows * thumbnail_size))
+    for i, thumbnail in enumerate(thumbnails):
+        mosaic.paste(thumbnail, ((i % columns) * thumbnail_size, (i // columns) * thumbnail_size))
+    palette_image = mosaic.quantize(colors=colors, method=Image.Quantize.MEDIANCUT)
+
+    # Pad the palette to 256 entries with copies of the first color, so it can be the GIF
+    # global color table and any pixel mapped to a padding entry can be moved to entry 0
+    palette = palette_image.getpalette()[:3 * colors]
+    palette_image.putpalette(palette + palette[:3] * (256 - len(palette) // 3))
+    return palette_image
+
+
+def _read_sub_blocks(data, position):
+    """Return the position just after a chain of GIF data sub-blocks."""
+    while True:
+        size = data[position]
+        position += 1
+        if size == 0:
+            return position
+        position += size
+
+
+def _extract_image_block(data, color_table):
+    """Extract the image descriptor and data of a single-frame GIF written by Pillow.
+
+    If Pillow wrote a global color table different from ours, it becomes the local
+    color table of the frame.
+    """
+    packed = data[10]
+    position = 13
+    frame_table = b''
+    if packed & 0x80:
+        size = 3 << ((packed & 0x07) + 1)
+        frame_table = data[position:position + size]
+        position += size
+
+    while position < len(data):
+        introducer = data[position]
+        if introducer == 0x21:  # Extension: skip it, we write our own
+            position = _read_sub_blocks(data, position + 2)
+        elif introducer == 0x2C:  # Image descriptor
+            descriptor = bytearray(data[position:position + 10])
+            start = position + 10
+            local_table = b''
+            if descriptor[9] & 0x80:
+                size = 3 << ((descriptor[9] & 0x07) + 1)
+                local_table = data[start:start + size]
+                start += size
+            end = _read_sub_blocks(data, start + 1)  # +1 for the LZW minimum code size
+            if not local_table and frame_table and frame_table != color_table:
+                descriptor[9] |= 0x80 | (packed & 0x07)
+                local_table = frame_table
+            return bytes(descriptor) + local_table + data[start:end]
+        else:
+            break
+    raise ValueError("No image found in the encoded GIF frame")
+
+
+class StreamingGifWriter:
+    """Append palette-quantized frames to a GIF file one at a time.
+
+    With `optimize`, each frame after the first only stores the rectangle that changed
+    since the previous one, with unchanged pixels inside it set to TRANSPARENT_INDEX and
+    "do not dispose" so they show the previous frame through. Frames identical to the
+    previous one only extend its delay. The shared palette keeps unchanged pixels on
+    the same indices, which is what makes the comparison exact.
+
+    The file is written as `<path>.part` and renamed when closed, so an unfinished
+    GIF is never mistaken for a complete one.
+    """
+
+    def __init__(self, path, palette_image, duration_ms, loop=0, optimize=True):
+        self.path = path
+        self.part_path = path + '.part'
+        self.palette_image = palette_image
+        self.color_table = bytes(palette_image.getpalette()[:768])
+        self.delay = max(int(round(duration_ms / 10)), 1)  # GIF delays are in 1/100 s
+        self.loop = loop
+        self.optimize = optimize
+        self.size = None
+        self.file = None
+        self.previous = None  # Indices of the previous frame
+        self.pending = None   # [delay, transparent, image block] not written yet, its delay may grow
+        self.frames = 0
+        self.delta_frames = 0
+        self.merged_frames = 0
+        self.bytes_written = 0
+        self.encode_seconds = 0.0
+
+    def _write(self, data):
+        self.file.write(data)
+        self.bytes_written += len(data)
+
+    def _write_header(self, size):
+        self.size = size
+        self.file = open(self.part_path, 'wb')
+        self._write(b'GIF89a')
+        # Logical screen: global color table of 256 entries, 8 bits per channel
+        self._write(struct.pack('<HHBBB', size[0], size[1], 0xF7, 0, 0))
+        self._write(self.color_table)
+        # NETSCAPE2.0 application extension for looping
+        self._write(b'\x21\xFF\x0BNETSCAPE2.0\x03\x01' + struct.pack('<H', self.loop) + b'\x00')
+
+    def quantize(self, image):
+        """Map an RGB image onto the shared palette, return the array of indices."""
+        if self.size is not None and image.size != self.size:
+            image = image.resize(self.size)
+        return quantize_to_palette(image, self.palette_image)
+
+    def _encode(self, indices, left=0, top=0):
+        """Encode an array of indices with Pillow and return its image block placed at (left, top)."""
+        image = Image.fromarray(indices, 'P')
+        image.putpalette(self.color_table)
+        buffer = io.BytesIO()
+        image.save(buffer, format='GIF', optimize=False)
+        block = bytearray(_extract_image_block(buffer.getvalue(), self.color_table))
+        block[1:5] = struct.pack('<HH', left, top)
+        return bytes(block)
+
+    def _flush_pending(self):
+        if self.pending is None:
+            return
+        delay, transparent, block = self.pending
+        # Graphic control extension: disposal "do not dispose", delay and optional transparency
+        packed = (1 << 2) | (1 if transparent else 0)
+        self._write(b'\x21\xF9\x04' + struct.pack('<BHB', packed, delay, TRANSPARENT_INDEX) + b'\x00')
+        self._write(block)
+        self.pending = None
+
+    def add_frame(self, image):
+        """Quantize and append an RGB frame."""
+        if self.file is None:
+            self._write_header(image.size)
+        self.add_indices(self.quantize(image))
+
+    def add_indices(self, indices):
+        """Append a frame already quantized to the shared palette."""
+        start = time.perf_counter()
+        if self.file is None:
+            self._write_header((indices.shape[1], indices.shape[0]))
+        if indices.shape != (self.size[1], self.size[0]):
+            indices = np.array(Image.fromarray(indices, 'P').resize(self.size, Image.NEAREST))
+
+        if not self.optimize or self.previous is None:
+            self._flush_pending()
+            self.pending = [self.delay, False, self._encode(indices)]
+        else:
+            changed = indices != self.previous
+            if not changed.any():
+                # Identical frame: show the previous one longer
+                self.pending[0] += self.delay
+                self.merged_frames += 1
+            else:
+                rows = np.flatnonzero(changed.any(axis=1))
+                columns = np.flatnonzero(changed.any(axis=0))
+                top, bottom = rows[0], rows[-1] + 1
+                left, right = columns[0], columns[-1] + 1
+                delta = indices[top:bottom, left:right].copy()
+                delta[~changed[top:bottom, left:right]] = TRANSPARENT_INDEX
+                self._flush_pending()
+                self.pending = [self.delay, True, self._encode(delta, int(left), int(top))]
+                self.delta_frames += 1
+        self.previous = indices
+        self.frames += 1
+        self.encode_seconds += time.perf_counter() - start
+
+    def close(self):
+        """Write the trailer and move the finished GIF into place."""
+        if self.file is None:
+            return False
+        self._flush_pending()
+        self._write(b'\x3B')
+        self.file.close()
+        self.file = None
+        os.replace(self.part_path, self.path)
+        return True
+
+    def abort(self):
+        """Drop the unfinished GIF, any previous GIF at the path is left as it was."""
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+            os.remove(self.part_path)
+
+    def stats(self):
+        return {
+            'frames': self.frames,
+            'delta_frames': self.delta_frames,
+            'merged_frames': self.merged_frames,
+            'bytes': self.bytes_written,
+            'encode_seconds': self.encode_seconds,
+        }
+
+
+class LiveGifEncoder:
+    """Encode the GIF while the session runs.
+
+    The first `sample_size` frames are kept to compute the shared palette, then every
+    frame is written as soon as it arrives, so the GIF is complete right after `close()`.
+    """
+
+    def __init__(self, path, duration_ms, sample_size=16, optimize=True):
+        self.path = path
+        self.duration_ms = duration_ms
+        self.sample_size = sample_size
+        self.optimize = optimize
+        self.pending = []
+        self.writer = None
+
+    def add_frame(self, image, label):
+        frame = annotate_frame(image, label)
+        if self.writer is None:
+            self.pending.append(frame)
+            if len(self.pending) >= self.sample_size:
+                self._start()
+        else:
+            self.writer.add_frame(frame)
+
+    def _start(self):
+        self.writer = StreamingGifWriter(self.path, build_palette(self.pending), self.duration_ms, optimize=self.optimize)
+        for frame in self.pending:
+            self.writer.add_frame(frame)
+        self.pending = []
+
+    def close(self):
+        """Finish the GIF, return True if one was written."""
+        if self.writer is None:
+            if not self.pending:
+                return False
+            self._start()
+        return self.writer.close()
+
+
+def _sample(items, count):
+    """Pick up to `count` evenly spaced items."""
+    if len(items) <= count:
+        return list(items)
+    step = len(items) / count
+    return [items[int(i * step)] for i in range(count)]
+
+
+# Palette of the frame-preparation worker processes, set by _init_worker
+_worker_palette = None
+
+
+def _init_worker(palette):
+    global _worker_palette
+    _worker_palette = Image.new('P', (1, 1))
+    _worker_palette.putpalette(palette)
+
+
+def prepare_frame(frame, palette_image=None):
+    """Decode, annotate and quantize a (source, label) frame, return its palette indices.
+
+    The source is a file path or a PackedFrameRef, see storage.open_frame.
+    """
+    source, label = frame
+    return quantize_to_palette(annotate_frame(open_frame(source), label), palette_image or _worker_palette)
+
+
+def _prepared_frames(frames, palette_image, workers):
+    """Yield the prepared frames in order, from a process pool when `workers` > 1.
+
+    At most two frames per worker are in flight, so memory does not grow with the session.
+    """
+    if workers <= 1:
+        for frame in frames:
+            yield prepare_frame(frame, palette_image)
+        return
+    with ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(palette_image.getpalette(),)) as executor:
+        in_flight = deque()
+        for frame in frames:
+            in_flight.append(executor.submit(prepare_frame, frame))
+            if len(in_flight) >= 2 * workers:
+                yield in_flight.popleft().result()
+        while in_flight:
+            yield in_flight.popleft().result()
+
+
+def write_gif(frames, gif_path, duration_ms, palette_sample=16, optimize=True, workers=1, progress=None):
+    """Write a GIF from a list of (source, label) pairs, decoding one frame at a time.
+
+    With `workers` > 1, decoding, annotation and quantization run in a process pool while
+    the frames are still written in the given order. Returns the number of frames written.
+    """
+    if not frames:
+        return 0
+    sample = []
+    for source, label in _sample(frames, palette_sample):
+        sample.append(annotate_frame(open_frame(source), label))
+    palette_image = build_palette(sample)
+    writer = StreamingGifWriter(gif_path, palette_image, duration_ms, optimize=optimize)
+    del sample
+
+    try:
+        for i, indices in enumerate(_prepared_frames(frames, palette_image, workers)):
+            writer.add_indices(indices)
+            if progress is not None:
+                progress(i + 1, len(frames))
+    except BaseException:
+        # Failed or cancelled by the progress callback
+        writer.abort()
+        raise
+    writer.close()
+    logging.info(f"Saved GIF animation: {gif_path} ({writer.stats()})")
+    return writer.frames
+
+
+def compare_with_pillow(images, duration_ms, palette_sample=16):
+    """Encode annotated RGB frames with Pillow's save_all and with the delta writer.
+
+    Returns the size in bytes and encoding time of both, for reporting the savings.
+    """
+    start = time.perf_counter()
+    buffer = io.BytesIO()
+    images[0].save(buffer, save_all=True, append_images=images[1:], format='GIF', duration=duration_ms, loop=0)
+    pillow = {'bytes': buffer.tell(), 'seconds': time.perf_counter() - start}
+
+    start = time.perf_counter()
+    with tempfile.TemporaryDirectory() as folder:
+        path = os.path.join(folder, GIF_NAME)
+        writer = StreamingGifWriter(path, build_palette(_sample(images, palette_sample)), duration_ms)
+        for image in images:
+            writer.add_frame(image)
+        writer.close()
+        streaming = {'bytes': os.path.getsize(path), 'seconds': time.perf_counter() - start}
+
+    return {
+        'frames': len(images),
+        'pillow': pillow,
+        'streaming_delta': streaming,
+        'size_ratio': streaming['bytes'] / pillow['bytes'],
+        'time_ratio': streaming['seconds'] / pillow['seconds'],
+    }
@@ -0,0 +1,98 @@
+"""HUD geometry of the Silica interface, expressed against a 1920x1080 reference screen."""
+
+import logging
+
+import cv2
+import numpy as np
+from PIL import Image
+
+REFERENCE_WIDTH = 1920
+REFERENCE_HEIGHT = 1080
+
+# Regions as (left, top, right, bottom) at the reference resolution
+REFERENCE_REGIONS = {
+    'chat': (20, 700, 75, 725),             # Chat prompt showing "Team" or "All" while typing
+    'time': (300, 50, 300 + 300, 50 + 42),  # "CURRENT MATCH MM:SS" label, only visible with the map open
+    'map': (638, 53, 638 + 974, 53 + 974),  # The full-screen map
+    'map_border': (638, 53, 638 + 974, 53 + 16),  # Top edge of the map, used to tell if it is open
+}
+
+# Where each region stays when the screen is not 16:9: against the left edge or centered
+REFERENCE_ANCHORS = {
+    'chat': 'left',
+    'time': 'left',
+    'map': 'center',
+    'map_border': 'center',
+}
+
+# OCR preprocessing: upscale factor, Gaussian blur and dilation kernel sizes (0 disables them)
+# and binary threshold level (0 uses Otsu's method)
+DEFAULT_PREPROCESS = {'upscale': 3.0, 'blur': 5, 'dilate': 2, 'threshold': 0}
+
+
+def scale_region(box, x_scale, y_scale):
+    """Scale a reference (left, top, right, bottom) box to the current screen."""
+    left, top, right, bottom = box
+    return (
+        int(left * x_scale),
+        int(top * y_scale),
+        int(right * x_scale),
+        int(bottom * y_scale)
+    )
+
+
+def scaled_regions(x_scale, y_scale):
+    """Return every HUD region scaled to the current screen."""
+    return {name: scale_region(box, x_scale, y_scale) for name, box in REFERENCE_REGIONS.items()}
+
+
+def anchored_region(name, width, height, ui_scale=1.0):
+    """Place a reference region on a screen of any aspect ratio.
+
+    The HUD is assumed to scale with the screen height (and the UI scale); regions keep
+    their vertical position and their anchor, the left edge or the center of the screen.
+    On a 16:9 screen at UI scale 1 this is the same as scaled_regions.
+    """
+    left, top, right, bottom = REFERENCE_REGIONS[name]
+    scale = height / REFERENCE_HEIGHT * ui_scale
+    y = top * height / REFERENCE_HEIGHT
+    if REFERENCE_ANCHORS[name] == 'center':
+        x = width / 2 + (left - REFERENCE_WIDTH / 2) * scale
+    else:
+        x = left * scale
+    return (int(x), int(y), int(x + (right - left) * scale), int(y + (bottom - top) * scale))
+
+
+def preprocess_image(image, params=None):
+    """Prepare a HUD crop for Tesseract: grayscale, upscale, blur, threshold and dilate.
+
+    `params` overrides DEFAULT_PREPROCESS, e.g. with the values tuned by calibration.
+    """
+    logging.debug("Preprocessing image for text extraction.")
+    params = dict(DEFAULT_PREPROCESS, **(params or {}))
+    # Convert the screenshot to grayscale
+    gray = cv2.cvtColor(np.array(image), cv2.COLOR_BGR2GRAY)
+
+    # Resize the image to enlarge the text
+    width = int(gray.shape[1] * params['upscale'])
+    height = int(gray.shape[0] * params['upscale'])
+    dim = (width, height)
+    resized = cv2.resize(gray, dim, interpolation=cv2.INTER_CUBIC)
+
+    # Apply Gaussian Blur to reduce noise
+    blur = int(params['blur'])
+    blurred = cv2.GaussianBlur(resized, (blur | 1, blur | 1), 0) if blur else resized
+
+    # Apply a binary threshold to make the text stand out more
+    if params['threshold']:
+        _, binary = cv2.threshold(blurred, params['threshold'], 255, cv2.THRESH_BINARY)
+    else:
+        _, binary = cv2.threshold(blurred, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+
+    # Apply dilation to make text thicker
+    dilate = int(params['dilate'])
+    dilated = cv2.dilate(binary, np.ones((dilate, dilate), np.uint8), iterations=1) if dilate else binary
+
+    # Convert back to PIL Image
+    processed_image = Image.fromarray(dilated)
+    return processed_image
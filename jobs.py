@@ -0,0 +1,144 @@
+"""Background jobs of the GUI: GIF and video generation, export copies and reprocessing.
+
+Jobs run on worker threads and never touch Tk. Their progress, results and any UI updates
+are posted to a queue that the Tk thread drains with `root.after`, so the window keeps
+responding while a long session is encoded, even during a new capture session.
+"""
+
+import queue
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+class JobCancelled(Exception):
+    """Raised inside a job when it was cancelled."""
+
+
+class Job:
+    """A function run on the job executor, called with the job to report progress and check for cancellation."""
+
+    def __init__(self, executor, name, function, on_done=None):
+        self.executor = executor
+        self.name = name
+        self.function = function
+        self.on_done = on_done
+        self.cancel_event = threading.Event()
+        self.done = 0
+        self.total = 0
+        self.message = None
+        self.status = 'queued'  # queued, running, done, failed or cancelled
+
+    def cancel(self):
+        self.cancel_event.set()
+
+    @property
+    def cancelled(self):
+        return self.cancel_event.is_set()
+
+    def check_cancelled(self):
+        if self.cancel_event.is_set():
+            raise JobCancelled(self.name)
+
+    def progress(self, done, total, message=None):
+        """Report progress, raise JobCancelled if the job was cancelled.
+
+        Matches the `progress(done, total)` callbacks of write_gif, write_video and replay.
+        """
+        self.check_cancelled()
+        self.executor.post(('progress', self, (done, total, message)))
+
+
+class JobExecutor:
+    """Run jobs on a small thread pool and dispatch their events on the Tk thread.
+
+    `on_progress(job)` is called on the Tk thread whenever a job reports progress or
+    finishes; `on_done(job, result, error)` of a job is called once it has finished.
+    """
+
+    def __init__(self, root, workers=2, poll_interval_ms=100, on_progress=None):
+        self.root = root
+        self.poll_interval_ms = poll_interval_ms
+        self.on_progress = on_progress
+        self.pool = ThreadPoolExecutor(workers, thread_name_prefix='job')
+        self.events = queue.SimpleQueue()
+        self.jobs = []  # Queued and running jobs
+        self.root.after(self.poll_interval_ms, self.poll)
+
+    def submit(self, name, function, on_done=None):
+        """Run `function(job)` in the background and return the job. Call from the Tk thread."""
+        job = Job(self, name, function, on_done)
+        self.jobs.append(job)
+        self.pool.submit(self._run, job)
+        logging.info(f"Job queued: {name}")
+        return job
+
+    def post(self, event):
+        self.events.put(event)
+
+    def call_soon(self, function, *args, **kwargs):
+        """Run `function` on the Tk thread, the thread-safe way for other threads to update widgets."""
+        self.events.put(('call', function, (args, kwargs)))
+
+    def _run(self, job):
+        if job.cancelled:
+            self.post(('finished', job, ('cancelled', None, None)))
+            return
+        self.post(('started', job, None))
+        try:
+            result = job.function(job)
+        except JobCancelled:
+            logging.info(f"Job cancelled: {job.name}")
+            self.post(('finished', job, ('cancelled', None, None)))
+        except Exception as e:
+            logging.error(f"Job failed: {job.name}: {e}")
+            self.post(('finished', job, ('failed', None, e)))
+        else:
+            self.post(('finished', job, ('done', result, None)))
+
+    def poll(self):
+        """Dispatch the queued events, then schedule the next poll like update_elapsed_time."""
+        try:
+            while True:
+                kind, target, data = self.events.get_nowait()
+                try:
+                    self._dispatch(kind, target, data)
+                except Exception as e:
+                    logging.error(f"Failed to handle job event '{kind}': {e}")
+        except queue.Empty:
+            pass
+        self.root.after(self.poll_interval_ms, self.poll)
+
+    def _dispatch(self, kind, target, data):
+        if kind == 'call':
+            args, kwargs = data
+            target(*args, **kwargs)
+            return
+        job = target
+        if kind == 'started':
+            job.status = 'running'
+        elif kind == 'progress':
+            job.done, job.total, message = data
+            if message is not None:
+                job.message = message
+        elif kind == 'finished':
+            job.status, result, error = data
+            if job in self.jobs:
+                self.jobs.remove(job)
+            if job.on_done is not None:
+                job.on_done(job, result, error)
+        if self.on_progress is not None:
+            self.on_progress(job)
+
+    def active(self, name=None):
+        """Queued and running jobs, optionally only those named `name`."""
+        return [job for job in self.jobs if name is None or job.name == name]
+
+    def cancel_all(self):
+        for job in self.jobs:
+            job.cancel()
+
+    def shutdown(self):
+        """Cancel every job and stop the pool without waiting for the running ones."""
+        self.cancel_all()
+        self.pool.shutdown(wait=False)
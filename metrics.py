@@ -0,0 +1,232 @@
+"""Hot-path instrumentation: rolling histograms, counters and gauges.
+
+Metrics can be read from a Prometheus-style text endpoint on localhost and from a JSON
+snapshot written periodically to the session folder. Logging goes through a queue, so
+the capture thread never waits for the log file or the console.
+"""
+
+import os
+import json
+import queue
+import atexit
+import logging
+import threading
+from collections import deque
+from logging.handlers import QueueHandler, QueueListener
+
+import numpy as np
+
+
+QUANTILES = (0.5, 0.9, 0.95, 0.99)
+
+
+def start_logging_queue(handlers, level=logging.DEBUG, fmt='%(asctime)s - %(levelname)s - %(message)s'):
+    """Route the root logger through a queue, with `handlers` run on a listener thread.
+
+    Returns the started QueueListener, which is stopped (and drained) at exit.
+    """
+    formatter = logging.Formatter(fmt)
+    for handler in handlers:
+        handler.setFormatter(formatter)
+    log_queue = queue.SimpleQueue()
+    root = logging.getLogger()
+    root.setLevel(level)
+    root.addHandler(QueueHandler(log_queue))
+    listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+    return listener
+
+
+def _metric_key(name, labels):
+    return (name, tuple(sorted(labels.items())))
+
+
+def _format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{key}="{value}"' for key, value in pairs) + '}'
+
+
+class RollingHistogram:
+    """Quantiles over the last `window` observations, with a count and sum since the start."""
+
+    def __init__(self, window=1024):
+        self.samples = deque(maxlen=window)
+        self.count = 0
+        self.total = 0.0
+
+    def observe(self, value):
+        self.samples.append(value)
+        self.count += 1
+        self.total += value
+
+    def summary(self):
+        summary = {'count': self.count, 'sum': self.total}
+        if self.samples:
+            samples = np.fromiter(self.samples, dtype=np.float64, count=len(self.samples))
+            summary['mean'] = float(samples.mean())
+            summary['max'] = float(samples.max())
+            for quantile, value in zip(QUANTILES, np.quantile(samples, QUANTILES)):
+                summary[f"p{int(quantile * 100)}"] = float(value)
+        return summary
+
+
+class MetricsRegistry:
+    """Thread-safe store of the counters, rolling histograms and gauges of the app.
+
+    Metrics are identified by a name and optional labels, e.g.
+    `observe('stage_seconds', 0.012, stage='ocr')`. Gauges are callables read when
+    the metrics are exported, so queue depths are never stale.
+    """
+
+    def __init__(self, window=1024):
+        self.window = window
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.histograms = {}
+        self.gauges = {}
+
+    def increment(self, name, amount=1, **labels):
+        key = _metric_key(name, labels)
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    def observe(self, name, value, **labels):
+        key = _metric_key(name, labels)
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = RollingHistogram(self.window)
+            histogram.observe(value)
+
+    def set_gauge(self, name, function, **labels):
+        """Register a callable returning the current value of a gauge."""
+        with self.lock:
+            self.gauges[_metric_key(name, labels)] = function
+
+    def _gauge_values(self):
+        with self.lock:
+            gauges = list(self.gauges.items())
+        values = []
+        for key, function in gauges:
+            try:
+                values.append((key, float(function())))
+            except Exception as e:
+                logging.debug(f"Failed to read gauge {key[0]}: {e}")
+        return values
+
+    def snapshot(self):
+        """All metrics as a JSON-serializable dict."""
+        def name_of(key):
+            return key[0] + _format_labels(key[1])
+
+        with self.lock:
+            counters = {name_of(key): value for key, value in self.counters.items()}
+            histograms = {name_of(key): histogram.summary() for key, histogram in self.histograms.items()}
+        gauges = {name_of(key): value for key, value in self._gauge_values()}
+        return {'counters': counters, 'histograms': histograms, 'gauges': gauges}
+
+    def render_prometheus(self, prefix='silica_'):
+        """All metrics in the Prometheus text exposition format; histograms are exported as summaries."""
+        lines = []
+        with self.lock:
+            counters = sorted(self.counters.items())
+            histograms = sorted((key, histogram.summary()) for key, histogram in self.histograms.items())
+        typed = set()
+
+        def declare(name, kind):
+            if name not in typed:
+                typed.add(name)
+                lines.append(f"# TYPE {name} {kind}")
+
+        for (name, labels), value in counters:
+            declare(prefix + name, 'counter')
+            lines.append(f"{prefix}{name}{_format_labels(labels)} {value}")
+        for (name, labels), summary in histograms:
+            declare(prefix + name, 'summary')
+            for quantile in QUANTILES:
+                value = summary.get(f"p{int(quantile * 100)}")
+                if value is not None:
+                    lines.append(f"{prefix}{name}{_format_labels(labels, [('quantile', quantile)])} {value}")
+            lines.append(f"{prefix}{name}_sum{_format_labels(labels)} {summary['sum']}")
+            lines.append(f"{prefix}{name}_count{_format_labels(labels)} {summary['count']}")
+        for (name, labels), value in sorted(self._gauge_values()):
+            declare(prefix + name, 'gauge')
+            lines.append(f"{prefix}{name}{_format_labels(labels)} {value}")
+        return '\n'.join(lines) + '\n'
+
+
+class MetricsServer:
+    """Serve `/metrics` of a registry on localhost from a daemon thread."""
+
+    def __init__(self, registry, port=9464, host='127.0.0.1'):
+        # The endpoint is off by default, so the HTTP server is only loaded when it is used
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0] != '/metrics':
+                    self.send_error(404)
+                    return
+                body = registry.render_prometheus().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass  # Scrapes would flood the debug log
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, name='metrics-server', daemon=True)
+
+    @property
+    def port(self):
+        return self.server.server_address[1]
+
+    def start(self):
+        self.thread.start()
+        logging.info(f"Metrics available at http://127.0.0.1:{self.port}/metrics")
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class SnapshotWriter:
+    """Write the registry snapshot to a JSON file every `interval` seconds, and once more when stopped."""
+
+    def __init__(self, registry, path, interval=30.0):
+        self.registry = registry
+        self.path = path
+        self.interval = interval
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self._run, name='metrics-snapshot', daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def write(self):
+        temp_path = self.path + '.part'
+        with open(temp_path, 'w') as f:
+            json.dump(self.registry.snapshot(), f, indent=1)
+        os.replace(temp_path, self.path)
+
+    def _run(self):
+        while not self.stop_event.wait(self.interval):
+            try:
+                self.write()
+            except Exception as e:
+                logging.error(f"Failed to write metrics snapshot: {e}")
+
+    def stop(self):
+        self.stop_event.set()
+        self.thread.join()
+        try:
+            self.write()
+        except Exception as e:
+            logging.error(f"Failed to write metrics snapshot: {e}")
@@ -0,0 +1,217 @@
+"""OCR service keeping the Tesseract engine warm and batching requests.
+
+pytesseract starts a new `tesseract` process, writes temporary files and reloads the
+language model on every call. The service instead owns a long-lived engine on a worker
+thread fed by a request queue, and recognizes every request queued at the same time in
+a single engine call:
+
+- `tesserocr` (optional): in-process Tesseract API, the model is loaded once.
+- `cli`: the `tesseract` binary run once per batch on a list of images.
+"""
+
+import os
+import queue
+import shutil
+import logging
+import tempfile
+import threading
+import subprocess
+from concurrent.futures import Future
+
+import numpy as np
+from PIL import Image
+
+
+def _to_pil(image):
+    return Image.fromarray(image) if isinstance(image, np.ndarray) else image
+
+
+class OcrEngine:
+    """Base class: recognize a batch of images with the same page segmentation mode."""
+
+    name = 'base'
+
+    def recognize_batch(self, images, psm=7):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class TesserocrEngine(OcrEngine):
+    """In-process Tesseract through the optional `tesserocr` binding."""
+
+    name = 'tesserocr'
+
+    def __init__(self, lang='eng'):
+        import tesserocr
+        self.api = tesserocr.PyTessBaseAPI(lang=lang)
+
+    def recognize_batch(self, images, psm=7):
+        self.api.SetPageSegMode(psm)
+        texts = []
+        for image in images:
+            self.api.SetImage(_to_pil(image))
+            texts.append(self.api.GetUTF8Text())
+        return texts
+
+    def close(self):
+        self.api.End()
+
+
+class TesseractCliEngine(OcrEngine):
+    """The `tesseract` binary, started once per batch with a list file of images."""
+
+    name = 'cli'
+
+    def __init__(self, lang='eng', tesseract_cmd=None):
+        if tesseract_cmd is None:
+            try:
+                import pytesseract
+                tesseract_cmd = pytesseract.pytesseract.tesseract_cmd
+            except ImportError:
+                tesseract_cmd = 'tesseract'
+        self.tesseract_cmd = tesseract_cmd
+        self.lang = lang
+        # Do not flash a console window for every batch on Windows
+        self.creationflags = getattr(subprocess, 'CREATE_NO_WINDOW', 0)
+        self.temp_folder = tempfile.mkdtemp(prefix='silica_ocr_')
+
+    def _run(self, input_path, psm):
+        result = subprocess.run(
+            [self.tesseract_cmd, input_path, 'stdout', '-l', self.lang, '--psm', str(psm)],
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE, creationflags=self.creationflags
+        )
+        if result.returncode != 0:
+            raise RuntimeError(f"tesseract failed: {result.stderr.decode(errors='replace').strip()}")
+        return result.stdout.decode('utf-8', errors='replace')
+
+    def recognize_batch(self, images, psm=7):
+        paths = []
+        for i, image in enumerate(images):
+            path = os.path.join(self.temp_folder, f"roi_{i}.png")
+            _to_pil(image).save(path, compress_level=0)
+            paths.append(path)
+        if len(paths) == 1:
+            return [self._run(paths[0], psm)]
+
+        list_path = os.path.join(self.temp_folder, 'batch.txt')
+        with open(list_path, 'w') as f:
+            f.write('\n'.join(paths) + '\n')
+        # Tesseract ends every page of a multi-image input with a form feed
+        pages = self._run(list_path, psm).split('\f')
+        if len(pages) < len(paths):
+            logging.warning("Unexpected tesseract batch output, recognizing images one by one.")
+            return [self._run(path, psm) for path in paths]
+        return pages[:len(paths)]
+
+    def close(self):
+        shutil.rmtree(self.temp_folder, ignore_errors=True)
+
+
+def create_ocr_engine(name='auto', lang='eng'):
+    """Create an OCR engine by name: 'tesserocr', 'cli', or 'auto' (tesserocr when installed)."""
+    if name in ('auto', 'tesserocr'):
+        try:
+            return TesserocrEngine(lang)
+        except ImportError:
+            if name == 'tesserocr':
+                raise
+            logging.warning("tesserocr is not installed, using the slower tesseract command line in batches.")
+    if name in ('auto', 'cli'):
+        return TesseractCliEngine(lang)
+    raise ValueError(f"Unknown OCR engine: {name}")
+
+
+class OcrService:
+    """Serve OCR requests from a single warm engine on a worker thread.
+
+    Requests queued while the engine is busy are merged into one batch of up to
+    `max_batch` images, so each tick or offline folder costs one engine call.
+    """
+
+    def __init__(self, engine_name='auto', lang='eng', max_batch=32):
+        self.engine_name = engine_name
+        self.lang = lang
+        self.max_batch = max_batch
+        self.requests = queue.Queue()
+        self.engine = None
+        self.thread = None
+        self.lock = threading.Lock()
+        self.calls = 0
+        self.images = 0
+
+    def _ensure_started(self):
+        with self.lock:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, name='ocr-service', daemon=True)
+                self.thread.start()
+
+    def submit(self, images, psm=7):
+        """Queue a list of images, return a Future resolving to the list of their texts."""
+        self._ensure_started()
+        future = Future()
+        self.requests.put((list(images), psm, future))
+        return future
+
+    def recognize_batch(self, images, psm=7):
+        """Recognize a list of images in one request and return their texts."""
+        if not images:
+            return []
+        return self.submit(images, psm).result()
+
+    def recognize(self, image, psm=7):
+        """Recognize a single image and return its text."""
+        return self.recognize_batch([image], psm)[0]
+
+    def close(self):
+        if self.thread is not None:
+            self.requests.put(None)
+            self.thread.join()
+            self.thread = None
+
+    def _run(self):
+        try:
+            self.engine = create_ocr_engine(self.engine_name, self.lang)
+            logging.info(f"OCR engine started: {self.engine.name}")
+        except Exception as e:
+            logging.error(f"Failed to start OCR engine: {e}")
+        while True:
+            request = self.requests.get()
+            if request is None:
+                break
+            batch = [request]
+            count = len(request[0])
+            # Merge whatever else is already waiting into the same engine call
+            while count < self.max_batch:
+                try:
+                    request = self.requests.get_nowait()
+                except queue.Empty:
+                    break
+                if request is None:
+                    self.requests.put(None)
+                    break
+                batch.append(request)
+                count += len(request[0])
+            self._process(batch)
+        if self.engine is not None:
+            self.engine.close()
+
+    def _process(self, batch):
+        for psm in {request[1] for request in batch}:
+            requests = [request for request in batch if request[1] == psm]
+            images = [image for request in requests for image in request[0]]
+            try:
+                if self.engine is None:
+                    raise RuntimeError("OCR engine is not available")
+                texts = self.engine.recognize_batch(images, psm)
+                self.calls += 1
+                self.images += len(images)
+            except Exception as e:
+                for _, _, future in requests:
+                    future.set_exception(e)
+                continue
+            offset = 0
+            for request_images, _, future in requests:
+                future.set_result(texts[offset:offset + len(request_images)])
+                offset += len(request_images)
@@ -0,0 +1,251 @@
+"""Drift-free tick scheduling and bounded worker stages for the capture pipeline."""
+
+import time
+import heapq
+import queue
+import logging
+import threading
+from collections import deque
+
+
+class TickScheduler:
+    """Schedule ticks on the monotonic clock at fixed deadlines.
+
+    Deadlines are computed as start + n * interval, so processing time never adds
+    up into drift. When a tick overruns past one or more deadlines, those are counted
+    as missed and skipped instead of being fired in a burst.
+    """
+
+    def __init__(self, interval, history=1000, clock=time.monotonic):
+        self.interval = None
+        self.set_interval(interval)
+        self.clock = clock
+        self.next_deadline = None
+        self.ticks = 0
+        self.missed_deadlines = 0
+        self.jitter = deque(maxlen=history)  # seconds between each deadline and the actual tick
+
+    def start(self, delay=0):
+        self.next_deadline = self.clock() + delay
+
+    def set_interval(self, interval):
+        """Change the interval, effective from the deadline after the next one."""
+        if not interval > 0:
+            raise ValueError(f"The tick interval must be positive, got {interval}")
+        self.interval = interval
+
+    def wait(self, stop_event):
+        """Sleep until the next deadline. Return the tick's monotonic time, or None if `stop_event` was set."""
+        now = self.clock()
+        if now > self.next_deadline + self.interval:
+            missed = int((now - self.next_deadline) // self.interval)
+            self.missed_deadlines += missed
+            self.next_deadline += missed * self.interval
+            logging.warning(f"Capture fell behind, skipped {missed} tick(s).")
+
+        remaining = self.next_deadline - now
+        if remaining > 0 and stop_event.wait(remaining):
+            return None
+        if stop_event.is_set():
+            return None
+
+        tick_time = self.clock()
+        self.jitter.append(tick_time - self.next_deadline)
+        self.ticks += 1
+        self.next_deadline += self.interval
+        return tick_time
+
+    def stats(self):
+        """Return tick count, missed deadlines and jitter statistics in milliseconds."""
+        samples = sorted(self.jitter)
+        stats = {
+            'ticks': self.ticks,
+            'missed_deadlines': self.missed_deadlines,
+            'jitter_mean_ms': 0.0,
+            'jitter_p95_ms': 0.0,
+            'jitter_max_ms': 0.0,
+        }
+        if samples:
+            stats['jitter_mean_ms'] = 1000 * sum(samples) / len(samples)
+            stats['jitter_p95_ms'] = 1000 * samples[min(int(len(samples) * 0.95), len(samples) - 1)]
+            stats['jitter_max_ms'] = 1000 * samples[-1]
+        return stats
+
+
+class FrameJob:
+    """A captured tick travelling through the pipeline stages."""
+
+    def __init__(self, index, capture_time, wall_time):
+        self.index = index
+        self.sequence = None              # Submission order, assigned by the pipeline
+        self.capture_time = capture_time  # time.monotonic() of the grab
+        self.wall_time = wall_time        # time.time() of the grab
+        self.screen_size = None           # (width, height) of the screen the regions were grabbed from
+        self.regions = {}                 # Copies of the captured RGB regions, saved by the pipeline
+        self.probes = {}                  # Extra crops used for detection only, never saved
+        self.elapsed_time = None          # In-game time as MM_SS, filled by the capture thread or the OCR stage
+        self.time_reading = None          # TimerReading the time comes from
+        self.chat = None                  # ChatDetection of the tick
+        self.map_filename = None
+        self.time_crop_filename = None
+        self.map_toggled = False
+        self.burst = False                # Frame of the burst ring buffer rather than a tick
+        self.change = None                # FrameChange from the change detection stage
+        self.encoded = {}                 # {filename: bytes} produced by the encode stage
+        self.debug = {}                   # HUD crops for the debug ring buffer, only saved on failures
+
+
+_STOP = object()
+
+
+class Stage:
+    """A pool of worker threads consuming a bounded queue.
+
+    Each item is passed to `handler`; a non-None result is forwarded to the next
+    stage, blocking while it is full so that back-pressure stays inside the pipeline.
+    An `ordered` stage puts items back in submission order before queueing them,
+    which upstream stages with several workers do not preserve.
+    """
+
+    def __init__(self, name, handler, workers=1, maxsize=8, ordered=False):
+        self.name = name
+        self.handler = handler
+        self.workers = max(int(workers), 1)
+        self.queue = queue.Queue(maxsize=maxsize)
+        self.next_stage = None
+        self.on_error = None  # Called with (stage name, item, exception) when the handler fails
+        self.metrics = None   # MetricsRegistry receiving the handler durations
+        self.threads = []
+        self.processed = 0
+        self.dropped = 0
+        self.failed = 0
+        self._lock = threading.Lock()
+        # Serializes the hand-over of ordered items; only producers take it, so they may block on the queue holding it
+        self._order_lock = threading.Lock()
+        self.ordered = ordered
+        self.pending = []  # Heap of (sequence, item) waiting for earlier items
+        self.next_sequence = 0
+        self.max_pending = maxsize
+
+    def start(self):
+        self.threads = [
+            threading.Thread(target=self._run, name=f"{self.name}-{i}", daemon=True)
+            for i in range(self.workers)
+        ]
+        for thread in self.threads:
+            thread.start()
+
+    def submit(self, item, block=False):
+        """Queue an item. When not blocking and the queue is full, the item is dropped and False returned."""
+        if self.ordered:
+            return self._submit_ordered(item)
+        try:
+            self.queue.put(item, block=block)
+            return True
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+            logging.warning(f"Pipeline stage '{self.name}' is full, dropping frame.")
+            return False
+
+    def _submit_ordered(self, item):
+        # The workers take `_lock` for their counters, so the queue is never waited on while holding it
+        with self._order_lock:
+            ready = []
+            with self._lock:
+                heapq.heappush(self.pending, (item.sequence, id(item), item))
+                if len(self.pending) > self.max_pending:
+                    # An earlier item was lost upstream, stop waiting for it
+                    logging.warning(f"Pipeline stage '{self.name}' skipped missing item {self.next_sequence}.")
+                    self.next_sequence = self.pending[0][0]
+                while self.pending and self.pending[0][0] <= self.next_sequence:
+                    ready.append(heapq.heappop(self.pending)[2])
+                    self.next_sequence = ready[-1].sequence + 1
+            for ready_item in ready:
+                self.queue.put(ready_item)
+        return True
+
+    def stop(self):
+        """Let the workers drain the queue, then join them."""
+        with self._order_lock:
+            with self._lock:
+                ready = [heapq.heappop(self.pending)[2] for _ in range(len(self.pending))]
+            for ready_item in ready:
+                self.queue.put(ready_item)
+        for _ in self.threads:
+            self.queue.put(_STOP)
+        for thread in self.threads:
+            thread.join()
+        self.threads = []
+
+    def _run(self):
+        while True:
+            item = self.queue.get()
+            if item is _STOP:
+                break
+            try:
+                start = time.perf_counter()
+                result = self.handler(item)
+                if self.metrics is not None:
+                    self.metrics.observe('stage_seconds', time.perf_counter() - start, stage=self.name)
+                with self._lock:
+                    self.processed += 1
+                if result is not None and self.next_stage is not None:
+                    self.next_stage.submit(result, block=True)
+            except Exception as e:
+                with self._lock:
+                    self.failed += 1
+                logging.error(f"Pipeline stage '{self.name}' failed: {e}")
+                if self.on_error is not None:
+                    self.on_error(self.name, item, e)
+
+    def stats(self):
+        return {
+            'depth': self.queue.qsize(),
+            'processed': self.processed,
+            'dropped': self.dropped,
+            'failed': self.failed,
+        }
+
+
+class Pipeline:
+    """A chain of stages; only the first stage is fed directly, without ever blocking the caller."""
+
+    def __init__(self, stages, on_error=None, metrics=None):
+        self.stages = stages
+        self.next_sequence = 0
+        for stage, next_stage in zip(stages, stages[1:]):
+            stage.next_stage = next_stage
+        for stage in stages:
+            stage.on_error = on_error
+            stage.metrics = metrics
+
+    def start(self):
+        for stage in self.stages:
+            stage.start()
+
+    def submit(self, item):
+        """Feed the first stage from the single producer thread, never blocking."""
+        item.sequence = self.next_sequence
+        accepted = self.stages[0].submit(item, block=False)
+        if accepted:
+            self.next_sequence += 1
+        return accepted
+
+    def submit_to(self, stage_name, item):
+        """Feed a later stage directly, from any thread, blocking while it is full.
+
+        The item skips the earlier stages and gets no sequence, so the stage must not be ordered.
+        """
+        for stage in self.stages:
+            if stage.name == stage_name:
+                return stage.submit(item, block=True)
+        raise KeyError(stage_name)
+
+    def stop(self):
+        """Drain and stop the stages in order, so every accepted frame is processed."""
+        for stage in self.stages:
+            stage.stop()
+
+    def stats(self):
+        return {stage.name: stage.stats() for stage in self.stages}
@@ -0,0 +1,412 @@
+"""Headless offline replay and reprocessing of recorded frames.
+
+Runs the chat detector and the timer reader of the app without Tk or a screen, spread
+over a process pool, then writes the session index and rebuilds the GIF:
+
+- screenshots: a folder of full-resolution recorded screenshots becomes a new session,
+  with a map frame for every screenshot where the match timer is visible.
+- session: a previous session is re-timed from its saved time crops and re-indexed.
+  Frame files keep their names, the rewritten index is what GIF generation reads.
+
+Usage:
+    python replay.py screenshots <screenshots folder> <new session folder> [--workers N] [--no-gif] [--config FILE]
+    python replay.py session <session folder> [--workers N] [--no-gif] [--config FILE]
+"""
+
+import os
+import sys
+import time
+import hashlib
+import logging
+import argparse
+import configparser
+from functools import partial
+from multiprocessing import util
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from hud import REFERENCE_WIDTH, REFERENCE_HEIGHT, REFERENCE_REGIONS, preprocess_image
+from calibration import PROFILE_FILENAME, load_profile, reference_profile
+from capture import FileCaptureBackend
+from detection import ChatStateDetector
+from timer_reader import TimerReader, parse_time_text
+from ocr import OcrService
+from pipeline import FrameJob
+from storage import CODEC_EXTENSIONS, FrameStore, open_frame
+from session_index import TIME_CROPS_FOLDER, frame_record, load_index, legacy_records, write_index, interpolate_times, gif_frames
+from debug_capture import DEBUG_FOLDER
+from gif_export import GIF_NAME, write_gif
+
+
+def _config_path(path):
+    return os.path.normpath(path.strip().strip('"'))
+
+
+def load_settings(config_path='config.ini'):
+    """Read the detection, storage and GIF settings of the app from its config file."""
+    config = configparser.ConfigParser()
+    config.read(config_path)
+    defaults = config['DEFAULT']
+    return {
+        'chat_templates_folder': _config_path(defaults.get('chat_templates_folder', 'templates/chat')),
+        'chat_match_threshold': defaults.getfloat('chat_match_threshold', 0.8),
+        'chat_reject_threshold': defaults.getfloat('chat_reject_threshold', 0.5),
+        'chat_ocr_fallback': defaults.getboolean('chat_ocr_fallback', True),
+        'timer_atlas_folder': _config_path(defaults.get('timer_atlas_folder', 'templates/timer')),
+        'timer_min_confidence': defaults.getfloat('timer_min_confidence', 0.5),
+        'hud_profile_file': _config_path(defaults.get('hud_profile_file', PROFILE_FILENAME)),
+        'ui_scale': defaults.getfloat('ui_scale', 1.0),
+        'ocr_engine': defaults.get('ocr_engine', 'auto'),
+        'ocr_lang': defaults.get('ocr_lang', 'eng'),
+        'frame_codec': defaults.get('frame_codec', 'png'),
+        'png_compress_level': defaults.getint('png_compress_level', 1),
+        'gif_frame_duration': defaults.getfloat('gif_frame_duration', 0.5),
+        'gif_palette_sample': defaults.getint('gif_palette_sample', 16),
+        'gif_delta_frames': defaults.getboolean('gif_delta_frames', True),
+    }
+
+
+class FrameAnalyzer:
+    """The chat detector and timer reader of the app, with the same OCR fallbacks and HUD profile.
+
+    While `deferred` is a dict, the fallbacks collect their crops in it instead of running OCR
+    and count them in `deferrals`; `recognize_deferred` then recognizes all of them in one
+    batch. The texts are kept by crop hash, so the same crop is never recognized twice.
+    """
+
+    def __init__(self, settings, resolution):
+        self.hud_profile = (
+            load_profile(settings['hud_profile_file'], resolution, settings['ui_scale']) or reference_profile(resolution)
+        )
+        self.ocr = OcrService(settings['ocr_engine'], lang=settings['ocr_lang'])
+        self.deferred = None
+        self.deferrals = 0
+        self.texts = {}
+        self.chat_detector = ChatStateDetector(
+            settings['chat_templates_folder'],
+            match_threshold=settings['chat_match_threshold'],
+            reject_threshold=settings['chat_reject_threshold'],
+            fallback=self.read_chat_crop if settings['chat_ocr_fallback'] else None
+        )
+        self.timer_reader = TimerReader(
+            settings['timer_atlas_folder'], resolution,
+            min_confidence=settings['timer_min_confidence'],
+            fallback=self.read_time_crop
+        )
+
+    def recognize(self, kind, crop):
+        """Text of a 'time' or 'chat' crop: batched, deferred (empty text) or recognized on its own."""
+        key = (kind, hashlib.sha1(crop.tobytes()).digest())
+        if key in self.texts:
+            return self.texts[key]
+        if self.deferred is not None:
+            self.deferred[key] = crop
+            self.deferrals += 1
+            return ''
+        image = preprocess_image(crop, self.hud_profile.preprocess_params(kind))
+        return self.ocr.recognize(image, psm=7)
+
+    def recognize_deferred(self):
+        """Recognize the deferred crops in a single OCR request and stop deferring."""
+        deferred, self.deferred = self.deferred, None
+        if not deferred:
+            return
+        keys = list(deferred)
+        try:
+            images = [preprocess_image(deferred[key], self.hud_profile.preprocess_params(key[0])) for key in keys]
+            self.texts.update(zip(keys, self.ocr.recognize_batch(images, psm=7)))
+        except Exception as e:
+            logging.error(f"Exception occurred during batched text extraction: {e}")
+
+    def read_time_crop(self, crop):
+        """OCR fallback of the timer reader."""
+        try:
+            return parse_time_text(self.recognize('time', crop).strip())
+        except Exception as e:
+            logging.error(f"Exception occurred during time extraction: {e}")
+        return None
+
+    def read_chat_crop(self, crop):
+        """OCR fallback of the chat detector."""
+        try:
+            chat_text = self.recognize('chat', crop).strip().lower()
+        except Exception as e:
+            logging.error(f"Exception occurred during chat extraction: {e}")
+            return None
+        for label in ('team', 'all'):
+            if label in chat_text:
+                return label
+        return None
+
+    def close(self):
+        self.ocr.close()
+
+
+# Settings and analyzers (one per screen resolution) of the current process, set by _init_worker
+_settings = None
+_analyzers = {}
+# Set during the first pass of a chunk, when the OCR fallbacks are deferred
+_deferring = False
+
+# Frames per chunk: the OCR fallbacks of a chunk are recognized in one batch
+CHUNK_SIZE = 16
+
+
+def _init_worker(settings):
+    global _settings
+    _settings = settings
+    # Stop the OCR engines when a pool worker exits, atexit does not run in pool processes
+    util.Finalize(None, _close_analyzers, exitpriority=10)
+
+
+def _close_analyzers():
+    for analyzer in _analyzers.values():
+        analyzer.close()
+    _analyzers.clear()
+
+
+def _get_analyzer(resolution):
+    if resolution not in _analyzers:
+        _analyzers[resolution] = FrameAnalyzer(_settings, resolution)
+    analyzer = _analyzers[resolution]
+    if _deferring and analyzer.deferred is None:
+        analyzer.deferred = {}
+    return analyzer
+
+
+def _resolution_from_time_crop(crop):
+    """Screen resolution a time-region crop was captured at, for sessions that did not record it.
+
+    Only right for crops of the reference layout, not of a calibrated HUD profile.
+    """
+    left, top, right, bottom = REFERENCE_REGIONS['time']
+    return (
+        round(crop.shape[1] * REFERENCE_WIDTH / (right - left)),
+        round(crop.shape[0] * REFERENCE_HEIGHT / (bottom - top))
+    )
+
+
+def analyze_screenshot(task):
+    """Read the chat and timer of a recorded screenshot, save its map and time crop, return its index record.
+
+    Returns None when an OCR fallback was deferred, the screenshot is analyzed again after the batch.
+    """
+    index, path, session_folder = task
+    backend = FileCaptureBackend([path])
+    backend.next_frame()
+    width, height = backend.screen_size()
+    analyzer = _get_analyzer((width, height))
+    deferrals = analyzer.deferrals
+    regions = analyzer.hud_profile.regions
+    frames = backend.grab({'chat': regions['chat'], 'time': regions['time'], 'map': regions['map']})
+
+    # Recorded screenshots have no capture clock, their modification time stands in for it
+    capture_time = os.path.getmtime(path)
+    job = FrameJob(index, capture_time, capture_time)
+    job.screen_size = (width, height)
+    job.chat = analyzer.chat_detector.detect(frames['chat'])
+    filename = time_crop = None
+    if job.chat.state is None:
+        job.time_reading = analyzer.timer_reader.read(frames['time'])
+        job.elapsed_time = job.time_reading.text
+    if analyzer.deferrals != deferrals:
+        return None
+    # The timer is only displayed with the map open
+    if job.elapsed_time:
+        store = FrameStore(session_folder, _settings['frame_codec'], _settings['png_compress_level'])
+        filename, data = store.encode(f"map_{index}_{job.elapsed_time}", frames['map'])
+        store.write(filename, data)
+        time_crop, data = store.encode(os.path.join(TIME_CROPS_FOLDER, f"time_{index}"), frames['time'])
+        store.write(time_crop, data)
+    record = frame_record(job, filename, time_crop=time_crop)
+    record['source'] = os.path.basename(path)
+    return record
+
+
+def _load_debug_crop(session_folder, names, index):
+    """Load the first saved debug crop of a frame among `names`, or None."""
+    for name in names:
+        for extension in CODEC_EXTENSIONS.values():
+            path = os.path.join(session_folder, DEBUG_FOLDER, f"{name}_{index}{extension}")
+            if os.path.exists(path):
+                return open_frame(path)
+    return None
+
+
+def _load_time_crop(session_folder, record):
+    """Load the time crop saved with a frame's map, or its debug crop for sessions from before `time_crops`."""
+    if record.get('time_crop'):
+        path = os.path.join(session_folder, record['time_crop'])
+        if os.path.exists(path):
+            return open_frame(path)
+    return _load_debug_crop(session_folder, ['map_time_region', 'time_region'], record['frame'])
+
+
+def reread_record(task):
+    """Re-read the chat and timer of a session frame from its saved crops.
+
+    Returns (updated record, whether a time crop was re-read), or None when an OCR fallback was
+    deferred, the frame is read again after the batch.
+    """
+    record, session_folder = task
+    time_crop = _load_time_crop(session_folder, record)
+    chat_crop = _load_debug_crop(session_folder, ['chat_region'], record['frame'])
+    # The analyzer is picked by the screen resolution of the frame, frames without a time crop are left as they are
+    if time_crop is not None:
+        time_crop = np.asarray(time_crop)
+        screen_size = record.get('screen_size')
+        analyzer = _get_analyzer(tuple(screen_size) if screen_size else _resolution_from_time_crop(time_crop))
+        deferrals = analyzer.deferrals
+        reading = analyzer.timer_reader.read(time_crop)
+        chat = analyzer.chat_detector.detect(np.asarray(chat_crop)) if chat_crop is not None else None
+        if analyzer.deferrals != deferrals:
+            return None
+        # The time region may have been captured before the map was toggled, keep the known time then
+        if reading.text:
+            record['match_time'] = reading.text.replace('_', ':')
+            record['ocr_confidence'] = reading.confidence
+            record['ocr_source'] = reading.source
+            record.pop('match_time_estimated', None)
+        if chat is not None:
+            record['chat_state'] = chat.state
+            record['chat_confidence'] = chat.confidence
+    if record.get('mono_time') is None and record.get('file'):
+        # Sessions from before the index: the file time stands in for the capture time
+        path = os.path.join(session_folder, record['file'])
+        if os.path.exists(path):
+            record['mono_time'] = record['wall_time'] = os.path.getmtime(path)
+    return record, time_crop is not None
+
+
+def _run_chunk(function, tasks):
+    """Run `function` on a chunk of tasks, with the OCR fallbacks of the whole chunk recognized in one batch.
+
+    The first pass defers the crops that the glyph and template readers cannot decide, `function`
+    returns None for their tasks. Each analyzer then recognizes its deferred crops in a single
+    `recognize_batch` request, and only those tasks are run again, reading the batched texts.
+    """
+    global _deferring
+    _deferring = True
+    try:
+        results = [function(task) for task in tasks]
+    finally:
+        _deferring = False
+    for analyzer in _analyzers.values():
+        analyzer.recognize_deferred()
+    return [function(task) if result is None else result for task, result in zip(tasks, results)]
+
+
+def _run_tasks(function, tasks, settings, workers, progress=None):
+    """Run `function` on every task, in a process pool when `workers` > 1, and return the results in order."""
+    results = []
+    chunks = [tasks[i:i + CHUNK_SIZE] for i in range(0, len(tasks), CHUNK_SIZE)]
+    if workers <= 1:
+        _init_worker(settings)
+        try:
+            for chunk in chunks:
+                results += _run_chunk(function, chunk)
+                if progress is not None:
+                    progress(len(results), len(tasks))
+        finally:
+            _close_analyzers()
+        return results
+    with ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(settings,)) as executor:
+        try:
+            for chunk_results in executor.map(partial(_run_chunk, function), chunks):
+                results += chunk_results
+                if progress is not None:
+                    progress(len(results), len(tasks))
+        except BaseException:
+            # Failed or cancelled by the progress callback: do not wait for the remaining tasks
+            executor.shutdown(wait=False, cancel_futures=True)
+            raise
+    return results
+
+
+def rebuild_gif(session_folder, settings, workers=1, progress=None):
+    """Encode the GIF of a session from its index, return the number of frames written."""
+    records = load_index(session_folder)
+    if records is None:
+        records = legacy_records(session_folder)
+    frames = gif_frames(session_folder, interpolate_times(records))
+    return write_gif(
+        frames, os.path.join(session_folder, GIF_NAME), settings['gif_frame_duration'] * 1000,
+        settings['gif_palette_sample'], optimize=settings['gif_delta_frames'], workers=workers, progress=progress
+    )
+
+
+def replay_screenshots(source_folder, session_folder, settings, workers=1, progress=None, gif=True):
+    """Turn a folder of recorded screenshots into a session folder, return its index records."""
+    files = FileCaptureBackend(source_folder).files
+    os.makedirs(os.path.join(session_folder, TIME_CROPS_FOLDER), exist_ok=True)
+    tasks = [(i + 1, path, session_folder) for i, path in enumerate(files)]
+    records = _run_tasks(analyze_screenshot, tasks, settings, workers, progress)
+    for sequence, record in enumerate(records):
+        record['sequence'] = sequence
+    write_index(session_folder, records)
+    if gif:
+        rebuild_gif(session_folder, settings, workers)
+    return records
+
+
+def reprocess_session(session_folder, settings, workers=1, progress=None, gif=True):
+    """Re-time and re-index a previous session, return its updated index records and how many were re-read.
+
+    Only frames with a saved time crop are re-read: the crop kept with every map frame, or for
+    sessions from before `time_crops`, the debug crops saved around failures. The others keep their reading.
+    """
+    records = load_index(session_folder)
+    if records is None:
+        records = legacy_records(session_folder)
+    tasks = [(record, session_folder) for record in records]
+    results = _run_tasks(reread_record, tasks, settings, workers, progress)
+    records = [record for record, _ in results]
+    reread = sum(1 for _, has_crop in results if has_crop)
+    logging.info(f"Re-read {reread} of {len(records)} frames from their saved time crops.")
+    records.sort(key=lambda record: (record.get('mono_time') or 0, record['frame']))
+    write_index(session_folder, records)
+    if gif:
+        rebuild_gif(session_folder, settings, workers)
+    return records, reread
+
+
+def print_progress(done, total):
+    print(f"\rProcessed {done}/{total} frames", end='\n' if done == total else '', flush=True)
+
+
+def main(argv):
+    # Options shared by the commands, accepted after the command name
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument('--config', default='config.ini', help="Config file with the detection settings")
+    common.add_argument('--workers', type=int, default=0, help="Worker processes, 0 uses every core")
+    common.add_argument('--no-gif', action='store_true', help="Do not rebuild the GIF")
+    parser = argparse.ArgumentParser(description="Reprocess recorded Silica frames without a display.")
+    commands = parser.add_subparsers(dest='command', required=True)
+    screenshots = commands.add_parser(
+        'screenshots', parents=[common], help="Create a session from full-resolution screenshots"
+    )
+    screenshots.add_argument('source_folder')
+    screenshots.add_argument('session_folder')
+    session = commands.add_parser('session', parents=[common], help="Re-time and re-index a previous session")
+    session.add_argument('session_folder')
+    args = parser.parse_args(argv[1:])
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    settings = load_settings(args.config)
+    workers = args.workers or os.cpu_count() or 1
+    start = time.perf_counter()
+    if args.command == 'screenshots':
+        records = replay_screenshots(
+            args.source_folder, args.session_folder, settings, workers, print_progress, gif=not args.no_gif
+        )
+    else:
+        records, reread = reprocess_session(args.session_folder, settings, workers, print_progress, gif=not args.no_gif)
+        print(f"{reread} of {len(records)} frames re-read from their saved time crops, the others kept their time")
+    timed = sum(1 for record in records if record.get('match_time'))
+    print(f"{len(records)} frames, {timed} with a match time, in {time.perf_counter() - start:.1f} s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
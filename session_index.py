@@ -0,0 +1,180 @@
+"""Append-only per-session frame index.
+
+Every tick appends one JSON line to `index.jsonl` in the session folder, so GIF
+generation, deduplication and reprocessing read one file instead of listing the
+folder and parsing filenames.
+"""
+
+import os
+import re
+import json
+import logging
+import threading
+
+from storage import frame_source
+
+
+INDEX_FILENAME = 'index.jsonl'
+# Time-region crop of every map frame, kept for reprocessing
+TIME_CROPS_FOLDER = 'time_crops'
+
+
+def match_seconds(match_time):
+    """Convert "MM:SS" (or "MM_SS") to seconds."""
+    minutes, seconds = re.split(r'[:_]', match_time)
+    return int(minutes) * 60 + int(seconds)
+
+
+def format_match_time(total_seconds):
+    total_seconds = max(int(round(total_seconds)), 0)
+    return f"{total_seconds // 60:02d}:{total_seconds % 60:02d}"
+
+
+class SessionIndex:
+    """Writer of a session's index, safe to use from several pipeline workers."""
+
+    def __init__(self, session_folder):
+        self.path = os.path.join(session_folder, INDEX_FILENAME)
+        self.lock = threading.Lock()
+        self.file = open(self.path, 'a')
+
+    def append(self, record):
+        line = json.dumps(record) + '\n'
+        with self.lock:
+            self.file.write(line)
+            self.file.flush()
+
+    def close(self):
+        with self.lock:
+            self.file.close()
+
+
+def frame_record(job, filename=None, offset=None, time_crop=None):
+    """Build the index record of a pipeline FrameJob, `time_crop` being the file of its saved time crop."""
+    match_time = job.elapsed_time if job.elapsed_time and job.elapsed_time != "unknown_time" else None
+    record = {
+        'frame': job.index,
+        'sequence': job.sequence,
+        'file': filename,
+        'offset': offset,
+        'mono_time': job.capture_time,
+        'wall_time': job.wall_time,
+        'match_time': match_time.replace('_', ':') if match_time else None,
+        'ocr_confidence': None,
+        'ocr_source': None,
+        'chat_state': None,
+        'chat_confidence': None,
+        'map_toggled': job.map_toggled,
+        'frame_hash': None,
+        'changed_bbox': None,
+        'redundant': False,
+        'burst': job.burst,
+        'screen_size': list(job.screen_size) if job.screen_size else None,
+        'time_crop': time_crop,
+    }
+    if job.time_reading is not None:
+        record['ocr_confidence'] = job.time_reading.confidence
+        record['ocr_source'] = job.time_reading.source
+    if job.chat is not None:
+        record['chat_state'] = job.chat.state
+        record['chat_confidence'] = job.chat.confidence
+    if job.change is not None:
+        record['frame_hash'] = job.change.hash
+        record['changed_bbox'] = job.change.bbox
+        record['redundant'] = job.change.redundant
+    return record
+
+
+def load_index(session_folder):
+    """Read the index records of a session in capture order, or None if it has no index."""
+    path = os.path.join(session_folder, INDEX_FILENAME)
+    if not os.path.exists(path):
+        return None
+    records = []
+    with open(path) as f:
+        for line in f:
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                logging.warning(f"Skipping invalid line in {path}")
+    records.sort(key=lambda record: (record.get('mono_time') or 0, record['frame']))
+    return records
+
+
+def write_index(session_folder, records):
+    """Replace the index of a session with `records`, keeping the previous one as index.jsonl.bak."""
+    path = os.path.join(session_folder, INDEX_FILENAME)
+    temp_path = path + '.part'
+    with open(temp_path, 'w') as f:
+        for record in records:
+            f.write(json.dumps(record) + '\n')
+    if os.path.exists(path):
+        os.replace(path, path + '.bak')
+    os.replace(temp_path, path)
+
+
+def legacy_records(session_folder):
+    """Build records from the filenames of a session captured before the index existed."""
+    records = []
+    for filename in os.listdir(session_folder):
+        match = re.match(r"map_(\d+)_(\d+)_(\d+)\.png$", filename)
+        if match:
+            match_time = f"{match.group(2)}:{match.group(3)}"
+        else:
+            match = re.match(r"map_(\d+)_unknown_time\.png$", filename)
+            if not match:
+                continue
+            match_time = None
+        records.append({'frame': int(match.group(1)), 'file': filename, 'match_time': match_time, 'redundant': False})
+    records.sort(key=lambda record: record['frame'])
+    return records
+
+
+def interpolate_times(records):
+    """Estimate the match time of frames whose timer could not be read.
+
+    The match clock runs at wall-clock speed, so the time is extrapolated from the
+    nearest known neighbor with the capture monotonic times, and clamped between the
+    previous and next known times in case the game was paused. Estimated records get
+    'match_time_estimated': True. Records without a capture time are left unknown.
+    """
+    known = [
+        (i, match_seconds(record['match_time']))
+        for i, record in enumerate(records)
+        if record.get('match_time') and record.get('mono_time') is not None
+    ]
+    if not known:
+        return records
+    position = 0
+    for i, record in enumerate(records):
+        if record.get('match_time') or record.get('mono_time') is None:
+            continue
+        while position < len(known) and known[position][0] < i:
+            position += 1
+        previous = known[position - 1] if position > 0 else None
+        following = known[position] if position < len(known) else None
+        if previous is not None:
+            estimate = previous[1] + record['mono_time'] - records[previous[0]]['mono_time']
+        else:
+            estimate = following[1] - (records[following[0]]['mono_time'] - record['mono_time'])
+        if previous is not None:
+            estimate = max(estimate, previous[1])
+        if following is not None:
+            estimate = min(estimate, following[1])
+        record['match_time'] = format_match_time(estimate)
+        record['match_time_estimated'] = True
+    return records
+
+
+def gif_frames(session_folder, records):
+    """Return the (source, "MM:SS") frames of a session for the GIF, ordered by in-game time.
+
+    Sources are file paths, or a PackedFrameRef for frames stored in the packed container.
+    Redundant frames, frames without a file and frames with an unknown time are left out.
+    """
+    frames = [
+        record for record in records
+        if record.get('file') and record.get('match_time') and not record.get('redundant')
+    ]
+    frames.sort(key=lambda record: (match_seconds(record['match_time']), record['frame']))
+    return [(frame_source(session_folder, record), record['match_time']) for record in frames]
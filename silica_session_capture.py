@@ -2,37 +2,49 @@ import os
 import time
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox
-from PIL import ImageGrab, Image, ImageDraw, ImageFont
-import pyautogui
-from threading import Thread
-import pytesseract
-from pynput.keyboard import Controller
+from PIL import Image
+from threading import Thread, Event
 import subprocess
-import cv2
-import numpy as np
 import logging
-import re
 import shutil 
 import configparser
 
+from capture import create_capture_backend
+from hud import preprocess_image
+from calibration import PROFILE_FILENAME, calibrate, load_profile, reference_profile, save_profile
+from pipeline import TickScheduler, FrameJob, Stage, Pipeline
+from detection import ChatStateDetector, MapVisibilityDetector
+from timer_reader import TimerReader, TimerTracker, parse_time_text
+from ocr import OcrService
+from change_detection import FrameChangeDetector
+from session_index import TIME_CROPS_FOLDER, SessionIndex, frame_record, load_index, legacy_records, interpolate_times, gif_frames
+from gif_export import GIF_NAME, LiveGifEncoder, write_gif
+from storage import FrameStore
+from debug_capture import DebugCapture
+from video_export import VideoEncoder, video_filename, write_video
+from jobs import JobExecutor
+from burst import BURST_INDEX_BASE, BurstRecorder
+from analytics import STATS_FILENAME, SessionAnalytics, load_analytics_settings
+from replay import load_settings, reprocess_session
+from metrics import MetricsRegistry, MetricsServer, SnapshotWriter, start_logging_queue
+
+
+def setup_logging(log_file="debug.log"):
+    """Log to a file and the console. Records are written by a listener thread so logging never blocks the capture thread."""
+    return start_logging_queue(
+        [
+            logging.FileHandler(log_file),
+            logging.StreamHandler()
+        ],
+        level=logging.DEBUG  # Set the default log level to DEBUG
+    )
 
-# Setup the logger
-logging.basicConfig(
-    level=logging.DEBUG,  # Set the default log level to DEBUG
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler("debug.log"),
-        logging.StreamHandler()
-    ]
-)
-
-keyboard = Controller()
 
 class ScreenshotApp:
     def __init__(self, root):
         self.root = root
         self.root.title("Silica Map Screenshot Tool")
-        self.root.geometry("400x550")
+        self.root.geometry("400x690")
         self.root.resizable(False, False)  # Disable window resizing
 
         # Define and Load the configuration
@@ -54,24 +66,136 @@ class ScreenshotApp:
         self.ensure_directory(self.sessions_folder)
 
         self.screenshot_interval_var = tk.StringVar(value=self.config['DEFAULT']['screenshot_interval'])
+        self.screenshot_interval_var.trace_add('write', self.on_interval_changed)
         self.screenshot_count = 0
         self.is_running = False
+        self.stop_event = Event()  # Wakes the capture scheduler up when the session stops
         self.start_time = None
         self.session_folder = ""
 
+        # Screen capture backend, grabs only the HUD regions we need.
+        # When a replay folder is configured, recorded screenshots are used instead of the screen.
+        replay_folder = self.config['DEFAULT'].get('replay_folder', '').strip()
+        self.capture_backend = create_capture_backend(
+            self.config['DEFAULT'].get('capture_backend', 'auto'),
+            replay_source=self.normalize_path(replay_folder) if replay_folder else None
+        )
+        logging.info(f"Using capture backend: {self.capture_backend.name}")
+
         # Get current screen resolution
-        self.screen_width, self.screen_height = pyautogui.size()
+        self.screen_width, self.screen_height = self.capture_backend.screen_size()
 
-        # Scaling factors based on 1920x1080 resolution
-        self.x_scale = self.screen_width / 1920
-        self.y_scale = self.screen_height / 1080
+        # HUD regions and OCR preprocessing of this resolution, measured by the HUD calibration when it was run
+        self.hud_profile_file = self.normalize_path(self.config['DEFAULT'].get('hud_profile_file', PROFILE_FILENAME))
+        self.ui_scale = self.config['DEFAULT'].getfloat('ui_scale', 1.0)
+        self.calibration_pairs = self.config['DEFAULT'].getint('calibration_pairs', 3)
+        resolution = (self.screen_width, self.screen_height)
+        self.apply_hud_profile(load_profile(self.hud_profile_file, resolution, self.ui_scale) or reference_profile(resolution))
+
+        # Keyboard controller toggling the in-game map. pynput needs a display, so it is only loaded by the app itself
+        from pynput.keyboard import Controller
+        self.keyboard = Controller()
 
         # Adjustable initial delay before starting the session
         self.initial_delay = int(self.config['DEFAULT']['initial_delay'])  # seconds
 
+        # Shared OCR service, keeps one Tesseract engine warm and batches concurrent requests
+        defaults = self.config['DEFAULT']
+        self.ocr = OcrService(defaults.get('ocr_engine', 'auto'), lang=defaults.get('ocr_lang', 'eng'))
+
+        # Instrumentation: per-stage timings, tick jitter, recognition rates and queue depths
+        self.metrics = MetricsRegistry()
+        self.metrics_snapshot_interval = defaults.getfloat('metrics_snapshot_interval', 30)  # seconds, 0 disables
+        self.metrics_server = None
+        metrics_port = defaults.getint('metrics_port', 0)  # 0 disables the endpoint
+        if metrics_port:
+            try:
+                self.metrics_server = MetricsServer(self.metrics, metrics_port)
+                self.metrics_server.start()
+            except OSError as e:
+                logging.error(f"Failed to start the metrics endpoint on port {metrics_port}: {e}")
+
+        # Template-matching chat detector, Tesseract is only used for ambiguous crops
+        self.chat_detector = ChatStateDetector(
+            self.normalize_path(defaults.get('chat_templates_folder', 'templates/chat')),
+            match_threshold=defaults.getfloat('chat_match_threshold', 0.8),
+            reject_threshold=defaults.getfloat('chat_reject_threshold', 0.5),
+            fallback=self.read_chat_crop if defaults.getboolean('chat_ocr_fallback', True) else None
+        )
+
+        # Glyph-based match timer reader, Tesseract is only used to bootstrap the atlas and for unsure reads
+        self.timer_reader = TimerReader(
+            self.normalize_path(defaults.get('timer_atlas_folder', 'templates/timer')),
+            (self.screen_width, self.screen_height),
+            min_confidence=defaults.getfloat('timer_min_confidence', 0.5),
+            fallback=self.read_time_crop
+        )
+
+        # Lock onto the match clock and predict the time, only reading the timer to verify it
+        self.timer_tracking = defaults.getboolean('timer_tracking', True)
+        self.timer_lock_readings = defaults.getint('timer_lock_readings', 3)
+        self.timer_verify_every = defaults.getint('timer_verify_every', 10)  # frames
+        self.timer_tolerance = defaults.getfloat('timer_tolerance', 0.25)  # seconds
+        self.timer_tracker = None
+
+        # Map-open classifier on the map border pixels, avoids reading the timer to find out
+        self.map_detector = MapVisibilityDetector(threshold=defaults.getfloat('map_signature_threshold', 0.25))
+        self.map_ready_timeout = defaults.getfloat('map_ready_timeout', 1.0)  # seconds
+        self.map_poll_interval = defaults.getfloat('map_poll_interval', 0.02)  # seconds
+
+        # Change detection between map frames: 'off', 'mark' (excluded from the GIF) or 'skip' (not saved)
+        self.dedup_mode = defaults.get('dedup_mode', 'mark')
+        self.dedup_hash_threshold = defaults.getint('dedup_hash_threshold', 2)
+        self.dedup_block_threshold = defaults.getfloat('dedup_block_threshold', 6.0)
+
+        # Debug crops are kept in memory for the last ticks and only saved when a reading fails
+        self.debug_buffer_size = defaults.getint('debug_buffer_size', 30)  # ticks
+        self.debug_sample_every = defaults.getint('debug_sample_every', 1)  # keep one tick in N
+        self.debug_min_confidence = defaults.getfloat('debug_min_confidence', 0.6)
+        self.debug_max_mb = defaults.getfloat('debug_max_mb', 50)  # per session
+
+        # Frame storage: codec 'png', 'webp' (lossless) or 'raw', and optionally one packed file per session
+        self.frame_codec = defaults.get('frame_codec', 'png')
+        self.png_compress_level = defaults.getint('png_compress_level', 1)
+        self.frame_container = defaults.getboolean('frame_container', False)
+
         # Adjustable frame duration for the GIF
         self.gif_frame_duration = float(self.config['DEFAULT']['gif_frame_duration'])  # seconds per frame
 
+        # Encode the GIF during the session, its palette is computed from the first frames
+        self.gif_live_encode = defaults.getboolean('gif_live_encode', True)
+        self.gif_palette_sample = defaults.getint('gif_palette_sample', 16)
+        # Only store the changed rectangle of each frame
+        self.gif_delta_frames = defaults.getboolean('gif_delta_frames', True)
+        # Processes preparing GIF frames in parallel, 0 uses every core
+        self.gif_workers = defaults.getint('gif_workers', 0) or os.cpu_count() or 1
+        self.live_gif_folder = None  # Session whose live GIF is complete
+
+        # Video export with OpenCV, encoded during the session like the GIF
+        self.video_export = defaults.getboolean('video_export', False)
+        self.video_codec = defaults.get('video_codec', 'mp4v')  # mp4v, avc1, vp80, vp09, mjpg or xvid
+        self.video_fps = defaults.getfloat('video_fps', 2.0)
+        self.video_scale = defaults.getfloat('video_scale', 1.0)
+        self.video_live_encode = defaults.getboolean('video_live_encode', True)
+        self.live_video = None
+        self.live_video_folder = None  # Session whose live video is complete
+
+        # Burst mode: the map at a few Hz in a RAM ring buffer, saved on demand or on large map changes
+        self.burst_mode = defaults.getboolean('burst_mode', False)
+        self.burst_rate = defaults.getfloat('burst_rate', 2.0)  # frames per second, 1-4 is sensible
+        self.burst_seconds = defaults.getfloat('burst_seconds', 15.0)  # length of the ring buffer
+        self.burst_trigger_threshold = defaults.getfloat('burst_trigger_threshold', 0.0)  # 0 disables the trigger
+        self.burst_trigger_cooldown = defaults.getfloat('burst_trigger_cooldown', 10.0)
+        self.burst_hotkey = defaults.get('burst_hotkey', '<ctrl>+<alt>+b').strip()
+        self.burst_recorder = None
+        self.burst_hotkeys = None
+        self.burst_frames_saved = 0
+
+        # Activity heatmaps and per-frame statistics, folded in as the frames arrive
+        self.analytics_live = defaults.getboolean('analytics_live', True)
+        self.analytics_settings = load_analytics_settings(defaults)
+        self.analytics = None
+
         # GUI Elements
         main_frame = ttk.Frame(root, padding="10")
         main_frame.pack(fill=tk.BOTH, expand=True)
@@ -111,6 +235,19 @@ class ScreenshotApp:
         self.generate_gif_button = ttk.Button(main_frame, text="Generate GIF", command=self.generate_gif)
         self.generate_gif_button.pack(fill=tk.X, pady=5)
 
+        # Save the burst buffer of the running session
+        self.save_burst_button = ttk.Button(main_frame, text="Save Burst", command=self.save_burst, state=tk.DISABLED)
+        if self.burst_mode:
+            self.save_burst_button.pack(fill=tk.X, pady=5)
+
+        # Measure the HUD regions of this resolution in game
+        self.calibrate_button = ttk.Button(main_frame, text="Calibrate HUD", command=self.calibrate_hud)
+        self.calibrate_button.pack(fill=tk.X, pady=5)
+
+        # Re-read the timer and chat of the last session from its saved time crops
+        self.reprocess_button = ttk.Button(main_frame, text="Reprocess Last Session", command=self.reprocess_last_session)
+        self.reprocess_button.pack(fill=tk.X, pady=5)
+
         # Copy GIF Option Frame
         gif_copy_frame = ttk.Frame(main_frame)
         gif_copy_frame.pack(fill=tk.X, pady=5)
@@ -142,6 +279,20 @@ class ScreenshotApp:
 
         self.elapsed_time_label = ttk.Label(main_frame, text="Elapsed Time: 0s")
         self.elapsed_time_label.pack(pady=5)
+
+        # Background jobs: GIF/video generation, export copies and reprocessing
+        self.job_label = ttk.Label(main_frame, text="No background jobs")
+        self.job_label.pack(pady=5)
+        job_frame = ttk.Frame(main_frame)
+        job_frame.pack(fill=tk.X, pady=5)
+        self.job_progress = ttk.Progressbar(job_frame, mode='determinate')
+        self.job_progress.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=5)
+        self.cancel_job_button = ttk.Button(job_frame, text="Cancel", command=self.cancel_jobs, state=tk.DISABLED)
+        self.cancel_job_button.pack(side=tk.LEFT, padx=5)
+
+        # Job events and widget updates from other threads are handled on the Tk thread
+        self.jobs = JobExecutor(root, on_progress=self.on_job_progress)
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
         
     def load_config(self):
         """Load configuration from config file."""
@@ -199,21 +350,24 @@ class ScreenshotApp:
     def start_session(self):
         try:
             self.screenshot_interval = float(self.screenshot_interval_var.get())
+            if not self.screenshot_interval > 0:
+                raise ValueError(self.screenshot_interval)
         except ValueError:
             logging.error("Invalid interval input by user.")
-            messagebox.showerror("Invalid Input", "Please enter a valid number for the interval.")
+            messagebox.showerror("Invalid Input", "Please enter a number of seconds above 0 for the interval.")
+            return
+        if self.jobs.active('Calibrate HUD'):
+            messagebox.showwarning("Calibrating", "Wait for the HUD calibration to finish before starting a session.")
             return
         
         self.screenshot_count = 0
         self.start_time = time.time()
         self.session_folder = os.path.join(self.sessions_folder, time.strftime("%Y%m%d_%H%M%S"))
-        os.makedirs(self.session_folder, exist_ok=True)
+        os.makedirs(os.path.join(self.session_folder, TIME_CROPS_FOLDER), exist_ok=True)
         logging.info(f"Session folder created: {self.session_folder}")
-        # Create the debug folder
-        self.debug_folder = os.path.join(self.session_folder, "debug")
-        os.makedirs(self.debug_folder, exist_ok=True)
         
         self.is_running = True
+        self.stop_event = Event()
         self.update_ui()
         self.screenshot_thread = Thread(target=self.take_screenshots)
         self.screenshot_thread.start()
@@ -223,195 +377,486 @@ class ScreenshotApp:
         if self.save_settings_var.get():
             self.save_config()
 
-    def preprocess_image(self, image):
-        logging.debug("Preprocessing image for text extraction.")
-        # Convert the screenshot to grayscale
-        gray = cv2.cvtColor(np.array(image), cv2.COLOR_BGR2GRAY)
-        
-        # Resize the image to enlarge the text
-        scale_percent = 300  # Enlarge the image by 300%
-        width = int(gray.shape[1] * scale_percent / 100)
-        height = int(gray.shape[0] * scale_percent / 100)
-        dim = (width, height)
-        resized = cv2.resize(gray, dim, interpolation=cv2.INTER_CUBIC)
-        
-        # Apply Gaussian Blur to reduce noise
-        blurred = cv2.GaussianBlur(resized, (5, 5), 0)
-        
-        # Apply a binary threshold to make the text stand out more
-        _, binary = cv2.threshold(blurred, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
-        
-        # Apply dilation to make text thicker
-        kernel = np.ones((2, 2), np.uint8)
-        dilated = cv2.dilate(binary, kernel, iterations=1)
-        
-        # Convert back to PIL Image
-        processed_image = Image.fromarray(dilated)
-        return processed_image
+    def on_interval_changed(self, *args):
+        """Apply an edited interval to the running session, keeping the current one while the entry is not a valid number."""
+        try:
+            interval = float(self.screenshot_interval_var.get())
+        except ValueError:
+            logging.debug("Screenshot interval is not a number, keeping the current one.")
+            return
+        if interval > 0:
+            self.screenshot_interval = interval
+
+    def preprocess_image(self, image, kind):
+        start = time.perf_counter()
+        processed = preprocess_image(image, self.hud_profile.preprocess_params(kind))
+        self.metrics.observe('stage_seconds', time.perf_counter() - start, stage='preprocess')
+        return processed
+
+    def recognize(self, image, kind):
+        """Run OCR on a preprocessed image, timing the call."""
+        start = time.perf_counter()
+        try:
+            return self.ocr.recognize(image, psm=7)
+        finally:
+            self.metrics.observe('ocr_call_seconds', time.perf_counter() - start, kind=kind)
 
     def extract_time(self, image):
-        """Attempt to extract time from the preprocessed image."""
+        """Attempt to extract time from the preprocessed image with Tesseract."""
         logging.debug("Attempting to extract time from the image.")
         try:
-            elapsed_time_text = pytesseract.image_to_string(image, config='--psm 7').strip()
+            elapsed_time_text = self.recognize(image, 'time').strip()
             logging.debug(f"Raw extracted time text: {elapsed_time_text}")
-            
-            if "CURRENT MATCH" in elapsed_time_text:
-                # Extract the last part which should contain the time in MM:SS format
-                time_parts = elapsed_time_text.split()[-1]
-                
-                # Validate the time format using regular expression: MM:SS where MM can be > 60 but SS <= 60
-                if re.match(r"^\d{2,3}:\d{2}$", time_parts):
-                    minutes, seconds = map(int, time_parts.split(":"))
-                    if seconds < 60:  # Ensure the seconds are valid
-                        logging.info(f"Successfully extracted time: {time_parts}")
-                        return time_parts.replace(":", "_")  # Convert MM:SS to MM_SS for filename
-                    else:
-                        logging.warning(f"Invalid time format with seconds > 60: {time_parts}")
-            else:
-                logging.warning("Failed to find 'CURRENT MATCH' in extracted text.")
+            elapsed_time = parse_time_text(elapsed_time_text)
+            self.metrics.increment('ocr_calls_total', kind='time', result='success' if elapsed_time else 'no_match')
+            return elapsed_time
         except Exception as e:
             logging.error(f"Exception occurred during time extraction: {e}")
+            self.metrics.increment('ocr_calls_total', kind='time', result='error')
         return None
 
+    def read_time_crop(self, crop):
+        """OCR fallback of the timer reader, reads the time from a raw time-region crop."""
+        return self.extract_time(self.preprocess_image(crop, 'time'))
+
+    def read_time(self, crop, capture_time=None):
+        """Read the in-game time from a raw time-region crop, return a TimerReading (text is MM_SS or None).
+
+        Crops known to show the map with their capture time are read through the match-clock tracker when enabled.
+        """
+        if capture_time is not None and self.timer_tracker is not None:
+            reading = self.timer_tracker.read(crop, capture_time)
+        else:
+            reading = self.timer_reader.read(crop)
+        logging.debug(f"Timer reading: {reading}")
+        self.metrics.increment('timer_reads_total', source=reading.source, result='success' if reading.text else 'failure')
+        return reading
+
     def extract_chat_status(self, image):
         """Check if 'Team' or 'All' is present in the chat region."""
+        return self.read_chat_label(image) is not None
+
+    def read_chat_crop(self, crop):
+        """OCR fallback of the chat detector, reads the label from a raw chat-region crop."""
+        return self.read_chat_label(self.preprocess_image(crop, 'chat'))
+
+    def read_chat_label(self, image):
+        """Return 'team' or 'all' when found by OCR in the preprocessed chat region, otherwise None."""
         logging.debug("Checking chat status from the image.")
         try:
             # Extract text from the image using Tesseract OCR
-            chat_text = pytesseract.image_to_string(image, config='--psm 7').strip().lower()
+            chat_text = self.recognize(image, 'chat').strip().lower()
             logging.debug(f"Extracted chat text: {chat_text}")
 
             # Check if 'team' or 'all' is in the chat text (case-insensitive)
-            if "team" in chat_text or "all" in chat_text:
-                logging.info(f"Detected chat activity: {chat_text}")
-                return True
-            else:
-                logging.debug("No relevant chat activity detected ('team' or 'all').")
+            for label in ('team', 'all'):
+                if label in chat_text:
+                    logging.info(f"Detected chat activity: {chat_text}")
+                    self.metrics.increment('ocr_calls_total', kind='chat', result='success')
+                    return label
+            logging.debug("No relevant chat activity detected ('team' or 'all').")
+            self.metrics.increment('ocr_calls_total', kind='chat', result='no_match')
         except Exception as e:
             logging.error(f"Exception occurred during chat extraction: {e}")
+            self.metrics.increment('ocr_calls_total', kind='chat', result='error')
 
-        # Return False if neither 'team' nor 'all' is found, or an error occurs
-        return False
+        # Return None if neither 'team' nor 'all' is found, or an error occurs
+        return None
 
     def take_screenshots(self):
+        """Capture thread: grab pixels on a drift-free schedule and hand everything else to the pipeline."""
         logging.info(f"Waiting {self.initial_delay} seconds before starting the session.")
-        time.sleep(self.initial_delay)
-
-        while self.is_running:
-            try:
-                self.screenshot_interval = int(self.screenshot_interval_var.get())
-            except ValueError:
-                logging.error("Invalid screenshot interval, using default 10 seconds.")
-                self.screenshot_interval = 10  # Default to 10 seconds if the input is invalid
-            
-            # Take an initial screenshot without toggling the map
-            initial_screenshot = pyautogui.screenshot()
-
-            # Define the chat region
-            chat_area = (
-                int(20 * self.x_scale),   # Controls the x-coordinate of the left edge.
-                int(700 * self.y_scale),  # Controls the y-coordinate of the top edge.
-                int(75 * self.x_scale),   # Controls the x-coordinate of the right edge.
-                int(725 * self.y_scale)   # Controls the y-coordinate of the bottom edge.
+        self.scheduler = TickScheduler(self.screenshot_interval)
+        self.scheduler.start(delay=self.initial_delay)
+        self.session_index = SessionIndex(self.session_folder)
+        self.frame_store = FrameStore(self.session_folder, self.frame_codec, self.png_compress_level, self.frame_container)
+        self.debug_capture = DebugCapture(
+            self.frame_store, self.debug_buffer_size, self.debug_sample_every,
+            self.debug_min_confidence, self.debug_max_mb * 1024 * 1024
+        )
+        if self.timer_tracking:
+            # A new session may be a new match, start without a lock
+            self.timer_tracker = TimerTracker(
+                self.timer_reader, self.timer_lock_readings, self.timer_verify_every, self.timer_tolerance
             )
-
-            chat_screenshot = initial_screenshot.crop(chat_area)
-            processed_chat_image = self.preprocess_image(chat_screenshot)
-            chat_active = self.extract_chat_status(processed_chat_image)
-
-            # Save the chat region to debug folder
-            chat_debug_filename = f"chat_region_{self.screenshot_count + 1}.png"
-            chat_debug_path = os.path.join(self.debug_folder, chat_debug_filename)
-            chat_screenshot.save(chat_debug_path)
-            logging.info(f"Saved chat region to {chat_debug_path}")
-
-            # If the player is chatting, skip the rest of the process
-            if chat_active:
-                logging.info("Player is typing in the chat. Skipping map toggle.")
-                time.sleep(self.screenshot_interval)
-                logging.info('========================================================')
-                continue
-
-            # Attempt to extract the time from the initial screenshot
-            time_area = (
-                int(300 * self.x_scale), int(50 * self.y_scale), 
-                int((300 + 300) * self.x_scale), int((50 + 42) * self.y_scale)
+        self.change_detector = FrameChangeDetector(self.dedup_hash_threshold, block_threshold=self.dedup_block_threshold)
+        self.pipeline = self.create_pipeline()
+        self.register_gauges()
+        self.metrics_snapshot = None
+        if self.metrics_snapshot_interval > 0:
+            self.metrics_snapshot = SnapshotWriter(
+                self.metrics, os.path.join(self.session_folder, 'metrics.json'), self.metrics_snapshot_interval
             )
-            time_screenshot = initial_screenshot.crop(time_area)
-            processed_time_image = self.preprocess_image(time_screenshot)
-            elapsed_time = self.extract_time(processed_time_image)
-
-            # Save the time region to debug folder
-            time_debug_filename = f"time_region_{self.screenshot_count + 1}.png"
-            time_debug_path = os.path.join(self.debug_folder, time_debug_filename)
-            time_screenshot.save(time_debug_path)
-            logging.info(f"Saved time region to {time_debug_path}")
-
-            map_toggled = False
-
-            # Check if the time was detected
-            if elapsed_time:
-                logging.info(f"Detected time in initial screenshot: {elapsed_time}")
-                map_screenshot = initial_screenshot
-            else:
-                logging.info("Map is not activated, toggling the map on.")
-                
-                # Toggle the map on by pressing 'M'
-                keyboard.press('m')
-                keyboard.release('m')
-                map_toggled = True  # Track that we manually toggled the map
-                
-                # Wait a brief moment to ensure the map is fully displayed
-                time.sleep(0.2)
-                
-                # Take another screenshot with the map activated
-                map_screenshot = pyautogui.screenshot()
-                
-                # Extract the time from the new screenshot
-                time_screenshot = map_screenshot.crop(time_area)
-                processed_time_image = self.preprocess_image(time_screenshot)
-                elapsed_time = self.extract_time(processed_time_image)
-                
-                if not elapsed_time:
-                    logging.warning("Failed to extract time, using 'unknown_time'.")
-                    elapsed_time = "unknown_time"
-
-            # Extract the map from the screenshot
-            map_area = (
-                int(638 * self.x_scale), int(53 * self.y_scale), 
-                int((638 + 974) * self.x_scale), int((53 + 974) * self.y_scale)
+            self.metrics_snapshot.start()
+        self.live_gif = None
+        self.live_unknown_frames = 0  # Frames left out of the live GIF and video for lack of a time
+        if self.gif_live_encode:
+            self.live_gif = LiveGifEncoder(
+                os.path.join(self.session_folder, GIF_NAME), self.gif_frame_duration * 1000,
+                self.gif_palette_sample, optimize=self.gif_delta_frames
             )
-            map_cropped = map_screenshot.crop(map_area)
+        self.live_video = None
+        if self.video_export and self.video_live_encode:
+            self.live_video = VideoEncoder(
+                os.path.join(self.session_folder, video_filename(self.video_codec)),
+                self.video_codec, self.video_fps, self.video_scale
+            )
+        self.analytics = None
+        if self.analytics_live:
+            self.analytics = SessionAnalytics(os.path.join(self.session_folder, STATS_FILENAME), **self.analytics_settings)
+        self.pipeline.start()
+        self.start_burst()
+
+        try:
+            while self.is_running:
+                tick_time = self.scheduler.wait(self.stop_event)
+                if tick_time is None:
+                    break
+                wall_time = time.time()
+                self.metrics.observe('tick_jitter_seconds', self.scheduler.jitter[-1])
+
+                # Parsed on the Tk thread by on_interval_changed, Tk variables are not read from here
+                self.scheduler.set_interval(self.screenshot_interval)
+
+                if not self.capture_backend.next_frame():
+                    logging.info("Capture source exhausted, stopping the session.")
+                    self.is_running = False
+                    self.jobs.call_soon(self.update_ui)
+                    break
 
-            # Validate the cropped map image before saving
-            if map_cropped.size[0] > 0 and map_cropped.size[1] > 0:
-                screenshot_filename = f"map_{self.screenshot_count + 1}_{elapsed_time}.png"
-                screenshot_path = os.path.join(self.session_folder, screenshot_filename)
                 try:
-                    map_cropped.save(screenshot_path)
-                    logging.info(f"Saved screenshot: {screenshot_filename}")
+                    self.capture_tick(tick_time, wall_time)
+                    self.metrics.observe('stage_seconds', time.monotonic() - tick_time, stage='capture')
                 except Exception as e:
-                    logging.error(f"Failed to save screenshot {screenshot_filename}: {e}")
+                    self.debug_capture.flush(f"capture failed: {e}")
+                    raise
+                logging.info('========================================================')
+        finally:
+            # Saving the requested burst frames goes through the pipeline, stop the recorder first
+            self.stop_burst()
+            # Let the workers finish every frame already captured
+            self.pipeline.stop()
+            self.session_index.close()
+            self.frame_store.close()
+            if self.live_gif is not None:
+                try:
+                    # Burst frames and frames of unknown time are not in the live GIF, it is generated again with them
+                    if self.live_gif.close() and not self.burst_frames_saved and not self.live_unknown_frames:
+                        self.live_gif_folder = self.session_folder
+                        logging.info("Live GIF finished.")
+                except Exception as e:
+                    logging.error(f"Failed to finish the live GIF: {e}")
+            if self.live_video is not None:
+                try:
+                    if self.live_video.close() and not self.burst_frames_saved and not self.live_unknown_frames:
+                        self.live_video_folder = self.session_folder
+                        logging.info("Live video finished.")
+                except Exception as e:
+                    logging.error(f"Failed to finish the live video: {e}")
+            if self.analytics is not None:
+                try:
+                    self.analytics.close()
+                    self.analytics.write_heatmaps(self.session_folder)
+                    logging.info(f"Analytics stats: {self.analytics.stats()}")
+                except Exception as e:
+                    logging.error(f"Failed to write the session analytics: {e}")
+            logging.info(f"Capture scheduler stats: {self.scheduler.stats()}")
+            logging.info(f"Pipeline stats: {self.pipeline.stats()}")
+            logging.info(f"Debug capture stats: {self.debug_capture.stats()}")
+            if self.timer_tracker is not None:
+                logging.info(f"Timer tracker stats: {self.timer_tracker.stats()}")
+            if self.burst_recorder is not None:
+                logging.info(f"Burst stats: {self.burst_recorder.stats()}")
+            if self.metrics_snapshot is not None:
+                self.metrics_snapshot.stop()
+
+    def start_burst(self):
+        """Start the burst recorder of the session, and its hotkey."""
+        self.burst_recorder = None
+        self.burst_frames_saved = 0
+        if not self.burst_mode:
+            return
+        regions = self.regions
+        self.burst_recorder = BurstRecorder(
+            self.capture_backend, regions['map'], regions['map_border'], self.save_burst_frames,
+            self.burst_rate, self.burst_seconds, is_map_open=self.map_detector.classify,
+            trigger_threshold=self.burst_trigger_threshold, trigger_cooldown=self.burst_trigger_cooldown
+        )
+        self.burst_recorder.start()
+        buffer = self.burst_recorder.buffer
+        self.metrics.set_gauge('burst_frames_buffered', lambda: min(buffer.count, buffer.capacity))
+        if self.burst_hotkey:
+            try:
+                from pynput.keyboard import GlobalHotKeys
+                self.burst_hotkeys = GlobalHotKeys({self.burst_hotkey: self.save_burst})
+                self.burst_hotkeys.start()
+            except Exception as e:
+                logging.error(f"Failed to register the burst hotkey '{self.burst_hotkey}': {e}")
+                self.burst_hotkeys = None
+
+    def stop_burst(self):
+        if self.burst_hotkeys is not None:
+            self.burst_hotkeys.stop()
+            self.burst_hotkeys = None
+        if self.burst_recorder is not None:
+            self.burst_recorder.stop()
+
+    def save_burst(self):
+        """Save the last seconds of the burst buffer, from the GUI button or the hotkey."""
+        if self.burst_recorder is not None and self.is_running:
+            self.burst_recorder.request_flush('manual')
+
+    def save_burst_frames(self, frames, reason):
+        """Queue burst frames for encoding and indexing; they skip the OCR, change detection and live export stages."""
+        for frame in frames:
+            job = FrameJob(BURST_INDEX_BASE + frame.sequence, frame.mono_time, frame.wall_time)
+            job.screen_size = (self.screen_width, self.screen_height)
+            job.burst = True
+            # Without a locked match clock the time is interpolated from the ticks when the GIF is generated
+            predicted = self.timer_tracker.predict(frame.mono_time) if self.timer_tracker is not None else None
+            job.elapsed_time = predicted or "unknown_time"
+            job.regions['map'] = frame.image
+            self.pipeline.submit_to('encode', job)
+        self.burst_frames_saved += len(frames)
+        self.metrics.increment('burst_frames_saved_total', len(frames), reason=reason)
+
+    def register_gauges(self):
+        """Expose the scheduler, queue and storage counters of the current session."""
+        self.metrics.set_gauge('ticks', lambda: self.scheduler.ticks)
+        self.metrics.set_gauge('missed_deadlines', lambda: self.scheduler.missed_deadlines)
+        self.metrics.set_gauge('bytes_written', lambda: self.frame_store.bytes_written)
+        for stage in self.pipeline.stages:
+            self.metrics.set_gauge('queue_depth', stage.queue.qsize, stage=stage.name)
+            self.metrics.set_gauge('frames_dropped', lambda stage=stage: stage.dropped, stage=stage.name)
+            self.metrics.set_gauge('stage_failures', lambda stage=stage: stage.failed, stage=stage.name)
+
+    def capture_tick(self, tick_time, wall_time):
+        """Grab the regions of one tick and submit them to the pipeline."""
+        regions = self.regions
+        job = FrameJob(self.screenshot_count + 1, tick_time, wall_time)
+        job.screen_size = (self.screen_width, self.screen_height)
+
+        # Grab only the small HUD regions, the map is grabbed once we know it is needed
+        frames = self.capture_backend.grab({
+            'chat': regions['chat'], 'time': regions['time'], 'map_border': regions['map_border']
+        })
+        job.debug['chat_region'] = frames['chat'].copy()
+        job.debug['time_region'] = frames['time'].copy()
+
+        # The chat and map state decide whether the map has to be toggled, so they are checked here
+        chat = job.chat = self.chat_detector.detect(frames['chat'])
+        self.metrics.increment('chat_detections_total', source=chat.source)
+        logging.debug(f"Chat detection: {chat}")
+
+        # If the player is chatting, skip the rest of the process
+        if chat.state is not None:
+            logging.info("Player is typing in the chat. Skipping map toggle.")
+            self.pipeline.submit(job)  # Still index the tick
+            return
+
+        map_open = self.map_detector.classify(frames['map_border'])
+        if map_open is None:
+            # The detector is not sure yet, read the timer to know if the map is open
+            job.time_reading = self.read_time(frames['time'])
+            job.elapsed_time = job.time_reading.text
+            map_open = job.elapsed_time is not None
+            if map_open:
+                self.map_detector.learn(frames['map_border'], True)
+                if self.timer_tracker is not None:
+                    self.timer_tracker.observe(job.time_reading, tick_time)
+        logging.debug(f"Map open: {map_open}")
+
+        if map_open:
+            logging.info("Map is already open.")
+            job.regions['time'] = job.debug['time_region']  # Saved next to the map for reprocessing
+            if job.elapsed_time is None:
+                job.regions['map_time'] = job.regions['time']  # Read by the OCR stage
+            map_frame = self.capture_backend.grab({'map': regions['map']})['map']
+        else:
+            logging.info("Map is not activated, toggling the map on.")
+            job.probes['closed_border'] = frames['map_border'].copy()
+
+            # Toggle the map on by pressing 'M'
+            self.keyboard.press('m')
+            self.keyboard.release('m')
+            job.map_toggled = True  # Track that we manually toggled the map
+
+            # Wait until the map is displayed
+            self.wait_for_map(regions)
+
+            # Grab the time and map regions with the map activated, the time is read by the OCR stage
+            frames = self.capture_backend.grab({
+                'time': regions['time'], 'map': regions['map'], 'map_border': regions['map_border']
+            })
+            job.regions['map_time'] = job.regions['time'] = job.debug['map_time_region'] = frames['time'].copy()
+            job.probes['open_border'] = frames['map_border'].copy()
+            map_frame = frames['map']
+
+            # Deactivate the map right away, everything else happens off the capture thread
+            logging.info("Deactivating the map.")
+            self.keyboard.press('m')
+            self.keyboard.release('m')
+
+        # Validate the cropped map image before queueing it
+        if map_frame.size > 0:
+            job.regions['map'] = map_frame.copy()
+        else:
+            logging.warning(f"Map screenshot was invalid or empty, skipping save. Size: {map_frame.shape[1::-1]}")
+
+        self.pipeline.submit(job)
+
+        # Update screenshot count
+        self.screenshot_count += 1
+        stats = self.scheduler.stats()
+        # Tk widgets are only updated from the Tk thread
+        self.jobs.call_soon(
+            self.count_label.config,
+            text=f"Screenshots Taken: {self.screenshot_count} "
+                 f"(missed ticks: {stats['missed_deadlines']}, jitter p95: {stats['jitter_p95_ms']:.0f} ms)"
+        )
+
+    def wait_for_map(self, regions):
+        """Poll the map border until the map is displayed, or give up after the timeout."""
+        if not self.map_detector.is_trained():
+            # Nothing to compare the border with yet: wait a fixed, brief moment
+            time.sleep(0.2)
+            return True
+        deadline = time.monotonic() + self.map_ready_timeout
+        while True:
+            border = self.capture_backend.grab({'map_border': regions['map_border']})['map_border']
+            if self.map_detector.classify(border):
+                return True
+            if time.monotonic() >= deadline:
+                logging.warning("Map did not show up before the timeout.")
+                return False
+            time.sleep(self.map_poll_interval)
+
+    def create_pipeline(self):
+        """Build the OCR -> encode -> write stages fed by the capture thread."""
+        defaults = self.config['DEFAULT']
+        queue_size = defaults.getint('pipeline_queue_size', 16)
+        return Pipeline([
+            Stage('ocr', self.ocr_stage, defaults.getint('ocr_workers', 2), queue_size),
+            # Change detection and the live GIF and video need frames in capture order, so they run on a single worker
+            Stage('dedup', self.dedup_stage, 1, queue_size, ordered=True),
+            Stage('export', self.export_stage, 1, queue_size),
+            Stage('encode', self.encode_stage, defaults.getint('encode_workers', 2), queue_size),
+            Stage('write', self.write_stage, defaults.getint('write_workers', 1), queue_size),
+        ], on_error=self.on_pipeline_error, metrics=self.metrics)
+
+    def on_pipeline_error(self, stage_name, job, error):
+        """Save the debug crops around a frame whose processing failed."""
+        try:
+            self.debug_capture.record(job)
+            self.debug_capture.flush(f"{stage_name} stage failed: {error}", job.index)
+        except Exception as e:
+            logging.error(f"Failed to save the debug capture: {e}")
+
+    def ocr_stage(self, job):
+        """Read the in-game time of frames whose map was grabbed without reading it first."""
+        if 'map_time' in job.regions:
+            job.time_reading = self.read_time(job.regions.pop('map_time'), job.capture_time)
+            job.elapsed_time = job.time_reading.text
+            if job.elapsed_time:
+                # The timer was readable, so the borders seen around the toggle are known states
+                if 'open_border' in job.probes:
+                    self.map_detector.learn(job.probes['open_border'], True)
+                if 'closed_border' in job.probes:
+                    self.map_detector.learn(job.probes['closed_border'], False)
             else:
-                logging.warning(f"Map screenshot was invalid or empty, skipping save. Size: {map_cropped.size}")
-
-            # Update screenshot count
-            self.screenshot_count += 1
-            self.count_label.config(text=f"Screenshots Taken: {self.screenshot_count}")
-            
-            # If we manually toggled the map, deactivate it by pressing 'M' again
-            if map_toggled:
-                logging.info("Deactivating the map.")
-                keyboard.press('m')
-                keyboard.release('m')
-
-            # Wait for the specified interval before the next screenshot
-            time.sleep(self.screenshot_interval)
-            logging.info('========================================================')
+                logging.warning("Failed to extract time, using 'unknown_time'.")
+                job.elapsed_time = "unknown_time"
+        job.probes.clear()
+        self.debug_capture.check(job)
+        return job
+
+    def dedup_stage(self, job):
+        """Compare the map with the last kept frame, and drop or mark redundant frames."""
+        if self.dedup_mode == 'off' or 'map' not in job.regions:
+            return job
+        job.change = self.change_detector.compare(job.regions['map'])
+        if job.change.redundant:
+            logging.info(f"Frame {job.index} is unchanged (hash distance {job.change.distance}).")
+            if self.dedup_mode == 'skip':
+                del job.regions['map']
+        return job
+
+    def export_stage(self, job):
+        """Fold the map into the analytics, and append it to the live GIF and video.
+
+        The live outputs only get frames whose time was read, in capture order. generate_gif
+        also places the frames of unknown time by interpolation, so when there were any, the
+        live outputs are not reused and the GIF and video are encoded again from the index.
+        """
+        if 'map' not in job.regions:
+            return job
+        if self.analytics is not None:
+            try:
+                match_time = job.elapsed_time.replace('_', ':') if job.elapsed_time not in (None, "unknown_time") else None
+                self.analytics.add(job.regions['map'], job.index, match_time)
+            except Exception as e:
+                logging.error(f"Analytics update failed, they are disabled for this session: {e}")
+                self.analytics = None
+        if self.live_gif is None and self.live_video is None:
+            return job
+        if job.change is not None and job.change.redundant:
+            return job
+        if job.elapsed_time == "unknown_time":
+            self.live_unknown_frames += 1
+            return job
+        label = job.elapsed_time.replace('_', ':')
+        if self.live_gif is not None:
+            try:
+                self.live_gif.add_frame(Image.fromarray(job.regions['map']), label)
+            except Exception as e:
+                logging.error(f"Live GIF encoding failed, it will be generated after the session: {e}")
+                self.live_gif = None
+        if self.live_video is not None:
+            try:
+                self.live_video.add_frame(job.regions['map'], label)
+            except Exception as e:
+                logging.error(f"Live video encoding failed, it will be generated after the session: {e}")
+                self.live_video = None
+        return job
+
+    def encode_stage(self, job):
+        """Encode the map, and the time crop it was timed from, in memory with the configured codec."""
+        if 'map' in job.regions:
+            prefix = 'burst' if job.burst else 'map'
+            filename, data = self.frame_store.encode(f"{prefix}_{job.index}_{job.elapsed_time}", job.regions['map'], container=True)
+            job.map_filename = filename
+            job.encoded[filename] = data
+            if 'time' in job.regions:
+                filename, data = self.frame_store.encode(os.path.join(TIME_CROPS_FOLDER, f"time_{job.index}"), job.regions['time'])
+                job.time_crop_filename = filename
+                job.encoded[filename] = data
+        job.regions.clear()
+        return job
+
+    def write_stage(self, job):
+        """Write the encoded frames to the session folder or its packed container, then index them."""
+        map_filename = None
+        map_offset = None
+        time_crop = None
+        for filename, data in job.encoded.items():
+            try:
+                offset = self.frame_store.write(filename, data, job.index)
+                logging.info(f"Saved {filename}")
+                if filename == job.map_filename:
+                    map_filename = filename
+                    map_offset = offset
+                elif filename == job.time_crop_filename:
+                    time_crop = filename
+            except Exception as e:
+                logging.error(f"Failed to save {filename}: {e}")
+        try:
+            self.session_index.append(frame_record(job, map_filename, map_offset, time_crop))
+        except Exception as e:
+            logging.error(f"Failed to index frame {job.index}: {e}")
 
     def stop_session(self):
         self.is_running = False
+        self.stop_event.set()
         logging.info("Screenshot session stopped.")
         self.update_ui()
 
@@ -420,125 +865,260 @@ class ScreenshotApp:
             self.save_config()
 
     def generate_gif(self):
-        gif_created=False
-        gif_name='session.gif'
+        """Generate the GIF (and video) of the last session, then copy them, in the background."""
         if not self.session_folder or not os.path.exists(self.session_folder):
             logging.warning("No session folder found to generate GIF.")
             messagebox.showwarning("No Session", "No session folder found to generate GIF.")
             return
+        if not self.check_jobs_idle():
+            return
 
-        # After the session stops, merge images into a GIF
-        try:
-            # Collect image files, excluding those with 'unknown_time' in the filename
-            image_files = [
-                f for f in os.listdir(self.session_folder)
-                if f.endswith('.png') and 'map_' in f and 'unknown_time' not in f
-            ]
-
-            if not image_files:
-                logging.warning("No valid images found to create GIF.")
+        # Everything the job needs is read here, the next session may start while it runs
+        session_folder = self.session_folder
+        export_folder = None
+        if self.export_gif_var.get():
+            formatted_time = time.strftime("%Y_%m_%d_%H_%M_%S", time.localtime(self.start_time))
+            export_folder = os.path.join(self.gif_export_folder, formatted_time)
+        # Outputs encoded live are complete once their session has stopped
+        reuse_gif = self.live_gif_folder == session_folder
+        reuse_video = self.live_video_folder == session_folder
+
+        self.jobs.submit(
+            'Generate GIF',
+            lambda job: self.export_session(job, session_folder, export_folder, reuse_gif, reuse_video),
+            self.on_export_done
+        )
+
+    def export_session(self, job, session_folder, export_folder, reuse_gif, reuse_video):
+        """Job: encode the GIF and video of a session and copy them to the export folder.
+
+        Returns the paths of the created and copied files.
+        """
+        gif_name = GIF_NAME
+        outputs = [(gif_name, reuse_gif, self.encode_session_gif)]
+        if self.video_export:
+            outputs.append((video_filename(self.video_codec), reuse_video, self.encode_session_video))
+
+        created = []
+        frames = None
+        for name, reuse, encode in outputs:
+            filepath = os.path.join(session_folder, name)
+            if reuse and os.path.exists(filepath):
+                # Already encoded during the session
+                logging.info(f"Using the {name} encoded during the session: {filepath}")
+                created.append(name)
+                continue
+            if frames is None:
+                frames = self.session_frames(session_folder)
+            if encode(frames, filepath, lambda done, total: job.progress(done, total, f"Encoding {name}")):
+                created.append(name)
+
+        # After the GIF is generated, check if the copy option is enabled
+        copied = []
+        if export_folder and created:
+            # Create subdirectory in the target location (if necessary)
+            os.makedirs(export_folder, exist_ok=True)
+            for i, name in enumerate(created):
+                job.progress(i, len(created), f"Copying {name}")
+                destination_path = os.path.join(export_folder, name)
+                shutil.copy(os.path.join(session_folder, name), destination_path)
+                logging.info(f"{name} copied to {destination_path}")
+                copied.append(destination_path)
+        return [os.path.join(session_folder, name) for name in created], copied
+
+    def on_export_done(self, job, result, error):
+        if job.status == 'cancelled':
+            logging.info("GIF generation cancelled.")
+        elif error is not None:
+            messagebox.showerror("Error", f"Failed to create GIF: {error}")
+        else:
+            created, copied = result
+            if not created:
                 messagebox.showwarning("No Images", "No valid images found to create GIF.")
                 return
+            message = "Saved as:\n" + "\n".join(created)
+            if copied:
+                message += "\n\nCopied to:\n" + "\n".join(copied)
+            messagebox.showinfo("GIF Created", message)
+
+    def session_frames(self, session_folder):
+        """The (source, label) frames of a session, as generate_gif uses them."""
+        # Read the frames from the session index, sessions captured before it existed fall back to filenames
+        records = load_index(session_folder)
+        if records is None:
+            records = legacy_records(session_folder)
+
+        # Frames whose time could not be read are placed between their neighbors,
+        # redundant frames and frames with no usable time are left out
+        return gif_frames(session_folder, interpolate_times(records))
+
+    def encode_session_gif(self, frames, gif_filepath, progress=None):
+        """Merge the session images into a GIF, return True if it was created."""
+        if not frames:
+            logging.warning("No valid images found to create GIF.")
+            return False
+
+        # Frames are decoded, annotated and written one at a time
+        if write_gif(frames, gif_filepath, self.gif_frame_duration * 1000, self.gif_palette_sample,
+                     optimize=self.gif_delta_frames, workers=self.gif_workers, progress=progress):
+            return True
+        logging.warning("No valid images found to create GIF.")
+        return False
 
-            # Define the sorting key function
-            def get_sort_key(filename):
-                match = re.match(r"map_(\d+)_(\d+)_(\d+)\.png", filename)
-                if match:
-                    # You can choose to sort by screenshot count or in-game time
-                    # For sorting by in-game time:
-                    minutes = int(match.group(2))
-                    seconds = int(match.group(3))
-                    total_seconds = minutes * 60 + seconds
-                    return total_seconds
-                else:
-                    logging.warning(f"Filename does not match expected pattern: {filename}")
-                    return float('inf')  # Push invalid filenames to the end
-
-            # Sort the image files using the sorting key
-            image_files.sort(key=get_sort_key)
-
-            images = []
-
-            for filename in image_files:
-                filepath = os.path.join(self.session_folder, filename)
-
-                # Extract the elapsed_time from the filename
-                match = re.match(r"map_\d+_(\d+)_(\d+)\.png", filename)
-                if match:
-                    elapsed_time = f"{match.group(1)}:{match.group(2)}"  # MM:SS format
-                else:
-                    logging.warning(f"Filename does not match expected pattern: {filename}")
-                    continue  # Skip files with unexpected names
-
-                # Open the image
-                image = Image.open(filepath).convert('RGBA')
-
-                # Create a transparent overlay
-                overlay = Image.new('RGBA', image.size, (255, 255, 255, 0))
-                draw = ImageDraw.Draw(overlay)
-
-                # Choose a font
-                try:
-                    font = ImageFont.truetype("arial.ttf", 40)
-                except IOError:
-                    font = ImageFont.load_default()
-
-                # Calculate position for the text (bottom left)
-                bbox = font.getbbox(elapsed_time)
-                text_width = bbox[2] - bbox[0]
-                text_height = bbox[3] - bbox[1]
-                text_position = (10, image.size[1] - text_height - 10)
-
-                # Draw the text onto the overlay
-                draw.text(text_position, elapsed_time, font=font, fill=(255, 0, 0, 128))
-
-                # Composite the overlay onto the image
-                combined = Image.alpha_composite(image, overlay)
-
-                images.append(combined)
-
-            if images:
-                gif_filepath = os.path.join(self.session_folder, gif_name )
-                images[0].save(
-                    gif_filepath,
-                    save_all=True,
-                    append_images=images[1:],
-                    format='GIF',
-                    duration=float(self.gif_frame_duration * 1000),
-                    loop=0
-                )
-                logging.info(f"Saved GIF animation: {gif_filepath}")
-                messagebox.showinfo("GIF Created", f"GIF saved as {gif_filepath}")
-                gif_created=True 
-            else:
-                logging.warning("No valid images found to create GIF.")
-                messagebox.showwarning("No Images", "No valid images found to create GIF.")
-        except Exception as e:
-            logging.error(f"Failed to create GIF: {e}")
-            messagebox.showerror("Error", f"Failed to create GIF: {e}")
+    def encode_session_video(self, frames, video_filepath, progress=None):
+        """Encode the session frames to a video, return True if it was created."""
+        if write_video(frames, video_filepath, self.video_codec, self.video_fps, self.video_scale, progress):
+            logging.info(f"Video saved as {video_filepath}")
+            return True
+        logging.warning("No valid images found to create the video.")
+        return False
 
-        # After the GIF is generated, check if the copy option is enabled
+    def reprocess_last_session(self):
+        """Re-time and re-index the last session from its saved time crops, in the background."""
+        if not self.session_folder or not os.path.exists(self.session_folder):
+            messagebox.showwarning("No Session", "No session folder found to reprocess.")
+            return
+        if self.is_running:
+            messagebox.showwarning("Session Running", "Stop the session before reprocessing it.")
+            return
+        if not self.check_jobs_idle():
+            return
 
-        if self.export_gif_var.get() :
-            formatted_time = time.strftime("%Y_%m_%d_%H_%M_%S", time.localtime(self.start_time))
-            target_folder = os.path.join(  self.gif_export_folder , formatted_time ) 
-            if gif_created : 
-                try:
-                    
-                    # Create subdirectory in the target location (if necessary)
-                    os.makedirs(target_folder,  exist_ok=True)
-                    
-                    # Define the destination path for the GIF
-                    destination_path = os.path.join(target_folder, gif_name)
-                    
-                    # Copy the generated GIF to the target location
-                    shutil.copy(gif_filepath, destination_path)  # Adjust source path accordingly
-                    
-                    logging.info(f"GIF copied to {destination_path}")
-                    messagebox.showinfo("GIF Copied", f"GIF successfully copied to {destination_path}")
-                except Exception as e:
-                    logging.error(f"Error copying GIF: {e}")
-                    messagebox.showerror("Error", f"Failed to copy GIF: {e}")
+        session_folder = self.session_folder
+        config_file = self.config_file
+
+        def reprocess(job):
+            return reprocess_session(
+                session_folder, load_settings(config_file), self.gif_workers,
+                lambda done, total: job.progress(done, total, "Reprocessing frames"), gif=False
+            )
+
+        self.jobs.submit('Reprocess session', reprocess, lambda job, records, error: self.on_reprocess_done(session_folder, job, records, error))
+
+    def on_reprocess_done(self, session_folder, job, result, error):
+        if job.status == 'cancelled':
+            logging.info("Reprocessing cancelled, the session index was left unchanged.")
+        elif error is not None:
+            messagebox.showerror("Error", f"Failed to reprocess the session: {error}")
+        else:
+            # The GIF and video encoded live used the previous times
+            if self.live_gif_folder == session_folder:
+                self.live_gif_folder = None
+            if self.live_video_folder == session_folder:
+                self.live_video_folder = None
+            records, reread = result
+            timed = sum(1 for record in records if record.get('match_time'))
+            messagebox.showinfo(
+                "Session Reprocessed",
+                f"{len(records)} frames, {reread} re-read from their saved time crops, {timed} with a match time. "
+                "Generate the GIF again to use them."
+            )
+
+    def apply_hud_profile(self, profile):
+        """Use the regions and OCR preprocessing of a HUD profile from now on."""
+        self.hud_profile = profile
+        self.regions = profile.regions
+        logging.info(f"HUD profile: {profile}")
+        # The reference layout is only exact on 16:9 screens
+        if profile.source == 'reference' and self.screen_width * 9 != self.screen_height * 16:
+            logging.warning(
+                f"No HUD profile for {self.screen_width}x{self.screen_height} at UI scale {self.ui_scale:g}, "
+                f"the regions may be off. Use 'Calibrate HUD' once."
+            )
+
+    def calibrate_hud(self):
+        """Measure the HUD regions in game, in the background."""
+        if self.is_running:
+            messagebox.showwarning("Session Running", "Stop the session before calibrating the HUD.")
+            return
+        if not self.check_jobs_idle():
+            return
+        messagebox.showinfo(
+            "Calibrate HUD",
+            f"Switch to the game within {self.initial_delay} seconds, with the map closed and the chat not open. "
+            f"The map will be toggled {self.calibration_pairs} times."
+        )
+        self.jobs.submit('Calibrate HUD', self.run_calibration, self.on_calibration_done)
+
+    def run_calibration(self, job):
+        """Job: grab the screen with the map closed and open a few times, return the measured HUD profile."""
+        for second in range(self.initial_delay):
+            job.progress(second, self.initial_delay, "Calibration starts soon")
+            time.sleep(1)
+        screen = {'screen': (0, 0, self.screen_width, self.screen_height)}
+        pairs = []
+        for i in range(self.calibration_pairs):
+            job.progress(i, self.calibration_pairs, "Calibrating HUD")
+            closed = self.capture_backend.grab(screen)['screen'].copy()
+            self.keyboard.press('m')
+            self.keyboard.release('m')
+            time.sleep(0.5)  # The map fades in
+            opened = self.capture_backend.grab(screen)['screen'].copy()
+            self.keyboard.press('m')
+            self.keyboard.release('m')
+            time.sleep(0.5)
+            pairs.append((closed, opened))
+        job.progress(self.calibration_pairs, self.calibration_pairs, "Measuring the HUD")
+        return calibrate(pairs, self.ui_scale, read_text=lambda image: self.ocr.recognize(image, psm=7))
+
+    def on_calibration_done(self, job, profile, error):
+        if job.status == 'cancelled':
+            logging.info("HUD calibration cancelled.")
+        elif error is not None:
+            messagebox.showerror("Error", f"Failed to calibrate the HUD: {error}")
+        else:
+            try:
+                save_profile(self.hud_profile_file, profile)
+            except OSError as e:
+                logging.error(f"Failed to save the HUD profile: {e}")
+            self.apply_hud_profile(profile)
+            left, top, right, bottom = profile.regions['map']
+            messagebox.showinfo(
+                "HUD Calibrated",
+                f"Map found at {left},{top} ({right - left}x{bottom - top}). "
+                f"The profile of {self.screen_width}x{self.screen_height} is used from now on."
+            )
+
+    def check_jobs_idle(self):
+        """Return True if no background job is running, tell the user otherwise."""
+        active = self.jobs.active()
+        if active:
+            messagebox.showinfo("Busy", f"Wait for '{active[0].name}' to finish or cancel it.")
+            return False
+        return True
+
+    def on_job_progress(self, job):
+        """Show the progress of the current background job."""
+        active = self.jobs.active()
+        if not active:
+            self.job_label.config(text="No background jobs")
+            self.job_progress.config(value=0, maximum=1)
+            self.cancel_job_button.config(state=tk.DISABLED)
+            self.generate_gif_button.config(state=tk.NORMAL)
+            self.reprocess_button.config(state=tk.NORMAL)
+            self.calibrate_button.config(state=tk.NORMAL)
+            return
+        job = active[0]
+        text = job.message or job.name
+        if job.total:
+            text += f" ({job.done}/{job.total})"
+        self.job_label.config(text=text)
+        self.job_progress.config(value=job.done, maximum=max(job.total, 1))
+        self.cancel_job_button.config(state=tk.NORMAL)
+        self.generate_gif_button.config(state=tk.DISABLED)
+        self.reprocess_button.config(state=tk.DISABLED)
+        self.calibrate_button.config(state=tk.DISABLED)
+
+    def cancel_jobs(self):
+        self.jobs.cancel_all()
+        self.job_label.config(text="Cancelling...")
+
+    def on_close(self):
+        """Stop the session and the background jobs, then close the window."""
+        if self.is_running:
+            self.stop_session()
+        self.jobs.shutdown()
+        self.root.destroy()
 
     def toggle_gif_copy(self):
         """Toggle the display of the GIF export folder based on the checkbox state."""
@@ -573,10 +1153,12 @@ class ScreenshotApp:
             self.start_button.config(state=tk.DISABLED)
             self.stop_button.config(state=tk.NORMAL)
             self.change_folder_button.config(state=tk.DISABLED)
+            self.save_burst_button.config(state=tk.NORMAL)
         else:
             self.start_button.config(state=tk.NORMAL)
             self.stop_button.config(state=tk.DISABLED)
             self.change_folder_button.config(state=tk.NORMAL)
+            self.save_burst_button.config(state=tk.DISABLED)
         self.update_elapsed_time()
 
     def update_elapsed_time(self):
@@ -586,7 +1168,12 @@ class ScreenshotApp:
         if self.is_running:
             self.root.after(1000, self.update_elapsed_time)
 
-if __name__ == "__main__":
+def main():
+    setup_logging()
     root = tk.Tk()
-    app = ScreenshotApp(root)
+    ScreenshotApp(root)
     root.mainloop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,172 @@
+"""Frame storage: configurable codecs and an optional packed, memory-mappable container.
+
+Frames are encoded by the pipeline's encode workers and written by its write worker,
+so neither the codec nor the disk ever run on the capture thread. Supported codecs:
+
+- png: zlib level set by `compress_level` (1 is several times faster than Pillow's default 6)
+- webp: lossless WebP
+- raw: uncompressed NumPy .npy files
+
+With `packed`, map frames are instead appended as fixed-size raw records to a single
+`frames.bin` per session, which avoids a file creation per frame and can be read back
+with `open_packed` as one memory-mapped (frames, height, width, 3) array.
+"""
+
+import io
+import os
+import json
+import threading
+from collections import namedtuple
+
+import numpy as np
+from PIL import Image
+
+
+CODEC_EXTENSIONS = {'png': '.png', 'webp': '.webp', 'raw': '.npy'}
+
+PACKED_FILENAME = 'frames.bin'
+PACKED_META_FILENAME = 'frames.json'
+PACKED_HEADER_SIZE = 16  # frame index, height, width, reserved: 4 little-endian uint32
+
+# Geometry of the packed containers already read, by session folder
+_packed_meta_cache = {}
+
+# Location of a frame inside a packed container, picklable for worker processes
+PackedFrameRef = namedtuple('PackedFrameRef', 'path offset height width')
+
+
+def encode_image(array, codec='png', compress_level=1):
+    """Encode an RGB array with a codec and return the bytes."""
+    buffer = io.BytesIO()
+    if codec == 'png':
+        Image.fromarray(array).save(buffer, format='PNG', compress_level=compress_level)
+    elif codec == 'webp':
+        Image.fromarray(array).save(buffer, format='WEBP', lossless=True, method=0)
+    elif codec == 'raw':
+        np.save(buffer, array)
+    else:
+        raise ValueError(f"Unknown frame codec: {codec}")
+    return buffer.getvalue()
+
+
+def open_frame(source):
+    """Open a stored frame, from a file path or a PackedFrameRef, as an RGB PIL image."""
+    if isinstance(source, PackedFrameRef):
+        pixels = np.fromfile(
+            source.path, dtype=np.uint8, count=source.height * source.width * 3,
+            offset=source.offset + PACKED_HEADER_SIZE
+        )
+        return Image.fromarray(pixels.reshape(source.height, source.width, 3))
+    if source.endswith('.npy'):
+        return Image.fromarray(np.load(source))
+    with Image.open(source) as image:
+        return image.convert('RGB')
+
+
+class FrameStore:
+    """Encode and write the frames of a session."""
+
+    def __init__(self, session_folder, codec='png', compress_level=1, packed=False):
+        if codec not in CODEC_EXTENSIONS:
+            raise ValueError(f"Unknown frame codec: {codec}")
+        self.session_folder = session_folder
+        self.codec = codec
+        self.compress_level = compress_level
+        self.packed = packed
+        self.extension = CODEC_EXTENSIONS[codec]
+        self.lock = threading.Lock()
+        self.packed_file = None
+        self.packed_shape = None
+        self.bytes_written = 0
+
+    def encode(self, name, array, container=False):
+        """Encode a region named `name` (without extension), return (filename, payload).
+
+        Frames sent to the container are not encoded, their payload is the array itself.
+        """
+        if container and self.packed:
+            return PACKED_FILENAME, array
+        return name + self.extension, encode_image(array, self.codec, self.compress_level)
+
+    def write(self, filename, payload, frame_index=0):
+        """Write an encoded payload, return the offset of the record for the container, otherwise None."""
+        if filename == PACKED_FILENAME:
+            return self._append_packed(payload, frame_index)
+        with open(os.path.join(self.session_folder, filename), 'wb') as f:
+            f.write(payload)
+        with self.lock:
+            self.bytes_written += len(payload)
+        return None
+
+    def _append_packed(self, array, frame_index):
+        with self.lock:
+            if self.packed_file is None:
+                self._open_packed(array.shape)
+            if array.shape != self.packed_shape:
+                raise ValueError(f"Frame shape {array.shape} does not match the container shape {self.packed_shape}")
+            offset = self.packed_file.tell()
+            header = np.array([frame_index, array.shape[0], array.shape[1], 0], dtype='<u4')
+            self.packed_file.write(header.tobytes())
+            self.packed_file.write(np.ascontiguousarray(array).tobytes())
+            self.packed_file.flush()
+            self.bytes_written += PACKED_HEADER_SIZE + array.nbytes
+            return offset
+
+    def _open_packed(self, shape):
+        self.packed_shape = shape
+        meta = {
+            'height': shape[0],
+            'width': shape[1],
+            'header_size': PACKED_HEADER_SIZE,
+            'record_size': PACKED_HEADER_SIZE + shape[0] * shape[1] * 3,
+        }
+        with open(os.path.join(self.session_folder, PACKED_META_FILENAME), 'w') as f:
+            json.dump(meta, f)
+        self.packed_file = open(os.path.join(self.session_folder, PACKED_FILENAME), 'ab')
+
+    def close(self):
+        with self.lock:
+            if self.packed_file is not None:
+                self.packed_file.close()
+                self.packed_file = None
+
+
+def load_packed_meta(session_folder):
+    """Read the frame geometry of a session's packed container, or None if it has none."""
+    meta = _packed_meta_cache.get(session_folder)
+    if meta is None:
+        meta_path = os.path.join(session_folder, PACKED_META_FILENAME)
+        if not os.path.exists(meta_path):
+            return None
+        with open(meta_path) as f:
+            meta = _packed_meta_cache[session_folder] = json.load(f)
+    return meta
+
+
+def open_packed(session_folder):
+    """Memory-map the packed container of a session.
+
+    Returns a record array with 'frame' (capture index) and 'pixels' ((height, width, 3) uint8)
+    fields, or None if the session has no container.
+    """
+    meta = load_packed_meta(session_folder)
+    if meta is None:
+        return None
+    dtype = np.dtype([
+        ('frame', '<u4'),
+        ('height', '<u4'),
+        ('width', '<u4'),
+        ('reserved', '<u4'),
+        ('pixels', np.uint8, (meta['height'], meta['width'], 3)),
+    ])
+    path = os.path.join(session_folder, PACKED_FILENAME)
+    count = os.path.getsize(path) // dtype.itemsize
+    return np.memmap(path, dtype=dtype, mode='r', shape=(count,))
+
+
+def frame_source(session_folder, record):
+    """Return what open_frame needs to load the frame of an index record."""
+    if record['file'] == PACKED_FILENAME:
+        meta = load_packed_meta(session_folder)
+        return PackedFrameRef(os.path.join(session_folder, PACKED_FILENAME), record['offset'], meta['height'], meta['width'])
+    return os.path.join(session_folder, record['file'])
@@ -0,0 +1,61 @@
+"""Tests of the pipeline stages: ordering and back-pressure of an ordered stage behind a multi-worker stage."""
+
+import os
+import sys
+import time
+import threading
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pipeline import FrameJob, Stage, Pipeline  # noqa: E402
+
+
+def _jitter(job):
+    """Upstream handler finishing items out of order: even items are slower than odd ones."""
+    time.sleep(0.003 if job.index % 2 == 0 else 0)
+    return job
+
+
+class OrderedStageTest(unittest.TestCase):
+
+    def run_pipeline(self, frames, sink_delay, sink_maxsize=8):
+        seen = []
+
+        def sink(job):
+            time.sleep(sink_delay)
+            seen.append(job.index)
+
+        pipeline = Pipeline([
+            Stage('ocr', _jitter, workers=2, maxsize=4),
+            Stage('dedup', lambda job: job, maxsize=8, ordered=True),
+            Stage('sink', sink, maxsize=sink_maxsize),
+        ])
+        pipeline.start()
+        submitted = []
+        for index in range(frames):
+            job = FrameJob(index, time.monotonic(), time.time())
+            # Feed at the speed of the sink, so the bounded queues stay full without dropping at the first stage
+            while not pipeline.submit(job):
+                time.sleep(0.001)
+            submitted.append(index)
+
+        # Stop must return even while the downstream queues are full
+        stopper = threading.Thread(target=pipeline.stop, daemon=True)
+        stopper.start()
+        stopper.join(timeout=30)
+        self.assertFalse(stopper.is_alive(), "Pipeline.stop() deadlocked")
+        return submitted, seen
+
+    def test_items_keep_submission_order(self):
+        submitted, seen = self.run_pipeline(200, sink_delay=0)
+        self.assertEqual(seen, submitted)
+
+    def test_slow_sink_does_not_deadlock(self):
+        # A sink slower than the producers fills the ordered stage's queue, while upstream workers hand items over
+        submitted, seen = self.run_pipeline(60, sink_delay=0.01, sink_maxsize=1)
+        self.assertEqual(seen, submitted)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,68 @@
+"""Tests of the offline replay: the OCR fallbacks of a chunk of frames go to Tesseract in one batch."""
+
+import os
+import sys
+import tempfile
+import unittest
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import replay  # noqa: E402
+
+
+class FakeOcrService:
+    """Stands in for the OCR service, recording the size of every request."""
+
+    requests = []
+
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def recognize(self, image, psm=7):
+        return self.recognize_batch([image], psm)[0]
+
+    def recognize_batch(self, images, psm=7):
+        self.requests.append(len(images))
+        return ['CURRENT MATCH 12:34'] * len(images)
+
+    def close(self):
+        pass
+
+
+def read_time(task):
+    """Task reading the time of a flat crop through the OCR fallback only, None when deferred."""
+    analyzer = replay._get_analyzer((1920, 1080))
+    deferrals = analyzer.deferrals
+    text = analyzer.read_time_crop(np.full((8, 40, 3), task, np.uint8))
+    return None if analyzer.deferrals != deferrals else (task, text)
+
+
+class BatchedFallbackTest(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.ocr_service = replay.OcrService
+        replay.OcrService = FakeOcrService
+        FakeOcrService.requests = []
+        settings = replay.load_settings(os.path.join(os.path.dirname(replay.__file__), 'config.ini'))
+        for key in ('chat_templates_folder', 'timer_atlas_folder', 'hud_profile_file'):
+            settings[key] = os.path.join(self.folder.name, key)
+        replay._init_worker(settings)
+
+    def tearDown(self):
+        replay._close_analyzers()
+        replay.OcrService = self.ocr_service
+        self.folder.cleanup()
+
+    def test_chunk_is_recognized_in_one_request(self):
+        # Two chunks, the second repeating a crop of the first, which is not recognized again
+        first = replay._run_chunk(read_time, list(range(10)))
+        second = replay._run_chunk(read_time, [9, 10, 11])
+        self.assertEqual(first + second, [(task, '12_34') for task in list(range(10)) + [9, 10, 11]])
+        self.assertEqual(FakeOcrService.requests, [10, 2])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,456 @@
+"""Glyph-based reader for the "CURRENT MATCH MM:SS" timer, with Tesseract as a fallback.
+
+The timer uses a fixed HUD font, so once a few digits have been seen at a given
+resolution they can be recognized by comparing binarized glyphs, which is much
+faster and more deterministic than running Tesseract on every frame.
+
+Run `python timer_reader.py <folder>` on a folder of raw time-region crops (for example
+the `debug` folder of a session) to compare accuracy and latency with Tesseract.
+"""
+
+import os
+import re
+import sys
+import time
+import hashlib
+import logging
+import threading
+from collections import OrderedDict, namedtuple
+
+import cv2
+import numpy as np
+from PIL import Image
+
+from session_index import match_seconds
+
+
+GLYPH_HEIGHT = 16
+GLYPH_WIDTH = 12
+
+# text is the in-game time as MM_SS (the format used in frame filenames) or None.
+# source is 'glyph' for the atlas, 'ocr' for the fallback and 'cache' for memoized regions.
+TimerReading = namedtuple('TimerReading', 'text confidence source')
+
+
+def parse_time_text(text):
+    """Parse OCR output such as "CURRENT MATCH 12:34" and return "12_34", or None."""
+    if "CURRENT MATCH" in text:
+        # Extract the last part which should contain the time in MM:SS format
+        time_parts = text.split()[-1]
+
+        # Validate the time format using regular expression: MM:SS where MM can be > 60 but SS <= 60
+        if re.match(r"^\d{2,3}:\d{2}$", time_parts):
+            minutes, seconds = map(int, time_parts.split(":"))
+            if seconds < 60:  # Ensure the seconds are valid
+                logging.info(f"Successfully extracted time: {time_parts}")
+                return time_parts.replace(":", "_")  # Convert MM:SS to MM_SS for filename
+            else:
+                logging.warning(f"Invalid time format with seconds > 60: {time_parts}")
+    else:
+        logging.warning("Failed to find 'CURRENT MATCH' in extracted text.")
+    return None
+
+
+def binarize(crop):
+    """Binarize a raw RGB crop with Otsu's threshold, text pixels (the minority) set to 1."""
+    gray = cv2.cvtColor(crop, cv2.COLOR_RGB2GRAY)
+    _, binary = cv2.threshold(gray, 0, 1, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+    if binary.mean() > 0.5:
+        binary = 1 - binary
+    return binary
+
+
+def _runs(mask):
+    """Return the (start, stop) index pairs of the True runs of a 1-D mask."""
+    padded = np.concatenate(([0], mask.astype(np.int8), [0]))
+    edges = np.flatnonzero(np.diff(padded))
+    return list(zip(edges[::2], edges[1::2]))
+
+
+def _ink_box(binary, x0, x1):
+    """Crop columns x0:x1 of a binary region to their ink."""
+    piece = binary[:, x0:x1]
+    rows = np.flatnonzero(piece.any(axis=1))
+    return piece[rows[0]:rows[-1] + 1]
+
+
+def segment_time_glyphs(binary):
+    """Split the binarized time region into the digit glyphs of "MM:SS".
+
+    The glyphs are found around the colon, the third glyph from the right: the two after it
+    are the seconds, and the minutes are the 1-3 glyphs before it that sit where digits of
+    the seconds' pitch would be. Word gaps are not used, the space after "MATCH" is often
+    narrower than the spacing of a narrow digit such as "1".
+
+    Returns the list of digit glyphs (2-D arrays cropped to their ink), or None when the
+    region does not end with digits around a colon.
+    """
+    spans = [(x0, x1) for x0, x1 in _runs(binary.any(axis=0)) if binary[:, x0:x1].sum() > 1]
+    # Text cut off by the right edge of the region cannot be read
+    if len(spans) < 4 or spans[-1][1] >= binary.shape[1]:
+        return None
+    glyphs = [_ink_box(binary, x0, x1) for x0, x1 in spans]
+    centers = [(x0 + x1) / 2 for x0, x1 in spans]
+
+    # The colon: narrower than the digits around it, with two separate dots
+    colon = len(spans) - 3
+    digit_width = max(glyphs[-1].shape[1], glyphs[-2].shape[1])
+    digit_height = max(glyphs[-1].shape[0], glyphs[-2].shape[0])
+    if glyphs[colon].shape[1] > 0.7 * digit_width or len(_runs(glyphs[colon].any(axis=1))) < 2:
+        return None
+
+    # Digit cells follow each other at a fixed pitch, and the colon sits halfway between both numbers
+    pitch = centers[-1] - centers[-2]
+    expected = centers[colon] - (centers[-2] - centers[colon])
+    minutes = []
+    for i in range(colon - 1, max(colon - 4, -1), -1):
+        glyph = glyphs[i]
+        if abs(centers[i] - expected) > 0.3 * pitch or abs(glyph.shape[0] - digit_height) > 0.25 * digit_height \
+                or glyph.shape[1] > pitch:
+            break
+        minutes.insert(0, glyph)
+        expected -= pitch
+    if not minutes:
+        return None
+    return minutes + glyphs[-2:]
+
+
+def normalize_glyph(glyph):
+    """Scale a glyph to the atlas height, keeping its aspect ratio, and center it in a fixed box."""
+    height, width = glyph.shape
+    new_width = int(np.clip(round(width * GLYPH_HEIGHT / height), 1, GLYPH_WIDTH))
+    resized = cv2.resize(glyph.astype(np.uint8) * 255, (new_width, GLYPH_HEIGHT), interpolation=cv2.INTER_AREA) > 127
+    box = np.zeros((GLYPH_HEIGHT, GLYPH_WIDTH), dtype=bool)
+    offset = (GLYPH_WIDTH - new_width) // 2
+    box[:, offset:offset + new_width] = resized
+    return box.ravel()
+
+
+def region_key(binary):
+    """Hash of a binarized region, equal for regions showing the same text."""
+    return hashlib.blake2b(np.packbits(binary).tobytes() + bytes(str(binary.shape), 'ascii'), digest_size=16).digest()
+
+
+class GlyphAtlas:
+    """A few reference samples of each digit, compared by Hamming distance."""
+
+    def __init__(self, max_samples=5):
+        self.max_samples = max_samples
+        self.samples = {str(digit): [] for digit in range(10)}
+        self._matrix = None
+
+    def is_complete(self):
+        return all(self.samples.values())
+
+    def add(self, digit, vector):
+        """Add a sample, return True if the atlas changed."""
+        if len(self.samples[digit]) >= self.max_samples:
+            return False
+        if any(np.array_equal(vector, known) for known in self.samples[digit]):
+            return False
+        self.samples[digit].append(vector)
+        self._matrix = None
+        return True
+
+    def _build(self):
+        labels = [digit for digit, vectors in self.samples.items() for _ in vectors]
+        vectors = [vector for vectors in self.samples.values() for vector in vectors]
+        self._matrix = (np.array(labels), np.stack(vectors) if vectors else None)
+
+    def classify(self, vector):
+        """Return (digit, confidence), confidence being 1 - best / best-other-digit distance."""
+        if self._matrix is None:
+            self._build()
+        labels, matrix = self._matrix
+        if matrix is None:
+            return None, 0.0
+        distances = np.count_nonzero(matrix != vector, axis=1)
+        best = int(np.argmin(distances))
+        digit = labels[best]
+        others = distances[labels != digit]
+        if not others.size:
+            return digit, 0.0
+        return digit, 1.0 - distances[best] / max(int(others.min()), 1)
+
+    def save(self, path):
+        self._build()
+        labels, matrix = self._matrix
+        if matrix is None:
+            return
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        # Write then rename, several replay processes may learn glyphs at the same time
+        temp_path = f"{path}.{os.getpid()}.part"
+        with open(temp_path, 'wb') as f:
+            np.savez_compressed(f, labels=labels, vectors=matrix)
+        os.replace(temp_path, path)
+
+    @classmethod
+    def load(cls, path, max_samples=5):
+        atlas = cls(max_samples)
+        with np.load(path) as data:
+            for digit, vector in zip(data['labels'], data['vectors']):
+                atlas.samples[str(digit)].append(vector.astype(bool))
+        return atlas
+
+
+class TimerReader:
+    """Read the match timer from raw time-region crops.
+
+    The glyph atlas is stored per screen resolution in `atlas_folder` and bootstrapped
+    from the OCR `fallback`, which receives the raw crop and returns "MM_SS" or None.
+    Readings with a time are memoized by a hash of the binarized region.
+    """
+
+    def __init__(self, atlas_folder, resolution, min_confidence=0.5, fallback=None, cache_size=512):
+        self.atlas_path = os.path.join(atlas_folder, f"timer_atlas_{resolution[0]}x{resolution[1]}.npz")
+        self.min_confidence = min_confidence
+        self.fallback = fallback
+        self.cache_size = cache_size
+        self.cache = OrderedDict()
+        self.lock = threading.Lock()
+        self.atlas = GlyphAtlas()
+        if os.path.exists(self.atlas_path):
+            try:
+                self.atlas = GlyphAtlas.load(self.atlas_path)
+                logging.info(f"Loaded timer glyph atlas: {self.atlas_path}")
+            except Exception as e:
+                logging.error(f"Failed to load timer glyph atlas {self.atlas_path}: {e}")
+
+    def read(self, crop):
+        """Read a raw RGB time-region crop."""
+        binary = binarize(crop)
+        key = region_key(binary)
+        with self.lock:
+            if key in self.cache:
+                self.cache.move_to_end(key)
+                text, confidence, _ = self.cache[key]
+                return TimerReading(text, confidence, 'cache')
+
+        glyphs = segment_time_glyphs(binary)
+        reading = self.read_glyphs(glyphs) if glyphs else TimerReading(None, 0.0, 'glyph')
+        if reading.confidence < self.min_confidence and self.fallback is not None:
+            text = self.fallback(crop)
+            if text and glyphs:
+                self.learn(glyphs, text)
+            reading = TimerReading(text, reading.confidence, 'ocr')
+
+        # Failed reads are not cached: the next tick of the same region tries the fallback again
+        if reading.text:
+            with self.lock:
+                self.cache[key] = reading
+                if len(self.cache) > self.cache_size:
+                    self.cache.popitem(last=False)
+        return reading
+
+    def read_glyphs(self, glyphs):
+        """Classify segmented digit glyphs against the atlas."""
+        digits = []
+        confidence = 1.0
+        with self.lock:
+            for glyph in glyphs:
+                digit, digit_confidence = self.atlas.classify(normalize_glyph(glyph))
+                if digit is None:
+                    return TimerReading(None, 0.0, 'glyph')
+                digits.append(digit)
+                confidence = min(confidence, digit_confidence)
+        text = f"{''.join(digits[:-2])}_{''.join(digits[-2:])}"
+        if int(text[-2:]) >= 60:
+            return TimerReading(None, 0.0, 'glyph')
+        return TimerReading(text, confidence, 'glyph')
+
+    def learn(self, glyphs, text):
+        """Add the glyphs of a region whose time is known to the atlas, and persist it."""
+        digits = text.replace('_', '')
+        if len(digits) != len(glyphs):
+            return
+        with self.lock:
+            changed = False
+            for digit, glyph in zip(digits, glyphs):
+                changed |= self.atlas.add(digit, normalize_glyph(glyph))
+            if changed:
+                try:
+                    self.atlas.save(self.atlas_path)
+                except Exception as e:
+                    logging.error(f"Failed to save timer glyph atlas {self.atlas_path}: {e}")
+
+
+class TimerTracker:
+    """Follow the match clock and predict the timer instead of reading it on every frame.
+
+    The clock locks after `lock_readings` successful readings consistent with the monotonic
+    clock. While locked, the time is predicted from the monotonic capture time, and the region
+    is only read again every `verify_every` frames, or when a cheap check disagrees with the
+    prediction: the binarized region is unchanged while the predicted time advanced (the game
+    is paused), or it changed while the prediction did not. A verified reading that does not fit
+    the clock within `tolerance` seconds of capture latency (pause, new match) drops the lock.
+    """
+
+    def __init__(self, reader, lock_readings=3, verify_every=10, tolerance=0.25):
+        self.reader = reader
+        self.lock_readings = max(lock_readings, 1)
+        self.verify_every = max(verify_every, 1)
+        self.tolerance = tolerance
+        self.lock = threading.Lock()
+        self.readings = []    # (mono_time, match seconds) consistent with each other, while acquiring
+        self.bounds = None    # (low, high) of match seconds - monotonic time while locked
+        self.frames_since_verify = 0
+        self.last_key = None
+        self.last_label = None
+        self.predictions = 0
+        self.verifications = 0
+
+    @property
+    def locked(self):
+        return self.bounds is not None
+
+    @staticmethod
+    def _offset_bounds(readings):
+        """The timer shows floor(mono_time + offset): intersect the offsets each reading allows."""
+        low = max(seconds - mono_time for mono_time, seconds in readings)
+        high = min(seconds + 1 - mono_time for mono_time, seconds in readings)
+        return low, high
+
+    def predict(self, mono_time):
+        """Predicted match time at a monotonic time as MM_SS, or None when not locked."""
+        if self.bounds is None:
+            return None
+        seconds = int(mono_time + (self.bounds[0] + self.bounds[1]) / 2)
+        return f"{max(seconds, 0) // 60:02d}_{max(seconds, 0) % 60:02d}"
+
+    def read(self, crop, mono_time):
+        """Return the TimerReading of a time-region crop captured at `mono_time`.
+
+        Predicted readings have the source 'tracked'.
+        """
+        key = region_key(binarize(crop))
+        with self.lock:
+            label = self.predict(mono_time)
+            if label is not None:
+                self.frames_since_verify += 1
+                region_changed = key != self.last_key
+                label_changed = label != self.last_label
+                self.last_key, self.last_label = key, label
+                if self.frames_since_verify < self.verify_every and region_changed == label_changed:
+                    self.predictions += 1
+                    return TimerReading(label, 1.0, 'tracked')
+
+        reading = self.reader.read(crop)
+        with self.lock:
+            self.verifications += 1
+            self.last_key = key
+            self._observe(reading, mono_time)
+            self.last_label = self.predict(mono_time)
+            if reading.text is None and self.last_label is not None:
+                # Unreadable frame while locked: keep the prediction, verify again on the next one
+                return TimerReading(self.last_label, 1.0, 'tracked')
+        return reading
+
+    def observe(self, reading, mono_time):
+        """Update the lock with a reading of the timer made outside of the tracker."""
+        with self.lock:
+            self._observe(reading, mono_time)
+
+    def _observe(self, reading, mono_time):
+        if reading.text is None:
+            return
+        seconds = match_seconds(reading.text)
+        if self.bounds is not None:
+            low, high = self.bounds
+            if low - self.tolerance <= seconds - mono_time < high + self.tolerance:
+                # Narrow the offset with the new reading, keeping it valid if both disagree slightly
+                low, high = max(low, seconds - mono_time), min(high, seconds + 1 - mono_time)
+                if low < high:
+                    self.bounds = (low, high)
+                self.frames_since_verify = 0
+                return
+            logging.info(f"Match clock jumped to {reading.text}, re-acquiring it.")
+            self.bounds = None
+            self.readings = []
+
+        readings = [(mono_time, seconds)] + [
+            (other_time, other_seconds) for other_time, other_seconds in self.readings
+            if abs((seconds - other_seconds) - (mono_time - other_time)) < 1 + self.tolerance
+        ]
+        self.readings = sorted(readings)[-self.lock_readings:]
+        if len(self.readings) >= self.lock_readings:
+            low, high = self._offset_bounds(self.readings)
+            if low >= high:
+                # Readings a little off, e.g. captured late: center a one second window between them
+                middle = (low + high) / 2
+                low, high = middle - 0.5, middle + 0.5
+            self.bounds = (low, high)
+            self.frames_since_verify = 0
+            self.readings = []
+            logging.info(f"Locked onto the match clock at {reading.text}.")
+
+    def stats(self):
+        return {'locked': self.locked, 'predictions': self.predictions, 'verifications': self.verifications}
+
+
+def tesseract_read(crop):
+    """The original Tesseract path: preprocess, OCR with --psm 7 and parse."""
+    import pytesseract
+    from hud import preprocess_image
+    return parse_time_text(pytesseract.image_to_string(preprocess_image(crop), config='--psm 7').strip())
+
+
+def compare_with_tesseract(crops, atlas_folder, resolution):
+    """Read every crop with the glyph reader and with Tesseract, return accuracy and latency figures.
+
+    The reader falls back to Tesseract like it does live, so its atlas is bootstrapped on the
+    first crops; Tesseract results are taken as ground truth.
+    """
+    reader = TimerReader(atlas_folder, resolution, fallback=tesseract_read)
+    glyph_times, ocr_times = [], []
+    agree = known = fallbacks = 0
+    for crop in crops:
+        start = time.perf_counter()
+        expected = tesseract_read(crop)
+        ocr_times.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        reading = reader.read(crop)
+        glyph_times.append(time.perf_counter() - start)
+
+        fallbacks += reading.source == 'ocr'
+        if expected:
+            known += 1
+            agree += reading.text == expected
+
+    def summary(samples):
+        samples = sorted(samples)
+        return {
+            'mean_ms': 1000 * sum(samples) / len(samples),
+            'p95_ms': 1000 * samples[min(int(len(samples) * 0.95), len(samples) - 1)],
+        }
+
+    return {
+        'frames': len(crops),
+        'frames_with_time': known,
+        'accuracy': agree / known if known else None,
+        'fallback_rate': fallbacks / len(crops),
+        'glyph_reader': summary(glyph_times),
+        'tesseract': summary(ocr_times),
+    }
+
+
+def main(argv):
+    if len(argv) < 2:
+        print("Usage: python timer_reader.py <folder of time_region_*.png> [atlas folder]")
+        return 1
+    folder = argv[1]
+    atlas_folder = argv[2] if len(argv) > 2 else os.path.join(folder, 'timer_atlas')
+    files = sorted(f for f in os.listdir(folder) if f.startswith('time_region') and f.endswith('.png'))
+    if not files:
+        print(f"No time_region_*.png files found in {folder}")
+        return 1
+    crops = [np.asarray(Image.open(os.path.join(folder, f)).convert('RGB')) for f in files]
+    resolution = (crops[0].shape[1], crops[0].shape[0])
+    report = compare_with_tesseract(crops, atlas_folder, resolution)
+    for key, value in report.items():
+        print(f"{key}: {value}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -0,0 +1,164 @@
+"""Video export of the map frames with OpenCV's VideoWriter.
+
+Frames get the same timestamp overlay as the GIF and are encoded on a background
+thread, so a video can be written live during the session and be ready when it stops.
+Unlike the GIF, the video keeps every color and stays small for long sessions.
+"""
+
+import os
+import queue
+import logging
+import threading
+
+import cv2
+import numpy as np
+from PIL import Image
+
+from gif_export import annotate_frame
+from storage import open_frame
+
+
+VIDEO_BASENAME = 'session'
+
+# Codec name: (FourCC code, container the video is written to)
+VIDEO_CODECS = {
+    'mp4v': ('mp4v', '.mp4'),
+    'avc1': ('avc1', '.mp4'),
+    'vp80': ('VP80', '.webm'),
+    'vp09': ('VP09', '.webm'),
+    'mjpg': ('MJPG', '.avi'),
+    'xvid': ('XVID', '.avi'),
+}
+
+_STOP = object()
+
+
+def video_filename(codec):
+    """Name of a session video for a codec, e.g. session.mp4."""
+    try:
+        return VIDEO_BASENAME + VIDEO_CODECS[codec.lower()][1]
+    except KeyError:
+        raise ValueError(f"Unknown video codec: {codec}")
+
+
+class VideoEncoder:
+    """Encode annotated frames to a video file on a background thread.
+
+    The writer is opened with the size of the first frame scaled by `scale` (rounded down to
+    even dimensions, which most codecs require); later frames are resized to it. The video is
+    written to a temporary file and renamed when closed.
+    """
+
+    def __init__(self, path, codec='mp4v', fps=2.0, scale=1.0, font_size=40, maxsize=16):
+        self.path = path
+        self.codec = codec.lower()
+        self.fps = fps
+        self.scale = scale
+        self.font_size = font_size
+        root, extension = os.path.splitext(path)
+        self.temp_path = f"{root}.part{extension}"
+        self.queue = queue.Queue(maxsize=maxsize)
+        self.thread = None
+        self.writer = None
+        self.size = None
+        self.frames = 0
+        self.dropped = 0
+        self.error = None
+
+    def add_frame(self, image, label, block=True):
+        """Queue a map frame (PIL image or RGB array) and its "MM:SS" label.
+
+        When not blocking and the encoder is behind, the frame is dropped and False returned.
+        """
+        if self.error is not None:
+            raise self.error
+        if self.thread is None:
+            self.thread = threading.Thread(target=self._run, name='video-encoder', daemon=True)
+            self.thread.start()
+        try:
+            self.queue.put((image, label), block=block)
+            return True
+        except queue.Full:
+            self.dropped += 1
+            logging.warning("Video encoder is behind, dropping frame.")
+            return False
+
+    def _open(self, width, height):
+        width = max(int(width * self.scale) // 2 * 2, 2)
+        height = max(int(height * self.scale) // 2 * 2, 2)
+        fourcc = VIDEO_CODECS.get(self.codec, (self.codec, None))[0]
+        writer = cv2.VideoWriter(self.temp_path, cv2.VideoWriter_fourcc(*fourcc), self.fps, (width, height))
+        if not writer.isOpened():
+            raise RuntimeError(f"OpenCV cannot write '{self.codec}' video to {self.temp_path}")
+        self.writer = writer
+        self.size = (width, height)
+
+    def _encode(self, image, label):
+        if isinstance(image, np.ndarray):
+            image = Image.fromarray(image)
+        frame = np.asarray(annotate_frame(image, label, self.font_size))
+        if self.writer is None:
+            self._open(frame.shape[1], frame.shape[0])
+        if (frame.shape[1], frame.shape[0]) != self.size:
+            frame = cv2.resize(frame, self.size, interpolation=cv2.INTER_AREA)
+        self.writer.write(cv2.cvtColor(frame, cv2.COLOR_RGB2BGR))
+        self.frames += 1
+
+    def _run(self):
+        while True:
+            item = self.queue.get()
+            if item is _STOP:
+                break
+            if self.error is not None:
+                continue  # Drain the queue so producers never block
+            try:
+                self._encode(*item)
+            except Exception as e:
+                logging.error(f"Video encoding failed: {e}")
+                self.error = e
+
+    def close(self):
+        """Finish the video, return True if one was written."""
+        if self.thread is not None:
+            self.queue.put(_STOP)
+            self.thread.join()
+            self.thread = None
+        if self.writer is None:
+            return False
+        self.writer.release()
+        self.writer = None
+        if self.error is not None or not self.frames:
+            return False
+        os.replace(self.temp_path, self.path)
+        logging.info(f"Saved video: {self.path} ({self.frames} frames, {self.dropped} dropped)")
+        return True
+
+    def abort(self):
+        """Stop encoding and drop the unfinished video."""
+        self.error = self.error or RuntimeError("Video encoding aborted")
+        self.close()
+        if os.path.exists(self.temp_path):
+            os.remove(self.temp_path)
+
+
+def write_video(frames, video_path, codec='mp4v', fps=2.0, scale=1.0, progress=None):
+    """Write a video from a list of (source, label) pairs, decoding one frame at a time.
+
+    Returns the number of frames written.
+    """
+    if not frames:
+        return 0
+    encoder = VideoEncoder(video_path, codec, fps, scale)
+    try:
+        for i, (source, label) in enumerate(frames):
+            encoder.add_frame(open_frame(source), label)
+            if progress is not None:
+                progress(i + 1, len(frames))
+    except BaseException:
+        # Failed or cancelled by the progress callback
+        encoder.abort()
+        raise
+    written = encoder.close()
+    if encoder.error is not None:
+        raise encoder.error
+    return encoder.frames if written else 0